@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Stock, Pedido, PedidoItem
+from . import resumen
+from .models import Stock, StockArchivado, StockMovimiento, StockResumen, Pedido, PedidoItem, PedidoItemOrigen
 
 # Esto permite cargar los productos dentro del Pedido
 class PedidoItemInline(admin.TabularInline):
@@ -26,4 +27,81 @@ class StockAdmin(admin.ModelAdmin):
 
     def get_ubicacion(self, obj):
         return obj.sub_ubicacion.ubicacion.nombre
-    get_ubicacion.short_description = 'Sucursal/Almacén'
\ No newline at end of file
+    get_ubicacion.short_description = 'Sucursal/Almacén'
+
+    # Las vistas del admin ya corren en una transacción: el resumen se actualiza en la misma
+    def save_model(self, request, obj, form, change):
+        pares = set(Stock.objects.filter(pk=obj.pk).values_list('producto_id', 'sub_ubicacion_id')) if change else set()
+        super().save_model(request, obj, form, change)
+        resumen.actualizar(pares | {(obj.producto_id, obj.sub_ubicacion_id)})
+
+    def delete_model(self, request, obj):
+        par = (obj.producto_id, obj.sub_ubicacion_id)
+        super().delete_model(request, obj)
+        resumen.actualizar([par])
+
+    def delete_queryset(self, request, queryset):
+        pares = set(queryset.values_list('producto_id', 'sub_ubicacion_id').order_by())
+        super().delete_queryset(request, queryset)
+        resumen.actualizar(pares)
+
+
+@admin.register(StockMovimiento)
+class StockMovimientoAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'tipo', 'producto', 'sub_ubicacion', 'lote', 'cantidad', 'referencia_id', 'usuario')
+    list_filter = ('tipo', 'sub_ubicacion__ubicacion')
+    search_fields = ('producto__nombre', 'lote')
+
+    # El libro es de sólo inserción
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockArchivado)
+class StockArchivadoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'producto', 'sub_ubicacion', 'lote', 'fecha_ingreso', 'archivado_en')
+    list_filter = ('sub_ubicacion__ubicacion',)
+    search_fields = ('producto__nombre', 'lote')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PedidoItemOrigen)
+class PedidoItemOrigenAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'pedido_item', 'sub_ubicacion', 'lote', 'cantidad')
+    list_filter = ('sub_ubicacion__ubicacion',)
+    search_fields = ('pedido_item__producto__nombre', 'lote')
+
+    # Se escribe al aprobar el pedido
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockResumen)
+class StockResumenAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'ubicacion', 'sub_ubicacion', 'cantidad', 'lotes', 'proximo_vencimiento', 'actualizado')
+    list_filter = ('ubicacion',)
+    search_fields = ('producto__nombre',)
+
+    # Lo mantiene resumen.py; se repara con manage.py verificar_resumen_stock
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,319 @@
+"""
+Aprobación de pedidos: validación del body de aprobar, aplicación sobre el
+pedido y sus items, y aprobación en lote.
+
+La aprobación en lote bloquea primero, con un único SELECT ... FOR UPDATE
+(bloquear_lotes), todos los lotes de los pares (producto, sub-ubicación) que
+el lote de pedidos puede tocar. Después simula los pedidos en orden de id
+sobre esos lotes ya bloqueados (cada pedido aprobado consume lo suyo antes
+de validar el siguiente) y descuenta todo con una única llamada a
+descontar_fifo sobre los mismos lotes y un bulk_update. Como nadie más puede
+cambiar esos lotes hasta el commit, lo simulado es lo que se descuenta: los
+pedidos sin stock suficiente se informan individualmente y el resto se
+aprueba.
+"""
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from apps.locations.models import SubUbicacion
+
+from . import cambios
+from .models import Pedido, PedidoItem, PedidoItemOrigen, Stock
+from .planificador import agrupar_lotes, consumir, planificar
+from .services import CERO, bloquear_lotes, descontar_fifo
+
+
+class AprobacionInvalida(ValueError):
+    """El body de aprobación no es válido para el pedido."""
+
+
+def _cantidad(valor, item):
+    """Cantidad de un origen como Decimal exacto; acepta números o texto ("0.3", como responde el planificador)."""
+    try:
+        cantidad = Decimal(str(valor))
+    except InvalidOperation:
+        cantidad = None
+    if cantidad is None or not cantidad.is_finite() or cantidad <= 0:
+        raise AprobacionInvalida(f"Cantidad inválida para {item.producto.nombre}: {valor}")
+    return cantidad
+
+
+def _id(valor, campo, item):
+    """Id entero de una referencia del body; acepta también texto numérico ("12")."""
+    if isinstance(valor, bool) or not (isinstance(valor, int) or (isinstance(valor, str) and valor.isdigit())):
+        raise AprobacionInvalida(f"{campo} inválido para {item.producto.nombre}: {valor}")
+    return int(valor)
+
+
+def preparar_aprobacion(items_data, items_pedido, pedido_id):
+    """
+    Valida los items del body de aprobar contra los items del pedido
+    ({id: PedidoItem}) sin tocar stock. Devuelve un dict con las demandas de
+    stock (cada una con su item), la asignación por item y las sucursales de origen (en orden de
+    aparición). Los ids de sucursal y sub-ubicación quedan normalizados a int,
+    como los usan las claves de bloquear_lotes. Lanza AprobacionInvalida.
+    """
+    demandas = []
+    por_item = []
+    distribuidor = []
+    sucursales_origen = []
+    for item_data in items_data:
+        item = items_pedido.get(item_data['id'])
+        if item is None:
+            raise AprobacionInvalida(f"El item con id {item_data['id']} no pertenece al pedido {pedido_id}")
+        origen_tipo_item = item_data.get('origen_tipo', 'distribuidor')
+
+        if origen_tipo_item == 'sucursal':
+            origen_sucursal_id = item_data.get('origen_sucursal')
+            if not origen_sucursal_id:
+                raise AprobacionInvalida(f"El producto {item.producto.nombre} marcado como 'sucursal' no tiene sucursal de origen especificada.")
+            origen_sucursal_id = _id(origen_sucursal_id, 'origen_sucursal', item)
+            if origen_sucursal_id not in sucursales_origen:
+                sucursales_origen.append(origen_sucursal_id)
+
+            sub_ubicaciones_origen = item_data.get('sub_ubicaciones_origen', [])
+            if not sub_ubicaciones_origen:
+                raise AprobacionInvalida(f"El producto {item.producto.nombre} no tiene sub-ubicaciones de origen especificadas.")
+
+            # Validar que la suma de cantidades coincide con la cantidad pedida (en
+            # Decimal: sumar floats como 0.3 + 0.6 + 0.1 no da exacto)
+            cantidades = [_cantidad(ub['cantidad'], item) for ub in sub_ubicaciones_origen]
+            total_cantidad = sum(cantidades, CERO)
+            if total_cantidad != item.cantidad:
+                raise AprobacionInvalida(f"La cantidad total asignada para {item.producto.nombre} ({total_cantidad}) no coincide con la cantidad pedida ({item.cantidad})")
+
+            origenes = [
+                {'sub_ubicacion': _id(ub_data['sub_ubicacion'], 'sub_ubicacion', item), 'cantidad': cantidad}
+                for ub_data, cantidad in zip(sub_ubicaciones_origen, cantidades)
+            ]
+            for origen in origenes:
+                demandas.append({'item': item, 'producto': item.producto, **origen})
+            por_item.append((item, origenes))
+
+        elif origen_tipo_item == 'distribuidor':
+            distribuidor.append(item)
+
+    return {
+        'demandas': demandas,
+        'por_item': por_item,
+        'distribuidor': distribuidor,
+        'sucursales_origen': sucursales_origen,
+        'items': [items_pedido[item_data['id']] for item_data in items_data],
+    }
+
+
+def registrar_origenes(demandas, asignaciones, fecha=None):
+    """
+    Guarda en PedidoItemOrigen los lotes consumidos por cada demanda (el
+    resultado de descontar_fifo, en el mismo orden), con un solo bulk insert.
+    """
+    fecha = fecha or timezone.now()
+    PedidoItemOrigen.objects.bulk_create([
+        PedidoItemOrigen(
+            pedido_item=demanda['item'],
+            sub_ubicacion_id=consumo['sub_ubicacion_id'],
+            lote=consumo['lote'],
+            cantidad=consumo['cantidad'],
+            fecha=fecha,
+        )
+        for demanda, consumos in zip(demandas, asignaciones)
+        for consumo in consumos
+    ])
+
+
+def aplicar_aprobacion(pedido, plan):
+    """Vuelca el plan sobre el pedido y sus items, sin guardar."""
+    for item in plan['distribuidor']:
+        # No descontar stock ni registrar orígenes
+        item.sub_ubicacion_origen = None
+
+    for item, sub_ubicaciones_origen in plan['por_item']:
+        item.sub_ubicacion_origen_id = sub_ubicaciones_origen[0]['sub_ubicacion']
+
+    # Determinar el origen_tipo del pedido; en pedidos mixtos se guarda la primera sucursal origen
+    if not plan['por_item']:
+        pedido.origen_tipo = 'distribuidor'
+        pedido.origen_sucursal = None
+    else:
+        pedido.origen_tipo = 'sucursal' if not plan['distribuidor'] else 'mixto'
+        pedido.origen_sucursal_id = plan['sucursales_origen'][0]
+    pedido.estado = 'aprobado'
+
+
+def _pares_de_productos(producto_ids):
+    """Pares (producto_id, sub_ubicacion_id) con stock de los productos (los que puede usar el planificador)."""
+    if not producto_ids:
+        return set()
+    return set(
+        Stock.objects.filter(producto_id__in=producto_ids, cantidad__gt=0)
+        .values_list('producto_id', 'sub_ubicacion_id').distinct().order_by()
+    )
+
+
+def _oferta(bloqueados):
+    """
+    Arma, a partir de los lotes bloqueados, la oferta que consume la
+    simulación: la estructura de leer_lotes() y los mismos lotes por par.
+    Los dicts son copias: las instancias de Stock quedan intactas para
+    descontar_fifo.
+    """
+    sub_ids = {sub_id for _, sub_id in bloqueados}
+    subs = {
+        fila['id']: fila
+        for fila in SubUbicacion.objects.filter(id__in=sub_ids).values('id', 'nombre', 'ubicacion_id', 'ubicacion__nombre')
+    }
+    filas = [
+        {
+            'id': stock.id,
+            'producto_id': stock.producto_id,
+            'cantidad': stock.cantidad,
+            'fecha_ingreso': stock.fecha_ingreso,
+            'sub_ubicacion_id': stock.sub_ubicacion_id,
+            'sub_ubicacion__nombre': subs[stock.sub_ubicacion_id]['nombre'],
+            'sub_ubicacion__ubicacion_id': subs[stock.sub_ubicacion_id]['ubicacion_id'],
+            'sub_ubicacion__ubicacion__nombre': subs[stock.sub_ubicacion_id]['ubicacion__nombre'],
+        }
+        for lista in bloqueados.values()
+        for stock in lista
+    ]
+    lotes, nombres = agrupar_lotes(filas)
+    lotes_por_par = defaultdict(list)
+    for por_producto in lotes.values():
+        for producto_id, lista in por_producto.items():
+            for lote in lista:
+                lotes_por_par[(producto_id, lote['sub_ubicacion_id'])].append(lote)
+    return lotes, nombres, lotes_por_par
+
+
+def aprobar_en_lote(solicitudes, usuario=None):
+    """
+    Aprueba varios pedidos pendientes de una vez.
+
+    solicitudes: [{'id': <pedido_id>, 'items': [...]}] con el mismo formato de
+    items que aprobar, o {'id': <pedido_id>, 'auto': True} para usar el
+    planificador. Devuelve, en el mismo orden, [{'id', 'ok', 'origen_tipo'}]
+    o [{'id', 'ok': False, 'error'}].
+
+    Debe llamarse dentro de transaction.atomic(). Los lotes se bloquean antes
+    de simular, así que una venta concurrente sólo puede hacer fallar a los
+    pedidos que ya no alcanzan, no al lote entero.
+    """
+    resultados = {}
+    apariciones = defaultdict(int)
+    for solicitud in solicitudes:
+        apariciones[solicitud['id']] += 1
+    for pedido_id, veces in apariciones.items():
+        if veces > 1:
+            resultados[pedido_id] = {'id': pedido_id, 'ok': False, 'error': 'Pedido repetido en el lote.'}
+    ids = [pedido_id for pedido_id in apariciones if pedido_id not in resultados]
+
+    pedidos = {p.id: p for p in Pedido.objects.select_for_update().filter(id__in=ids).order_by('id')}
+    items_por_pedido = defaultdict(dict)
+    for item in PedidoItem.objects.filter(pedido_id__in=list(pedidos)).select_related('producto').order_by('id'):
+        items_por_pedido[item.pedido_id][item.id] = item
+
+    por_id = {solicitud['id']: solicitud for solicitud in solicitudes}
+    for pedido_id in ids:
+        pedido = pedidos.get(pedido_id)
+        if pedido is None:
+            resultados[pedido_id] = {'id': pedido_id, 'ok': False, 'error': 'Pedido no encontrado.'}
+        elif pedido.estado != 'pendiente':
+            resultados[pedido_id] = {'id': pedido_id, 'ok': False, 'error': 'Solo pedidos pendientes pueden ser aprobados.'}
+
+    # Validar los bodies sin tocar stock y juntar los pares que el lote puede tocar:
+    # los de los items explícitos y, para los automáticos, todos los de sus productos
+    planes = {}
+    pares = set()
+    productos_auto = set()
+    for pedido_id in sorted(pedidos):
+        if pedido_id in resultados:
+            continue
+        items_pedido = items_por_pedido[pedido_id]
+        solicitud = por_id[pedido_id]
+        if solicitud.get('auto'):
+            planes[pedido_id] = None
+            productos_auto.update(item.producto_id for item in items_pedido.values())
+            continue
+        try:
+            plan = preparar_aprobacion(solicitud.get('items', []), items_pedido, pedido_id)
+            pares.update((demanda['producto'].id, demanda['sub_ubicacion']) for demanda in plan['demandas'])
+        except (AprobacionInvalida, KeyError, TypeError) as e:
+            resultados[pedido_id] = {'id': pedido_id, 'ok': False, 'error': str(e)}
+            continue
+        planes[pedido_id] = plan
+    pares |= _pares_de_productos(productos_auto)
+
+    # Un único SELECT ... FOR UPDATE; la simulación corre sobre lo bloqueado
+    bloqueados = bloquear_lotes(sorted(pares))
+    lotes, nombres, lotes_por_par = _oferta(bloqueados)
+
+    aprobados = []
+    for pedido_id, plan in planes.items():
+        pedido = pedidos[pedido_id]
+        items_pedido = items_por_pedido[pedido_id]
+        try:
+            if plan is None:
+                items = [
+                    {'id': item.id, 'producto_id': item.producto_id,
+                     'producto__nombre': item.producto.nombre, 'cantidad': item.cantidad}
+                    for item in items_pedido.values()
+                ]
+                # El planificador sólo asigna lo disponible y lo consume de la oferta
+                plan = preparar_aprobacion(planificar(items, lotes, nombres, pedido.destino_id)['items'],
+                                           items_pedido, pedido_id)
+            else:
+                _reservar(plan['demandas'], lotes_por_par)
+        except (AprobacionInvalida, KeyError, TypeError) as e:
+            resultados[pedido_id] = {'id': pedido_id, 'ok': False, 'error': str(e)}
+            continue
+        aprobados.append((pedido, plan))
+
+    demandas = [
+        {**demanda, 'referencia_id': pedido.id}
+        for pedido, plan in aprobados
+        for demanda in plan['demandas']
+    ]
+    asignaciones = descontar_fifo(demandas, tipo='pedido_salida', usuario=usuario, lotes_bloqueados=bloqueados)
+
+    ahora = timezone.now()
+    registrar_origenes(demandas, asignaciones, fecha=ahora)
+    items_actualizados = []
+    for pedido, plan in aprobados:
+        aplicar_aprobacion(pedido, plan)
+        pedido.fecha_actualizacion = ahora
+        items_actualizados.extend(plan['items'])
+        resultados[pedido.id] = {'id': pedido.id, 'ok': True, 'origen_tipo': pedido.origen_tipo}
+    if items_actualizados:
+        PedidoItem.objects.bulk_update(items_actualizados, ['sub_ubicacion_origen'])
+    if aprobados:
+        Pedido.objects.bulk_update(
+            [pedido for pedido, _ in aprobados],
+            ['estado', 'origen_tipo', 'origen_sucursal', 'fecha_actualizacion'],
+        )
+        cambios.registrar_cambio()
+    return [resultados[solicitud['id']] for solicitud in solicitudes]
+
+
+def _reservar(demandas, lotes_por_par):
+    """
+    Valida las demandas de un pedido contra lo que queda de la oferta y, si
+    alcanza para todas, las consume. Lanza AprobacionInvalida sin consumir nada.
+    """
+    requerido = defaultdict(lambda: CERO)
+    nombres = {}
+    for demanda in demandas:
+        par = (demanda['producto'].id, demanda['sub_ubicacion'])
+        requerido[par] += demanda['cantidad']
+        nombres[par] = demanda['producto'].nombre
+    for par, cantidad in requerido.items():
+        disponible = sum((lote['cantidad'] for lote in lotes_por_par.get(par, ())), CERO)
+        if disponible < cantidad:
+            raise AprobacionInvalida(
+                f"Stock insuficiente de {nombres[par]} en la sub-ubicación {par[1]} considerando "
+                f"los demás pedidos aprobados en esta operación. Disponible: {disponible}, requerido: {cantidad}."
+            )
+    for par, cantidad in requerido.items():
+        consumir(lotes_por_par[par], cantidad)
@@ -0,0 +1,130 @@
+"""
+Compactación de Stock: mueve los lotes agotados a StockArchivado.
+
+Cada recepción de un perecedero crea un lote nuevo que las ventas dejan en
+cero, así que sin compactar la tabla Stock (y sus índices) crece sin límite.
+Los registros consolidados (lote=None) no se archivan: son uno por producto y
+sub-ubicación y se reutilizan en cada recepción.
+
+StockArchivado usa como clave primaria el id que tenía el lote en Stock (es lo
+que referencian el libro y los snapshots). Si un lote archivado se restaura a
+Stock con su id y vuelve a agotarse, el nuevo archivado reemplaza la copia
+anterior en vez de chocar con ella. Los ids no deben reutilizarse para lotes
+distintos: MySQL anterior a 8.0 recalcula el AUTO_INCREMENT al reiniciar y
+puede volver a dar los ids más altos ya archivados.
+"""
+
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import resumen
+from .models import Stock, StockArchivado
+
+TAMANO_TANDA = 1000
+DIAS_RETENCION = 30
+
+
+def lotes_archivables(dias=DIAS_RETENCION, ahora=None):
+    """Lotes con cantidad 0 sin cambios en los últimos `dias` días."""
+    corte = (ahora or timezone.now()) - timedelta(days=dias)
+    return Stock.objects.filter(cantidad=0, lote__isnull=False, ultima_actualizacion__lt=corte)
+
+
+def archivar_lotes_agotados(dias=DIAS_RETENCION, tamano_tanda=TAMANO_TANDA, ahora=None):
+    """
+    Archiva por tandas los lotes agotados. Cada tanda es una transacción corta:
+    bloquea sus filas, vuelve a verificar que sigan en cero, las copia a
+    StockArchivado (reemplazando una copia previa con el mismo id) y las borra
+    de Stock. Devuelve la cantidad archivada.
+    """
+    ahora = ahora or timezone.now()
+    candidatos = lotes_archivables(dias, ahora)
+    archivados = 0
+    ultimo_id = 0
+    while True:
+        ids = list(
+            candidatos.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:tamano_tanda]
+        )
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+
+        with transaction.atomic():
+            lotes = list(candidatos.select_for_update().filter(id__in=ids).order_by('id'))
+            # Copias anteriores de lotes restaurados y vueltos a agotar
+            StockArchivado.objects.filter(id__in=[lote.id for lote in lotes]).delete()
+            StockArchivado.objects.bulk_create([
+                StockArchivado(
+                    id=lote.id,
+                    producto_id=lote.producto_id,
+                    sub_ubicacion_id=lote.sub_ubicacion_id,
+                    cantidad=lote.cantidad,
+                    ultima_actualizacion=lote.ultima_actualizacion,
+                    fecha_ingreso=lote.fecha_ingreso,
+                    lote=lote.lote,
+                    fecha_vencimiento=lote.fecha_vencimiento,
+                    archivado_en=ahora,
+                )
+                for lote in lotes
+            ])
+            Stock.objects.filter(id__in=[lote.id for lote in lotes]).delete()
+            # Si era el último registro del par, su fila de resumen desaparece
+            resumen.actualizar((lote.producto_id, lote.sub_ubicacion_id) for lote in lotes)
+        archivados += len(lotes)
+    return archivados
+
+
+def resolver_lotes(stock_ids):
+    """
+    {stock_id: lote} buscando primero en Stock y después en StockArchivado,
+    para resolver referencias del libro de movimientos o snapshots.
+    """
+    ids = set(stock_ids)
+    lotes = Stock.objects.in_bulk(ids)
+    faltantes = ids - set(lotes)
+    if faltantes:
+        lotes.update(StockArchivado.objects.in_bulk(faltantes))
+    return lotes
+
+
+def buscar_lote(producto_id, sub_ubicacion_id, lote):
+    """Lote por su código (como lo guarda FabricacionConsumo), activo o archivado."""
+    filtro = {'producto_id': producto_id, 'sub_ubicacion_id': sub_ubicacion_id, 'lote': lote}
+    return Stock.objects.filter(**filtro).first() or StockArchivado.objects.filter(**filtro).first()
+
+
+def tamano_tabla(modelo):
+    """
+    (bytes de datos, bytes de índices) de la tabla del modelo, o None si el
+    motor no lo informa. En MySQL las estadísticas de InnoDB se refrescan con
+    ANALYZE TABLE antes de leerlas.
+    """
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(f"ANALYZE TABLE {connection.ops.quote_name(tabla)}")
+            cursor.fetchall()
+            cursor.execute(
+                "SELECT data_length, index_length FROM information_schema.TABLES "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [tabla],
+            )
+            fila = cursor.fetchone()
+            return (int(fila[0]), int(fila[1])) if fila else None
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_table_size(%s), pg_indexes_size(%s)", [tabla, tabla])
+            datos, indices = cursor.fetchone()
+            return int(datos), int(indices)
+    return None
+
+
+def optimizar_tabla(modelo):
+    """Reconstruye la tabla para devolver el espacio liberado (MySQL: OPTIMIZE TABLE)."""
+    if connection.vendor != 'mysql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"OPTIMIZE TABLE {connection.ops.quote_name(modelo._meta.db_table)}")
+        cursor.fetchall()
+    return True
@@ -0,0 +1,50 @@
+"""
+Versión de los datos para invalidar resultados cacheados (dashboard, reporte
+económico).
+
+Es un contador en el cache de Django que se incrementa después del commit de
+cada escritura que afecta los reportes: todo cambio de stock (resumen.actualizar,
+que cubre ventas, recepciones, aprobaciones y fabricaciones), los pedidos
+(Pedido.save/delete, transicionar y las aprobaciones en lote) y los rollups de
+ventas. Las claves cacheadas incluyen la versión, así que una escritura deja
+sin uso todas las entradas anteriores sin tener que conocerlas; expiran solas
+por TTL.
+
+El contador es tan confiable como el backend: cache.incr es atómico y
+compartido en Redis y Memcached; con LocMem (el default) es atómico pero por
+proceso, y con FileBasedCache o DatabaseCache es un get+set que puede perder
+incrementos concurrentes (ver CACHES en settings).
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+CLAVE = 'datos:version'
+
+
+def _inicial():
+    # Si la clave se pierde (reinicio, desalojo), no reutilizar números ya
+    # usados: el valor inicial sale del reloj
+    return int(time.time() * 1000)
+
+
+def version_actual():
+    version = cache.get(CLAVE)
+    if version is None:
+        cache.add(CLAVE, _inicial(), timeout=None)
+        version = cache.get(CLAVE)
+    return version
+
+
+def _incrementar():
+    try:
+        cache.incr(CLAVE)
+    except ValueError:
+        cache.add(CLAVE, _inicial(), timeout=None)
+
+
+def registrar_cambio():
+    """Marca los datos como modificados al confirmarse la transacción en curso (o ya, si no hay una)."""
+    transaction.on_commit(_incrementar)
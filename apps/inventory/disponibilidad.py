@@ -0,0 +1,81 @@
+"""
+Matriz de disponibilidad de stock por sucursal para uno o varios pedidos.
+
+Se resuelve con una única query agrupada (producto, ubicación) -> suma de
+cantidad sobre StockResumen, pivoteada en memoria, en lugar de un aggregate
+por sucursal × item.
+"""
+
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from apps.locations.models import Ubicacion
+
+from .models import PedidoItem, StockResumen
+
+
+def stock_por_producto_y_ubicacion(producto_ids):
+    """Devuelve {(producto_id, ubicacion_id): cantidad_total} para los productos dados."""
+    filas = (
+        StockResumen.objects.filter(producto_id__in=producto_ids)
+        .values('producto_id', 'ubicacion_id')
+        .annotate(total=Sum('cantidad'))
+        .order_by()
+    )
+    return {(fila['producto_id'], fila['ubicacion_id']): fila['total'] for fila in filas}
+
+
+def calcular_disponibilidad(pedidos):
+    """
+    Calcula, para cada pedido, qué sucursales (excepto su destino) pueden cubrir
+    sus items. Devuelve {pedido_id: [ {sucursal_id, sucursal_nombre,
+    puede_completar, productos: [...]}, ... ]}.
+
+    Cantidad de queries fija: items, ubicaciones y stock agrupado.
+    """
+    pedidos = list(pedidos)
+    destino_de = {p.id: p.destino_id for p in pedidos}
+
+    items_por_pedido = defaultdict(list)
+    items = (
+        PedidoItem.objects.filter(pedido_id__in=list(destino_de))
+        .values('pedido_id', 'producto_id', 'producto__nombre', 'cantidad')
+        .order_by('pedido_id', 'id')
+    )
+    producto_ids = set()
+    for item in items:
+        items_por_pedido[item['pedido_id']].append(item)
+        producto_ids.add(item['producto_id'])
+
+    stock = stock_por_producto_y_ubicacion(producto_ids) if producto_ids else {}
+    ubicaciones = list(Ubicacion.objects.order_by('id').values('id', 'nombre'))
+
+    resultado = {}
+    for pedido_id, destino_id in destino_de.items():
+        por_sucursal = []
+        for suc in ubicaciones:
+            if suc['id'] == destino_id:
+                continue
+            productos_info = []
+            puede_completar = True
+            for item in items_por_pedido[pedido_id]:
+                stock_total = stock.get((item['producto_id'], suc['id'])) or 0
+                suficiente = stock_total >= item['cantidad']
+                if not suficiente:
+                    puede_completar = False
+                productos_info.append({
+                    'producto_id': item['producto_id'],
+                    'producto_nombre': item['producto__nombre'],
+                    'cantidad_requerida': item['cantidad'],
+                    'cantidad_disponible': stock_total,
+                    'suficiente': suficiente
+                })
+            por_sucursal.append({
+                'sucursal_id': suc['id'],
+                'sucursal_nombre': suc['nombre'],
+                'puede_completar': puede_completar,
+                'productos': productos_info
+            })
+        resultado[pedido_id] = por_sucursal
+    return resultado
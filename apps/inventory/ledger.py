@@ -0,0 +1,183 @@
+"""
+Libro de movimientos de stock (StockMovimiento) y snapshots por lote (StockSnapshot).
+
+Cada mutación de Stock.cantidad registra su delta con registrar(), en la misma
+transacción y con un bulk insert; registrar() también aplica esos deltas al
+resumen por producto × sub-ubicación (resumen.py). tomar_snapshot() guarda la cantidad de cada
+lote al cierre de un día; stock_a_fecha() responde el stock a una fecha con el
+último snapshot anterior más el tramo corto de movimientos posteriores.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from . import resumen
+from .models import Stock, StockMovimiento, StockSnapshot
+
+BATCH = 2000
+CERO = Decimal('0.000')
+
+
+def movimiento(stock, cantidad, tipo, referencia_id=None, usuario=None, fecha=None):
+    """Arma (sin guardar) el movimiento de un delta firmado sobre un lote."""
+    return StockMovimiento(
+        stock_id=stock.id,
+        producto_id=stock.producto_id,
+        sub_ubicacion_id=stock.sub_ubicacion_id,
+        lote=stock.lote,
+        tipo=tipo,
+        cantidad=Decimal(cantidad),
+        fecha=fecha or timezone.now(),
+        referencia_id=referencia_id,
+        usuario_id=getattr(usuario, 'pk', usuario),
+    )
+
+
+def registrar(movimientos, resumir=True):
+    """
+    Inserta los movimientos con delta distinto de cero en un solo bulk_create
+    y, salvo resumir=False, aplica todos al resumen (los de delta cero, p. ej.
+    un cambio de fecha de ingreso, recalculan su par). Debe llamarse después
+    de modificar Stock.
+    """
+    if resumir:
+        resumen.aplicar_movimientos(movimientos)
+    movimientos = [m for m in movimientos if m.cantidad]
+    if movimientos:
+        StockMovimiento.objects.bulk_create(movimientos, batch_size=BATCH)
+    return len(movimientos)
+
+
+def fin_del_dia(fecha):
+    """Primer instante (aware) posterior al día dado, en la zona horaria local."""
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+
+
+def abrir_saldos():
+    """
+    Reinicia el libro: borra movimientos y snapshots, registra un saldo
+    inicial por cada lote con stock y reconstruye el resumen. Pensado para
+    datos de prueba (seed).
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        StockSnapshot.objects.all().delete()
+        StockMovimiento.objects.all().delete()
+        buffer = []
+        total = 0
+        for stock in Stock.objects.exclude(cantidad=0).only(
+            'id', 'producto_id', 'sub_ubicacion_id', 'lote', 'cantidad'
+        ).iterator(chunk_size=BATCH):
+            buffer.append(movimiento(stock, stock.cantidad, 'saldo_inicial', fecha=ahora))
+            if len(buffer) >= BATCH:
+                total += registrar(buffer, resumir=False)
+                buffer = []
+        total += registrar(buffer, resumir=False)
+        resumen.reconstruir()
+    return total
+
+
+def tomar_snapshot(fecha=None):
+    """
+    Guarda la cantidad de cada lote al cierre de `fecha` (por defecto, ayer):
+    cantidad actual menos los movimientos posteriores a ese día. Reemplaza un
+    snapshot previo de la misma fecha. Devuelve la cantidad de filas escritas.
+    """
+    fecha = fecha or timezone.localdate() - timedelta(days=1)
+    corte = fin_del_dia(fecha)
+
+    with transaction.atomic():
+        saldos = {}
+        for fila in Stock.objects.values_list('id', 'producto_id', 'sub_ubicacion_id', 'lote', 'cantidad').iterator(
+            chunk_size=BATCH
+        ):
+            saldos[fila[0]] = [fila[1], fila[2], fila[3], fila[4]]
+
+        # Lotes eliminados después del corte sólo existen en el libro
+        posteriores = (
+            StockMovimiento.objects.filter(fecha__gte=corte)
+            .values('stock_id', 'producto_id', 'sub_ubicacion_id', 'lote')
+            .annotate(delta=Sum('cantidad'))
+            .order_by()
+        )
+        for fila in posteriores:
+            saldo = saldos.setdefault(
+                fila['stock_id'], [fila['producto_id'], fila['sub_ubicacion_id'], fila['lote'], CERO]
+            )
+            saldo[3] -= fila['delta']
+
+        StockSnapshot.objects.filter(fecha=fecha).delete()
+        filas = [
+            StockSnapshot(
+                stock_id=stock_id,
+                producto_id=producto_id,
+                sub_ubicacion_id=sub_id,
+                lote=lote,
+                fecha=fecha,
+                cantidad=cantidad,
+            )
+            for stock_id, (producto_id, sub_id, lote, cantidad) in saldos.items()
+            if cantidad
+        ]
+        StockSnapshot.objects.bulk_create(filas, batch_size=BATCH)
+    return len(filas)
+
+
+def filtrar(qs, producto_id=None, sub_ubicacion_id=None, ubicacion_id=None):
+    """Filtra movimientos o snapshots por producto, sub-ubicación y/o ubicación."""
+    if producto_id is not None:
+        qs = qs.filter(producto_id=producto_id)
+    if sub_ubicacion_id is not None:
+        qs = qs.filter(sub_ubicacion_id=sub_ubicacion_id)
+    if ubicacion_id is not None:
+        qs = qs.filter(sub_ubicacion__ubicacion_id=ubicacion_id)
+    return qs
+
+
+def stock_a_fecha(fecha, producto_id=None, sub_ubicacion_id=None, ubicacion_id=None):
+    """
+    Cantidad por lote al cierre de `fecha`: último snapshot con fecha <= `fecha`
+    más los movimientos entre ese snapshot y el cierre pedido. Sin snapshot
+    previo se suma el libro completo. Devuelve una lista de dicts
+    {stock_id, producto_id, sub_ubicacion_id, lote, cantidad} con cantidad != 0.
+    """
+    filtros = {'producto_id': producto_id, 'sub_ubicacion_id': sub_ubicacion_id, 'ubicacion_id': ubicacion_id}
+    base = StockSnapshot.objects.filter(fecha__lte=fecha).aggregate(ultima=Max('fecha'))['ultima']
+
+    saldos = defaultdict(lambda: CERO)
+    claves = {}
+    movimientos = filtrar(StockMovimiento.objects.filter(fecha__lt=fin_del_dia(fecha)), **filtros)
+    if base:
+        snapshot = filtrar(StockSnapshot.objects.filter(fecha=base), **filtros).values_list(
+            'stock_id', 'producto_id', 'sub_ubicacion_id', 'lote', 'cantidad'
+        )
+        for stock_id, prod_id, sub_id, lote, cantidad in snapshot:
+            saldos[stock_id] += cantidad
+            claves[stock_id] = (prod_id, sub_id, lote)
+        movimientos = movimientos.filter(fecha__gte=fin_del_dia(base))
+
+    tramo = (
+        movimientos.values('stock_id', 'producto_id', 'sub_ubicacion_id', 'lote')
+        .annotate(delta=Sum('cantidad'))
+        .order_by()
+    )
+    for fila in tramo:
+        saldos[fila['stock_id']] += fila['delta']
+        claves[fila['stock_id']] = (fila['producto_id'], fila['sub_ubicacion_id'], fila['lote'])
+
+    return [
+        {
+            'stock_id': stock_id,
+            'producto_id': claves[stock_id][0],
+            'sub_ubicacion_id': claves[stock_id][1],
+            'lote': claves[stock_id][2],
+            'cantidad': cantidad,
+        }
+        for stock_id, cantidad in sorted(saldos.items())
+        if cantidad
+    ]
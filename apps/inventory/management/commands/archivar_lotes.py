@@ -0,0 +1,69 @@
+"""
+Archiva los lotes agotados (cantidad 0) más viejos que la ventana de retención.
+Uso: python manage.py archivar_lotes [--dias 30] [--tanda 1000] [--optimizar] [--intervalo 3600]
+
+Con --intervalo queda corriendo y repite el archivado cada N segundos.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from apps.inventory.archivo import (
+    DIAS_RETENCION, TAMANO_TANDA, archivar_lotes_agotados, optimizar_tabla, tamano_tabla,
+)
+from apps.inventory.models import Stock
+
+
+def _mb(valor):
+    return f"{valor / (1024 * 1024):.2f} MB"
+
+
+class Command(BaseCommand):
+    help = "Mueve a StockArchivado los lotes en cero sin cambios dentro de la ventana de retención."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_RETENCION, help="Días de retención de lotes agotados.")
+        parser.add_argument('--tanda', type=int, default=TAMANO_TANDA, help="Lotes por transacción.")
+        parser.add_argument('--optimizar', action='store_true',
+                            help="Reconstruir la tabla al final para devolver el espacio (MySQL).")
+        parser.add_argument('--intervalo', type=int,
+                            help="Modo programado: repetir cada N segundos hasta interrumpir.")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0 or options['tanda'] <= 0:
+            raise CommandError("--dias debe ser >= 0 y --tanda mayor a 0.")
+
+        if not options['intervalo']:
+            self._ejecutar(options)
+            return
+
+        self.stdout.write(f"Modo programado: cada {options['intervalo']} s (Ctrl+C para salir).")
+        try:
+            while True:
+                close_old_connections()
+                self._ejecutar(options)
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
+
+    def _ejecutar(self, options):
+        antes = tamano_tabla(Stock)
+        inicio = time.perf_counter()
+        archivados = archivar_lotes_agotados(dias=options['dias'], tamano_tanda=options['tanda'])
+        if archivados and options['optimizar']:
+            optimizar_tabla(Stock)
+        despues = tamano_tabla(Stock)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{archivados} lotes archivados en {time.perf_counter() - inicio:.1f} s."
+        ))
+        if antes and despues:
+            self.stdout.write(
+                f"Stock: datos {_mb(antes[0])} -> {_mb(despues[0])}, "
+                f"índices {_mb(antes[1])} -> {_mb(despues[1])} "
+                f"(recuperado {_mb(antes[0] + antes[1] - despues[0] - despues[1])})"
+            )
+        else:
+            self.stdout.write("Tamaño de tabla no disponible para este motor de base de datos.")
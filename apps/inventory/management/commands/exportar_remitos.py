@@ -0,0 +1,63 @@
+"""
+Exporta a un ZIP los remitos de los pedidos que cumplen los filtros.
+Uso: python manage.py exportar_remitos --salida remitos.zip [--desde 2026-09-01] [--hasta 2026-09-30]
+     [--destino ID] [--estado aprobado,recibido] [--procesos N]
+
+Los filtros son los del listado de pedidos (views.filtrar_pedidos). Los PDFs
+se renderizan en un pool de procesos (a lo sumo settings.REMITOS_MAX_PROCESOS)
+y el ZIP se escribe a medida que van saliendo, sin juntar todos los
+documentos en memoria.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from apps.inventory.models import Pedido
+from apps.inventory.utils import exportar_remitos_zip
+from apps.inventory.views import filtrar_pedidos
+
+# Opción del comando -> parámetro del listado de pedidos
+FILTROS = {'desde': 'fecha_desde', 'hasta': 'fecha_hasta', 'destino': 'destino', 'estado': 'estado'}
+
+
+class Command(BaseCommand):
+    help = "Genera un ZIP con los remitos de los pedidos filtrados por fecha, destino y estado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', required=True, help="Ruta del archivo ZIP a escribir.")
+        parser.add_argument('--desde', help="Fecha de creación desde (YYYY-MM-DD, inclusive).")
+        parser.add_argument('--hasta', help="Fecha de creación hasta (YYYY-MM-DD, inclusive).")
+        parser.add_argument('--destino', help="Id de la ubicación destino.")
+        parser.add_argument('--estado', help="Uno o varios estados separados por coma.")
+        parser.add_argument(
+            '--procesos', type=int,
+            help=f"Procesos de renderizado (por defecto y como máximo, REMITOS_MAX_PROCESOS={settings.REMITOS_MAX_PROCESOS}).",
+        )
+
+    def handle(self, *args, **options):
+        if options['procesos'] is not None and options['procesos'] <= 0:
+            raise CommandError("--procesos debe ser mayor a 0.")
+
+        params = {parametro: options[opcion] for opcion, parametro in FILTROS.items() if options[opcion]}
+        try:
+            pedidos = filtrar_pedidos(Pedido.objects.order_by('-fecha_creacion', '-id'), params)
+        except ValidationError as exc:
+            opciones = {parametro: opcion for opcion, parametro in FILTROS.items()}
+            raise CommandError(' '.join(
+                f"--{opciones[campo]}: {error}" for campo, error in exc.detail.items()
+            ))
+
+        total = pedidos.count()
+        if not total:
+            raise CommandError("Ningún pedido cumple los filtros.")
+
+        inicio = time.perf_counter()
+        with open(options['salida'], 'wb') as archivo:
+            for parte in exportar_remitos_zip(pedidos, procesos=options['procesos']):
+                archivo.write(parte)
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} remitos exportados a {options['salida']} en {time.perf_counter() - inicio:.1f} s."
+        ))
@@ -0,0 +1,19 @@
+"""
+Borra del storage los remitos PDF de versiones anteriores de cada pedido.
+Uso: python manage.py limpiar_remitos
+
+Pensado para correr periódicamente (cron): los requests sólo escriben la
+versión actual de cada remito y nunca borran.
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.inventory.utils import limpiar_remitos
+
+
+class Command(BaseCommand):
+    help = "Elimina los remitos guardados que ya no corresponden a la versión actual del pedido."
+
+    def handle(self, *args, **options):
+        borrados = limpiar_remitos()
+        self.stdout.write(self.style.SUCCESS(f"Remitos obsoletos borrados: {borrados}."))
@@ -9,7 +9,6 @@ from datetime import timedelta, date
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db import transaction
 
 User = get_user_model()
 
@@ -39,6 +38,11 @@ class Command(BaseCommand):
         self.stdout.write("[VENTA] Creando ventas...")
         self._create_ventas(ubicaciones, sub_ubicaciones_map, productos, users_map)
 
+        # El stock del seed se carga directo: abrir el libro con el saldo final
+        self.stdout.write("[LIBRO] Registrando saldos iniciales del libro de stock...")
+        from apps.inventory.ledger import abrir_saldos
+        abrir_saldos()
+
         self.stdout.write(self.style.SUCCESS("\nSeed completado!"))
         self._print_summary(users_map)
 
@@ -47,12 +51,14 @@ class Command(BaseCommand):
     # ─────────────────────────────────────────────────────────────────────────
 
     def _clear_data(self):
-        from apps.sales.models import VentaItem, Venta
-        from apps.inventory.models import PedidoItem, Pedido, Stock
+        from apps.sales.models import VentaItem, Venta, VentaDiaria, VentaDiariaSucursal
+        from apps.inventory.models import PedidoItem, Pedido, Stock, StockArchivado, StockMovimiento, StockSnapshot
         from apps.locations.models import SubUbicacion, Ubicacion
         from apps.products.models import Producto, Categoria
         from apps.recipes.models import Fabricacion, FabricacionConsumo, RecetaInsumo, Receta
 
+        VentaDiaria.objects.all().delete()
+        VentaDiariaSucursal.objects.all().delete()
         VentaItem.objects.all().delete()
         Venta.objects.all().delete()
         FabricacionConsumo.objects.all().delete()
@@ -61,6 +67,9 @@ class Command(BaseCommand):
         Receta.objects.all().delete()
         PedidoItem.objects.all().delete()
         Pedido.objects.all().delete()
+        StockSnapshot.objects.all().delete()
+        StockMovimiento.objects.all().delete()
+        StockArchivado.objects.all().delete()
         Stock.objects.all().delete()
         SubUbicacion.objects.all().delete()
         Ubicacion.objects.all().delete()
@@ -348,7 +357,7 @@ class Command(BaseCommand):
     # ─────────────────────────────────────────────────────────────────────────
 
     def _create_pedidos(self, ubicaciones, sub_ubicaciones_map, productos, users_map):
-        from apps.inventory.models import Pedido, PedidoItem
+        from apps.inventory.models import Pedido, PedidoItem, PedidoItemOrigen
 
         sucursales_nombres = [n for n in ubicaciones if ubicaciones[n].tipo == "sucursal"]
         admin = users_map["admin"]
@@ -406,7 +415,7 @@ class Command(BaseCommand):
                     else:
                         sub_orig = None
 
-                    PedidoItem.objects.create(
+                    item = PedidoItem.objects.create(
                         pedido=pedido,
                         producto=prod,
                         cantidad=cantidad,
@@ -414,6 +423,10 @@ class Command(BaseCommand):
                         sub_ubicacion_destino=sub_dest,
                         sub_ubicacion_origen=sub_orig,
                     )
+                    if sub_orig:
+                        PedidoItemOrigen.objects.create(
+                            pedido_item=item, sub_ubicacion=sub_orig, cantidad=cantidad, fecha=fecha
+                        )
 
                 total += 1
 
@@ -508,6 +521,10 @@ class Command(BaseCommand):
                 Venta.objects.filter(pk=venta.pk).update(total=total_venta)
                 total_ventas += 1
 
+        # Las ventas del seed se insertan directo: reconstruir el rollup diario
+        from apps.sales.rollup import reconstruir
+        reconstruir()
+
         self.stdout.write(f"   -- {total_ventas} ventas creadas, {total_items} items")
 
     # ─────────────────────────────────────────────────────────────────────────
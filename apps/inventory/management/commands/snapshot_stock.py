@@ -0,0 +1,28 @@
+"""
+Guarda el snapshot diario de stock por lote (StockSnapshot).
+Uso: python manage.py snapshot_stock [--fecha 2026-01-31]
+
+Pensado para correr una vez por día (cron), después de medianoche.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apps.inventory.ledger import tomar_snapshot
+
+
+class Command(BaseCommand):
+    help = "Guarda la cantidad de cada lote al cierre de un día a partir del libro de movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help="Día a cerrar (YYYY-MM-DD). Por defecto, ayer.")
+
+    def handle(self, *args, **options):
+        fecha = None
+        if options['fecha']:
+            fecha = parse_date(options['fecha'])
+            if fecha is None:
+                raise CommandError("--fecha debe tener formato YYYY-MM-DD.")
+
+        filas = tomar_snapshot(fecha)
+        self.stdout.write(self.style.SUCCESS(f"Snapshot guardado: {filas} lotes con stock."))
@@ -0,0 +1,43 @@
+"""
+Compara StockResumen contra la suma de los lotes de Stock.
+Uso: python manage.py verificar_resumen_stock [--reparar | --reconstruir]
+
+Sin opciones sólo informa las diferencias y termina con error si hay alguna.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory import resumen
+
+MAX_LISTADOS = 20
+
+
+class Command(BaseCommand):
+    help = "Verifica (y opcionalmente repara o reconstruye) el resumen de stock por producto × sub-ubicación."
+
+    def add_arguments(self, parser):
+        accion = parser.add_mutually_exclusive_group()
+        accion.add_argument('--reparar', action='store_true', help="Recalcular los pares con diferencias.")
+        accion.add_argument('--reconstruir', action='store_true', help="Regenerar el resumen completo.")
+
+    def handle(self, *args, **options):
+        if options['reconstruir']:
+            filas = resumen.reconstruir()
+            self.stdout.write(self.style.SUCCESS(f"Resumen reconstruido: {filas} filas."))
+            return
+
+        diferencias = resumen.verificar(reparar=options['reparar'])
+        total = sum(len(pares) for pares in diferencias.values())
+        if not total:
+            self.stdout.write(self.style.SUCCESS("El resumen coincide con Stock."))
+            return
+
+        for tipo, pares in diferencias.items():
+            if pares:
+                muestra = ', '.join(f"{producto_id}@{sub_id}" for producto_id, sub_id in pares[:MAX_LISTADOS])
+                resto = f" (+{len(pares) - MAX_LISTADOS})" if len(pares) > MAX_LISTADOS else ""
+                self.stdout.write(f"{tipo}: {len(pares)} [producto@sub_ubicacion: {muestra}{resto}]")
+        if options['reparar']:
+            self.stdout.write(self.style.SUCCESS(f"Reparados {total} pares."))
+        else:
+            raise CommandError(f"{total} pares del resumen no coinciden con Stock; correr con --reparar.")
@@ -0,0 +1,189 @@
+"""
+Generación de datos sintéticos a escala para los comandos de benchmark.
+
+Todo se inserta con bulk_create y con nombres prefijados (BENCH-) para poder
+recuperar los ids en motores que no los devuelven (MySQL).
+"""
+
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+PREFIJO = "BENCH"
+BATCH = 5000
+
+
+class RollbackBenchmark(Exception):
+    """Se lanza al final de un benchmark para descartar los datos generados."""
+
+
+def crear_catalogo(n_productos, proporcion_perecederos=0.7):
+    from apps.products.models import Categoria, Producto
+
+    categorias = list(Categoria.objects.filter(nombre__startswith=f"{PREFIJO}-CAT-"))
+    if not categorias:
+        Categoria.objects.bulk_create([Categoria(nombre=f"{PREFIJO}-CAT-{i}") for i in range(10)])
+        categorias = list(Categoria.objects.filter(nombre__startswith=f"{PREFIJO}-CAT-"))
+
+    inicio = Producto.objects.filter(sku__startswith=f"{PREFIJO}-").count()
+    productos = []
+    for i in range(inicio, inicio + n_productos):
+        perecedero = random.random() < proporcion_perecederos
+        precio = Decimal(random.randint(200, 3000))
+        productos.append(Producto(
+            nombre=f"{PREFIJO} Producto {i}",
+            categoria=random.choice(categorias),
+            tipo_conservacion=random.choice(["ambiente", "heladera", "freezer"]),
+            precio_venta=precio,
+            costo_compra=(precio * Decimal("0.65")).quantize(Decimal("0.01")),
+            sku=f"{PREFIJO}-{i}",
+            dias_caducidad=random.choice([10, 15, 30, 60, 90, 180, 365]) if perecedero else None,
+        ))
+    Producto.objects.bulk_create(productos, batch_size=BATCH)
+    return list(Producto.objects.filter(sku__startswith=f"{PREFIJO}-").order_by("id"))
+
+
+def crear_sucursales(n_sucursales, subs_por_sucursal=4):
+    from apps.locations.models import SubUbicacion, Ubicacion
+
+    inicio = Ubicacion.objects.filter(nombre__startswith=f"{PREFIJO}-SUC-").count()
+    Ubicacion.objects.bulk_create([
+        Ubicacion(nombre=f"{PREFIJO}-SUC-{i}", tipo="sucursal")
+        for i in range(inicio, inicio + n_sucursales)
+    ])
+    nuevas = list(
+        Ubicacion.objects.filter(nombre__startswith=f"{PREFIJO}-SUC-").order_by("id")[inicio:]
+    )
+    tipos = ["ambiente", "heladera", "freezer"]
+    SubUbicacion.objects.bulk_create([
+        SubUbicacion(ubicacion=ub, nombre=f"Sub {j}", tipo=tipos[j % len(tipos)])
+        for ub in nuevas
+        for j in range(subs_por_sucursal)
+    ], batch_size=BATCH)
+    return list(SubUbicacion.objects.filter(ubicacion__nombre__startswith=f"{PREFIJO}-SUC-").order_by("id"))
+
+
+def crear_lotes(productos, sub_ubicaciones, n_lotes):
+    """Crea n_lotes registros de Stock repartidos al azar; perecederos con lote y fecha de ingreso."""
+    from apps.inventory import resumen
+    from apps.inventory.models import Stock
+
+    hoy = date.today()
+    usados = set(
+        Stock.objects.filter(producto__sku__startswith=f"{PREFIJO}-", lote__isnull=True)
+        .values_list("producto_id", "sub_ubicacion_id")
+    )
+    inicio = Stock.objects.filter(lote__startswith=f"{PREFIJO}-").count()
+    buffer = []
+    creados = 0
+    i = inicio
+    while creados < n_lotes:
+        producto = random.choice(productos)
+        sub = random.choice(sub_ubicaciones)
+        cantidad = Decimal(random.randint(0, 60))
+        if producto.dias_caducidad:
+            fecha_ingreso = hoy - timedelta(days=random.randint(0, producto.dias_caducidad + 30))
+            buffer.append(Stock(
+                producto=producto,
+                sub_ubicacion=sub,
+                cantidad=cantidad,
+                fecha_ingreso=fecha_ingreso,
+                fecha_vencimiento=Stock.calcular_vencimiento(fecha_ingreso, producto.dias_caducidad),
+                lote=f"{PREFIJO}-{i}",
+            ))
+            i += 1
+        else:
+            clave = (producto.id, sub.id)
+            if clave in usados:
+                continue
+            usados.add(clave)
+            buffer.append(Stock(producto=producto, sub_ubicacion=sub, cantidad=cantidad))
+        creados += 1
+        if len(buffer) >= BATCH:
+            Stock.objects.bulk_create(buffer)
+            buffer = []
+    if buffer:
+        Stock.objects.bulk_create(buffer)
+    resumen.reconstruir()
+
+
+def crear_vendedor():
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(
+        username=f"{PREFIJO.lower()}_vendedor",
+        defaults={"rol": "admin"},
+    )
+    return user
+
+
+def crear_ventas(productos, sub_ubicaciones, n_ventas, dias_historia=90, items_por_venta=3):
+    """Inserta ventas históricas directamente (sin descontar stock) y reconstruye el rollup."""
+    from apps.sales.models import Venta, VentaItem
+    from apps.sales.rollup import reconstruir
+
+    vendedor = crear_vendedor()
+    ahora = timezone.now()
+    sucursal_de = {sub.id: sub.ubicacion_id for sub in sub_ubicaciones}
+
+    hechas = 0
+    while hechas < n_ventas:
+        tanda = min(BATCH // items_por_venta, n_ventas - hechas)
+        ventas = []
+        planes = []
+        for _ in range(tanda):
+            sub = random.choice(sub_ubicaciones)
+            items = [
+                (random.choice(productos), random.randint(1, 5))
+                for _ in range(items_por_venta)
+            ]
+            total = sum(p.precio_venta * c for p, c in items)
+            ventas.append(Venta(vendedor=vendedor, sucursal_id=sucursal_de[sub.id], total=total))
+            planes.append((sub, items, ahora - timedelta(days=random.randint(0, dias_historia))))
+
+        ultimo_id = Venta.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        Venta.objects.bulk_create(ventas)
+        ids = list(Venta.objects.filter(id__gt=ultimo_id).order_by("id").values_list("id", flat=True))
+
+        venta_items = []
+        for venta_id, (sub, items, fecha) in zip(ids, planes):
+            for producto, cantidad in items:
+                venta_items.append(VentaItem(
+                    venta_id=venta_id,
+                    producto=producto,
+                    sub_ubicacion_origen=sub,
+                    cantidad=cantidad,
+                    precio_venta_momento=producto.precio_venta,
+                ))
+        VentaItem.objects.bulk_create(venta_items, batch_size=BATCH)
+        # auto_now_add ignora la fecha al insertar: se fuerza después, como en el seed
+        Venta.objects.bulk_update(
+            [Venta(id=venta_id, fecha=fecha) for venta_id, (_, _, fecha) in zip(ids, planes)],
+            ['fecha'],
+            batch_size=1000,
+        )
+        hechas += tanda
+    reconstruir()
+
+
+def limpiar():
+    """
+    Borra todos los datos BENCH- confirmados (para benchmarks que necesitan
+    commitear, p. ej. los concurrentes, donde no sirve descartar la transacción).
+    """
+    from apps.inventory.models import StockArchivado, StockMovimiento, StockSnapshot
+    from apps.locations.models import Ubicacion
+    from apps.products.models import Categoria, Producto
+    from apps.sales.models import Venta
+
+    productos = Producto.objects.filter(sku__startswith=f"{PREFIJO}-")
+    StockMovimiento.objects.filter(producto__in=productos).delete()
+    StockSnapshot.objects.filter(producto__in=productos).delete()
+    StockArchivado.objects.filter(producto__in=productos).delete()
+    Venta.objects.filter(sucursal__nombre__startswith=f"{PREFIJO}-").delete()
+    productos.delete()
+    Ubicacion.objects.filter(nombre__startswith=f"{PREFIJO}-").delete()
+    Categoria.objects.filter(nombre__startswith=f"{PREFIJO}-").delete()
+    get_user_model().objects.filter(username=f"{PREFIJO.lower()}_vendedor").delete()
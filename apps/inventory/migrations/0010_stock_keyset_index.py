@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_alter_pedido_origen_tipo'),
+        ('locations', '0001_initial'),
+        ('products', '0003_producto_es_fabricable'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['sub_ubicacion', 'producto', 'id'], name='stock_sub_prod_id_idx'),
+        ),
+    ]
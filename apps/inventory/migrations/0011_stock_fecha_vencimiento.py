@@ -0,0 +1,41 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:41
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def calcular_fecha_vencimiento(apps, schema_editor):
+    Producto = apps.get_model('products', 'Producto')
+    Stock = apps.get_model('inventory', 'Stock')
+
+    for producto in Producto.objects.filter(dias_caducidad__isnull=False).only('id', 'dias_caducidad'):
+        fechas = (
+            Stock.objects.filter(producto=producto, fecha_ingreso__isnull=False)
+            .values_list('fecha_ingreso', flat=True).distinct().order_by()
+        )
+        for fecha in fechas:
+            Stock.objects.filter(producto=producto, fecha_ingreso=fecha).update(
+                fecha_vencimiento=fecha + timedelta(days=producto.dias_caducidad)
+            )
+
+
+def noop_reverse(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_stock_keyset_index'),
+        ('products', '0003_producto_es_fabricable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='fecha_vencimiento',
+            field=models.DateField(blank=True, db_index=True, editable=False, help_text='fecha_ingreso + dias_caducidad del producto (se mantiene al guardar)', null=True),
+        ),
+        migrations.RunPython(calcular_fecha_vencimiento, noop_reverse),
+    ]
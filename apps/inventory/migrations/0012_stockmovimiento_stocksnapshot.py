@@ -0,0 +1,79 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def registrar_saldos_iniciales(apps, schema_editor):
+    """Abre el libro con un movimiento 'saldo_inicial' por cada lote con stock."""
+    Stock = apps.get_model('inventory', 'Stock')
+    StockMovimiento = apps.get_model('inventory', 'StockMovimiento')
+
+    ahora = django.utils.timezone.now()
+    buffer = []
+    for stock in Stock.objects.exclude(cantidad=0).iterator(chunk_size=2000):
+        buffer.append(StockMovimiento(
+            stock_id=stock.id,
+            producto_id=stock.producto_id,
+            sub_ubicacion_id=stock.sub_ubicacion_id,
+            lote=stock.lote,
+            tipo='saldo_inicial',
+            cantidad=stock.cantidad,
+            fecha=ahora,
+        ))
+        if len(buffer) >= 2000:
+            StockMovimiento.objects.bulk_create(buffer)
+            buffer = []
+    StockMovimiento.objects.bulk_create(buffer)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_stock_fecha_vencimiento'),
+        ('locations', '0001_initial'),
+        ('products', '0003_producto_es_fabricable'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(blank=True, max_length=100, null=True)),
+                ('tipo', models.CharField(choices=[('saldo_inicial', 'Saldo inicial'), ('venta', 'Venta'), ('pedido_salida', 'Salida por pedido'), ('pedido_ingreso', 'Ingreso por pedido'), ('fabricacion_consumo', 'Consumo de fabricación'), ('fabricacion_alta', 'Alta por fabricación'), ('ajuste', 'Ajuste manual')], max_length=30)),
+                ('cantidad', models.DecimalField(decimal_places=3, help_text='Delta firmado (negativo = salida)', max_digits=12)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('referencia_id', models.PositiveIntegerField(blank=True, help_text='Id de la venta, pedido o fabricación que originó el movimiento', null=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='products.producto')),
+                ('stock', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='movimientos', to='inventory.stock')),
+                ('sub_ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='locations.sububicacion')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Movimientos de stock',
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='stockmov_prod_fecha_idx'), models.Index(fields=['stock', 'fecha'], name='stockmov_stock_fecha_idx'), models.Index(fields=['fecha'], name='stockmov_fecha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(blank=True, max_length=100, null=True)),
+                ('fecha', models.DateField()),
+                ('cantidad', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_stock', to='products.producto')),
+                ('stock', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='snapshots', to='inventory.stock')),
+                ('sub_ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_stock', to='locations.sububicacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Snapshots de stock',
+                'indexes': [models.Index(fields=['fecha', 'producto'], name='stocksnap_fecha_prod_idx')],
+                'unique_together': {('stock', 'fecha')},
+            },
+        ),
+        migrations.RunPython(registrar_saldos_iniciales, migrations.RunPython.noop),
+    ]
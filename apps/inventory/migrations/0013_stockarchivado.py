@@ -0,0 +1,36 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_stockmovimiento_stocksnapshot'),
+        ('locations', '0001_initial'),
+        ('products', '0003_producto_es_fabricable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockArchivado',
+            fields=[
+                ('id', models.BigIntegerField(help_text='Id original del registro de Stock', primary_key=True, serialize=False)),
+                ('cantidad', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=12)),
+                ('ultima_actualizacion', models.DateTimeField()),
+                ('fecha_ingreso', models.DateField(blank=True, null=True)),
+                ('lote', models.CharField(blank=True, max_length=100, null=True)),
+                ('fecha_vencimiento', models.DateField(blank=True, null=True)),
+                ('archivado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks_archivados', to='products.producto')),
+                ('sub_ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks_archivados', to='locations.sububicacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Stocks archivados',
+                'indexes': [models.Index(fields=['producto', 'sub_ubicacion', 'lote'], name='stockarch_prod_sub_lote_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_stockarchivado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaLote',
+            fields=[
+                ('prefijo', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('ultimo', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+TANDA = 2000
+
+
+def copiar_detalle_json(apps, schema_editor):
+    """
+    Pasa sub_ubicaciones_origen_detalle a PedidoItemOrigen, una fila por
+    sub-ubicación. El JSON no guardaba el lote, así que queda en null; la
+    fecha de aprobación se aproxima con la última actualización del pedido.
+    Los items viejos con sólo sub_ubicacion_origen cargado se copian como
+    una fila por la cantidad total del item.
+    """
+    PedidoItem = apps.get_model('inventory', 'PedidoItem')
+    PedidoItemOrigen = apps.get_model('inventory', 'PedidoItemOrigen')
+    SubUbicacion = apps.get_model('locations', 'SubUbicacion')
+
+    subs_existentes = set(SubUbicacion.objects.values_list('id', flat=True))
+    items = (
+        PedidoItem.objects.filter(pedido__estado__in=['aprobado', 'recibido'])
+        .filter(models.Q(sub_ubicaciones_origen_detalle__isnull=False) | models.Q(sub_ubicacion_origen__isnull=False))
+        .values_list('id', 'cantidad', 'sub_ubicaciones_origen_detalle', 'sub_ubicacion_origen_id',
+                     'pedido__fecha_actualizacion')
+        .order_by('id')
+    )
+    buffer = []
+    for item_id, cantidad, detalle, sub_origen_id, fecha in items.iterator(chunk_size=TANDA):
+        partes = [
+            (parte.get('sub_ubicacion_id'), parte.get('cantidad'))
+            for parte in (detalle or [])
+            if isinstance(parte, dict)
+        ]
+        if not partes and sub_origen_id:
+            partes = [(sub_origen_id, cantidad)]
+        for sub_id, parte_cantidad in partes:
+            if sub_id not in subs_existentes or parte_cantidad is None:
+                continue
+            buffer.append(PedidoItemOrigen(
+                pedido_item_id=item_id,
+                sub_ubicacion_id=sub_id,
+                lote=None,
+                cantidad=Decimal(str(parte_cantidad)),
+                fecha=fecha,
+            ))
+        if len(buffer) >= TANDA:
+            PedidoItemOrigen.objects.bulk_create(buffer)
+            buffer = []
+    PedidoItemOrigen.objects.bulk_create(buffer)
+
+
+def restaurar_detalle_json(apps, schema_editor):
+    """Reconstruye el JSON (sin lote) a partir de las filas de PedidoItemOrigen."""
+    PedidoItem = apps.get_model('inventory', 'PedidoItem')
+    PedidoItemOrigen = apps.get_model('inventory', 'PedidoItemOrigen')
+
+    detalle = {}
+    filas = (
+        PedidoItemOrigen.objects.values('pedido_item_id', 'sub_ubicacion_id', 'sub_ubicacion__nombre')
+        .annotate(total=models.Sum('cantidad'))
+        .order_by('pedido_item_id', 'sub_ubicacion_id')
+    )
+    for fila in filas:
+        detalle.setdefault(fila['pedido_item_id'], []).append({
+            'sub_ubicacion_id': fila['sub_ubicacion_id'],
+            'sub_ubicacion_nombre': fila['sub_ubicacion__nombre'],
+            'cantidad': float(fila['total']),
+        })
+    items = list(PedidoItem.objects.filter(id__in=list(detalle)))
+    for item in items:
+        item.sub_ubicaciones_origen_detalle = detalle[item.id]
+    PedidoItem.objects.bulk_update(items, ['sub_ubicaciones_origen_detalle'], batch_size=TANDA)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_pedido_indexes'),
+        ('locations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoItemOrigen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(blank=True, max_length=100, null=True)),
+                ('cantidad', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now, help_text='Momento de la aprobación')),
+                ('pedido_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='origenes', to='inventory.pedidoitem')),
+                ('sub_ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pedido_items_origenes', to='locations.sububicacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Orígenes de items de pedido',
+                'indexes': [models.Index(fields=['fecha'], name='pedorigen_fecha_idx'), models.Index(fields=['sub_ubicacion', 'fecha'], name='pedorigen_sub_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(copiar_detalle_json, restaurar_detalle_json),
+        migrations.RemoveField(
+            model_name='pedidoitem',
+            name='sub_ubicaciones_origen_detalle',
+        ),
+    ]
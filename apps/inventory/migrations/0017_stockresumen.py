@@ -0,0 +1,72 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+TANDA = 2000
+
+
+def poblar_resumen(apps, schema_editor):
+    """Calcula el resumen inicial desde Stock con una query agrupada."""
+    Stock = apps.get_model('inventory', 'Stock')
+    StockResumen = apps.get_model('inventory', 'StockResumen')
+
+    filas = (
+        Stock.objects.values('producto_id', 'sub_ubicacion_id', 'sub_ubicacion__ubicacion_id')
+        .annotate(
+            total=Sum('cantidad'),
+            con_stock=Count('id', filter=Q(cantidad__gt=0)),
+            proximo=Min('fecha_vencimiento', filter=Q(cantidad__gt=0)),
+        )
+        .order_by()
+    )
+    ahora = django.utils.timezone.now()
+    StockResumen.objects.bulk_create(
+        [
+            StockResumen(
+                producto_id=fila['producto_id'],
+                sub_ubicacion_id=fila['sub_ubicacion_id'],
+                ubicacion_id=fila['sub_ubicacion__ubicacion_id'],
+                cantidad=fila['total'],
+                lotes=fila['con_stock'],
+                proximo_vencimiento=fila['proximo'],
+                actualizado=ahora,
+            )
+            for fila in filas
+        ],
+        batch_size=TANDA,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_pedidoitemorigen'),
+        ('locations', '0001_initial'),
+        ('products', '0003_producto_es_fabricable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockResumen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('lotes', models.PositiveIntegerField(default=0, help_text='Lotes con cantidad > 0')),
+                ('proximo_vencimiento', models.DateField(blank=True, help_text='Vencimiento más cercano entre los lotes con cantidad > 0', null=True)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_stock', to='products.producto')),
+                ('sub_ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_stock', to='locations.sububicacion')),
+                ('ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_stock', to='locations.ubicacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Resúmenes de stock',
+                'indexes': [models.Index(fields=['ubicacion', 'producto', 'sub_ubicacion'], name='stockres_ubic_prod_sub_idx')],
+                'unique_together': {('producto', 'sub_ubicacion')},
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
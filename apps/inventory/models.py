@@ -1,9 +1,10 @@
 from django.db import models, transaction
+from django.utils import timezone
 from apps.products.models import Producto
 from apps.locations.models import SubUbicacion, Ubicacion
+from . import cambios
 from core import settings
-from datetime import timedelta
-import json
+from datetime import date, timedelta
 from decimal import Decimal
 
 class Stock(models.Model):
@@ -22,24 +23,84 @@ class Stock(models.Model):
         blank=True,
         help_text="Identificador del lote (puede ser generado automáticamente)"
     )
+    fecha_vencimiento = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="fecha_ingreso + dias_caducidad del producto (se mantiene al guardar)"
+    )
 
     class Meta:
         # Ahora permitimos múltiples registros del mismo producto en la misma sub_ubicación
         # diferenciados por lote
         unique_together = ('producto', 'sub_ubicacion', 'lote')
+        indexes = [
+            # Clave de la paginación por cursor del listado de stock
+            models.Index(fields=['sub_ubicacion', 'producto', 'id'], name='stock_sub_prod_id_idx'),
+        ]
         verbose_name_plural = "Stocks"
 
     def __str__(self):
         lote_info = f" - Lote: {self.lote}" if self.lote else ""
         return f"{self.producto.nombre} - {self.sub_ubicacion.nombre}: {self.cantidad}{lote_info}"
     
-    @property
-    def fecha_vencimiento(self):
-        """Calcula la fecha de vencimiento basada en fecha_ingreso y dias_caducidad del producto"""
-        if self.fecha_ingreso and self.producto.dias_caducidad:
-            return self.fecha_ingreso + timedelta(days=self.producto.dias_caducidad)
+    @staticmethod
+    def calcular_vencimiento(fecha_ingreso, dias_caducidad):
+        """Fecha de vencimiento a partir de la fecha de ingreso y los días de caducidad del producto"""
+        if fecha_ingreso and dias_caducidad:
+            return fecha_ingreso + timedelta(days=dias_caducidad)
         return None
-    
+
+    @classmethod
+    def recalcular_vencimientos(cls, producto):
+        """
+        Recalcula en bloque fecha_vencimiento de todos los lotes de un producto
+        (p. ej. cuando cambia su dias_caducidad). Un solo UPDATE con un CASE por
+        cada fecha de ingreso distinta, en tandas.
+        """
+        from .resumen import actualizar
+
+        lotes = cls.objects.filter(producto=producto)
+        with transaction.atomic():
+            if producto.dias_caducidad:
+                actualizados = cls._recalcular_fechas(lotes, producto.dias_caducidad)
+            else:
+                actualizados = lotes.exclude(fecha_vencimiento=None).update(fecha_vencimiento=None)
+            # El próximo vencimiento del resumen depende de las fechas recién cambiadas
+            actualizar(lotes.values_list('producto_id', 'sub_ubicacion_id').distinct().order_by())
+        return actualizados
+
+    @classmethod
+    def _recalcular_fechas(cls, lotes, dias_caducidad):
+        fechas = list(
+            lotes.exclude(fecha_ingreso=None).values_list('fecha_ingreso', flat=True).distinct().order_by()
+        )
+        actualizados = 0
+        for i in range(0, len(fechas), 500):
+            tanda = fechas[i:i + 500]
+            actualizados += lotes.filter(fecha_ingreso__in=tanda).update(
+                fecha_vencimiento=models.Case(
+                    *[
+                        models.When(
+                            fecha_ingreso=fecha,
+                            then=models.Value(cls.calcular_vencimiento(fecha, dias_caducidad)),
+                        )
+                        for fecha in tanda
+                    ],
+                    output_field=models.DateField(),
+                )
+            )
+        return actualizados
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'fecha_ingreso' in update_fields:
+            self.fecha_vencimiento = self.calcular_vencimiento(self.fecha_ingreso, self.producto.dias_caducidad)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'fecha_vencimiento'}
+        super().save(*args, **kwargs)
+
     @property
     def dias_para_vencer(self):
         """Calcula cuántos días faltan para que venza"""
@@ -49,6 +110,148 @@ class Stock(models.Model):
             return delta.days
         return None
     
+class StockArchivado(models.Model):
+    """
+    Lotes agotados retirados de Stock por `manage.py archivar_lotes`.
+    Conservan el id original, así los movimientos, snapshots y consumos de
+    fabricación que los referencian siguen resolviéndose. Un lote restaurado a
+    Stock y archivado otra vez reemplaza su fila (ver archivo.py).
+    """
+    id = models.BigIntegerField(primary_key=True, help_text="Id original del registro de Stock")
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='stocks_archivados')
+    sub_ubicacion = models.ForeignKey(SubUbicacion, on_delete=models.CASCADE, related_name='stocks_archivados')
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3, default=Decimal('0.000'))
+    ultima_actualizacion = models.DateTimeField()
+    fecha_ingreso = models.DateField(null=True, blank=True)
+    lote = models.CharField(max_length=100, null=True, blank=True)
+    fecha_vencimiento = models.DateField(null=True, blank=True)
+    archivado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['producto', 'sub_ubicacion', 'lote'], name='stockarch_prod_sub_lote_idx'),
+        ]
+        verbose_name_plural = "Stocks archivados"
+
+    def __str__(self):
+        return f"{self.producto_id} - {self.sub_ubicacion_id}: lote {self.lote} (archivado)"
+
+
+class StockResumen(models.Model):
+    """
+    Totales de Stock por producto × sub-ubicación, mantenidos en la misma
+    transacción que cada cambio de stock (ver resumen.py). Hay una fila por
+    par con al menos un registro en Stock; la ubicación se copia para leer
+    por sucursal sin join.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='resumenes_stock')
+    sub_ubicacion = models.ForeignKey(SubUbicacion, on_delete=models.CASCADE, related_name='resumenes_stock')
+    ubicacion = models.ForeignKey(Ubicacion, on_delete=models.CASCADE, related_name='resumenes_stock')
+    cantidad = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    lotes = models.PositiveIntegerField(default=0, help_text="Lotes con cantidad > 0")
+    proximo_vencimiento = models.DateField(
+        null=True, blank=True, help_text="Vencimiento más cercano entre los lotes con cantidad > 0"
+    )
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('producto', 'sub_ubicacion')
+        indexes = [
+            # Lecturas por sucursal (disponibilidad, pantalla de stock) y paginación por cursor
+            models.Index(fields=['ubicacion', 'producto', 'sub_ubicacion'], name='stockres_ubic_prod_sub_idx'),
+        ]
+        verbose_name_plural = "Resúmenes de stock"
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.sub_ubicacion_id}: {self.cantidad} ({self.lotes} lotes)"
+
+
+class StockMovimiento(models.Model):
+    """
+    Libro de movimientos de stock (sólo inserciones). Cada cambio de
+    Stock.cantidad deja una fila con el delta firmado; la suma de los
+    movimientos de un lote es su cantidad actual.
+    """
+    TIPOS = (
+        ('saldo_inicial', 'Saldo inicial'),
+        ('venta', 'Venta'),
+        ('pedido_salida', 'Salida por pedido'),
+        ('pedido_ingreso', 'Ingreso por pedido'),
+        ('fabricacion_consumo', 'Consumo de fabricación'),
+        ('fabricacion_alta', 'Alta por fabricación'),
+        ('ajuste', 'Ajuste manual'),
+    )
+
+    # Sin constraint: el historial se conserva aunque el lote se elimine
+    stock = models.ForeignKey(
+        Stock, on_delete=models.DO_NOTHING, db_constraint=False, related_name='movimientos'
+    )
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='movimientos_stock')
+    sub_ubicacion = models.ForeignKey(SubUbicacion, on_delete=models.CASCADE, related_name='movimientos_stock')
+    lote = models.CharField(max_length=100, null=True, blank=True)
+    tipo = models.CharField(max_length=30, choices=TIPOS)
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3, help_text="Delta firmado (negativo = salida)")
+    fecha = models.DateTimeField(default=timezone.now)
+    referencia_id = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Id de la venta, pedido o fabricación que originó el movimiento"
+    )
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='movimientos_stock'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='stockmov_prod_fecha_idx'),
+            models.Index(fields=['stock', 'fecha'], name='stockmov_stock_fecha_idx'),
+            models.Index(fields=['fecha'], name='stockmov_fecha_idx'),
+        ]
+        verbose_name_plural = "Movimientos de stock"
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad} - {self.producto_id} ({self.fecha:%d/%m/%Y})"
+
+
+class StockSnapshot(models.Model):
+    """
+    Cantidad de cada lote al cierre de un día. El stock a una fecha se obtiene
+    con el último snapshot anterior más los movimientos posteriores.
+    Sólo se guardan los lotes con cantidad distinta de cero.
+    """
+    stock = models.ForeignKey(
+        Stock, on_delete=models.DO_NOTHING, db_constraint=False, related_name='snapshots'
+    )
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='snapshots_stock')
+    sub_ubicacion = models.ForeignKey(SubUbicacion, on_delete=models.CASCADE, related_name='snapshots_stock')
+    lote = models.CharField(max_length=100, null=True, blank=True)
+    fecha = models.DateField()
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3)
+
+    class Meta:
+        unique_together = ('stock', 'fecha')
+        indexes = [
+            models.Index(fields=['fecha', 'producto'], name='stocksnap_fecha_prod_idx'),
+        ]
+        verbose_name_plural = "Snapshots de stock"
+
+    def __str__(self):
+        return f"{self.producto_id} @ {self.sub_ubicacion_id} {self.fecha}: {self.cantidad}"
+
+
+class SecuenciaLote(models.Model):
+    """
+    Contador por prefijo para generar códigos de lote sin colisiones
+    (ver services.asignar_codigos_lote).
+    """
+    prefijo = models.CharField(max_length=20, primary_key=True)
+    ultimo = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefijo}: {self.ultimo}"
+
+
 class Pedido(models.Model):
     ESTADOS = (
         ('borrador', 'Borrador'),
@@ -75,60 +278,144 @@ class Pedido(models.Model):
     origen_tipo = models.CharField(max_length=20, choices=TIPO_ORIGEN, default='distribuidor', help_text="Origen del stock para este pedido")
     origen_sucursal = models.ForeignKey(Ubicacion, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos_origen', help_text="Sucursal/almacén de origen si origen_tipo='sucursal'")
 
-    def marcar_como_recibido(self):
+    class Meta:
+        indexes = [
+            # Listado de pedidos: filtros por estado o destino, orden por fecha
+            models.Index(fields=['estado', 'fecha_creacion'], name='pedido_estado_fecha_idx'),
+            models.Index(fields=['destino', 'fecha_creacion'], name='pedido_destino_fecha_idx'),
+            models.Index(fields=['fecha_creacion'], name='pedido_fecha_idx'),
+        ]
+
+    # Estado actual -> estados a los que puede pasar
+    TRANSICIONES = {
+        'borrador': ('pendiente',),
+        'pendiente': ('aprobado', 'rechazado'),
+        'aprobado': ('recibido',),
+    }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        cambios.registrar_cambio()
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        cambios.registrar_cambio()
+        return resultado
+
+    def transicionar(self, desde, hacia):
+        """
+        Pasa el pedido de `desde` a `hacia` con un único UPDATE condicional
+        (WHERE id = ... AND estado = desde). Si dos requests compiten, sólo el
+        que actualiza la fila gana; el otro recibe False y no debe seguir.
+        Dentro de una transacción, la fila queda bloqueada hasta el commit.
+        """
+        if hacia not in self.TRANSICIONES.get(desde, ()):
+            raise ValueError(f"Transición de estado no permitida: {desde} -> {hacia}.")
+        ahora = timezone.now()
+        actualizadas = Pedido.objects.filter(id=self.id, estado=desde).update(
+            estado=hacia, fecha_actualizacion=ahora
+        )
+        if actualizadas:
+            self.estado = hacia
+            self.fecha_actualizacion = ahora
+            cambios.registrar_cambio()
+        return actualizadas == 1
+
+    def marcar_como_recibido(self, usuario=None, destinos=None):
         """
         Lógica para pasar de Aprobado a Recibido y sumar stock.
+
+        destinos: {item_id: sub_ubicacion_destino_id} opcional, se asigna
+        después de ganar la transición de estado y antes de sumar stock.
+
+        Se resuelve por lotes: los perecederos generan lotes nuevos con un único
+        bulk_create (códigos de asignar_codigos_lote) y los consolidados
+        (lote=None) se bloquean con una sola query y se suman con bulk_update.
         """
-        if self.estado != 'aprobado':
-            raise Exception("Solo se pueden recibir pedidos que estén en estado Aprobado.")
+        from .ledger import movimiento, registrar
+        from .services import asignar_codigos_lote
 
         with transaction.atomic():
-            for item in self.items.all():
-                if not item.sub_ubicacion_destino:
+            if not self.transicionar('aprobado', 'recibido'):
+                raise Exception("Solo se pueden recibir pedidos que estén en estado Aprobado.")
+
+            items = list(self.items.select_related('producto').order_by('id'))
+            if destinos:
+                por_id = {item.id: item for item in items}
+                for item_id, sub_id in destinos.items():
+                    if item_id not in por_id:
+                        raise Exception(f"El item con id {item_id} no pertenece al pedido {self.id}")
+                    por_id[item_id].sub_ubicacion_destino_id = sub_id
+                PedidoItem.objects.bulk_update([por_id[item_id] for item_id in destinos], ['sub_ubicacion_destino'])
+            for item in items:
+                if not item.sub_ubicacion_destino_id:
                     raise Exception(f"El producto {item.producto.nombre} no tiene una sub-ubicación asignada.")
-                
-                # Determinar si debemos crear un nuevo lote
-                producto = item.producto
-                
-                if producto.dias_caducidad:
-                    # Productos con caducidad: crear nuevo lote con fecha de hoy
-                    from datetime import date
-                    import time
-                    import random
-                    
-                    fecha_hoy = date.today()
-                    timestamp = int(time.time() * 1000)
-                    random_suffix = random.randint(1000, 9999)
-                    nuevo_lote = f"LOTE-{timestamp}-{random_suffix}"
-                    
-                    # Crear o actualizar el stock con el nuevo lote
-                    stock_existente, created = Stock.objects.get_or_create(
-                        producto=producto,
-                        sub_ubicacion=item.sub_ubicacion_destino,
-                        lote=nuevo_lote,
-                        defaults={
-                            'cantidad': 0,
-                            'fecha_ingreso': fecha_hoy
-                        }
-                    )
-                    
-                    if not created and not stock_existente.fecha_ingreso:
-                        stock_existente.fecha_ingreso = fecha_hoy
-                    
-                else:
-                    # Productos sin caducidad: consolidar en un único registro
-                    stock_existente, created = Stock.objects.get_or_create(
-                        producto=producto,
-                        sub_ubicacion=item.sub_ubicacion_destino,
-                        lote=None,
-                        defaults={'cantidad': 0}
+
+            fecha_hoy = date.today()
+            perecederos = [item for item in items if item.producto.dias_caducidad]
+            consolidados = {}
+            for item in items:
+                if not item.producto.dias_caducidad:
+                    clave = (item.producto_id, item.sub_ubicacion_destino_id)
+                    consolidados[clave] = consolidados.get(clave, 0) + item.cantidad
+
+            # Productos con caducidad: un lote nuevo por item, con fecha de hoy
+            nuevos_lotes = []
+            if perecederos:
+                codigos = asignar_codigos_lote('LOTE', len(perecederos))
+                nuevos_lotes = [
+                    Stock(
+                        producto=item.producto,
+                        sub_ubicacion_id=item.sub_ubicacion_destino_id,
+                        lote=codigo,
+                        cantidad=item.cantidad,
+                        fecha_ingreso=fecha_hoy,
+                        fecha_vencimiento=Stock.calcular_vencimiento(fecha_hoy, item.producto.dias_caducidad),
                     )
+                    for item, codigo in zip(perecederos, codigos)
+                ]
+                Stock.objects.bulk_create(nuevos_lotes)
+                # Releer por código: MySQL no devuelve los ids de bulk_create
+                nuevos_lotes = list(Stock.objects.filter(lote__in=codigos))
 
-                stock_existente.cantidad += item.cantidad
-                stock_existente.save()
+            # Productos sin caducidad: consolidar en un único registro por sub-ubicación
+            actualizados = []
+            if consolidados:
+                filtro = models.Q()
+                for producto_id, sub_id in consolidados:
+                    filtro |= models.Q(producto_id=producto_id, sub_ubicacion_id=sub_id)
+                existentes = {
+                    (stock.producto_id, stock.sub_ubicacion_id): stock
+                    for stock in Stock.objects.select_for_update().filter(filtro, lote=None).order_by('id')
+                }
+                ahora = timezone.now()
+                faltantes = []
+                for clave, cantidad in consolidados.items():
+                    stock = existentes.get(clave)
+                    if stock:
+                        stock.cantidad += cantidad
+                        stock.ultima_actualizacion = ahora
+                        actualizados.append(stock)
+                    else:
+                        faltantes.append(Stock(
+                            producto_id=clave[0], sub_ubicacion_id=clave[1], lote=None, cantidad=cantidad
+                        ))
+                if actualizados:
+                    Stock.objects.bulk_update(actualizados, ['cantidad', 'ultima_actualizacion'])
+                if faltantes:
+                    Stock.objects.bulk_create(faltantes)
+                    filtro_faltantes = models.Q()
+                    for stock in faltantes:
+                        filtro_faltantes |= models.Q(producto_id=stock.producto_id, sub_ubicacion_id=stock.sub_ubicacion_id)
+                    actualizados += list(Stock.objects.filter(filtro_faltantes, lote=None))
 
-            self.estado = 'recibido'
-            self.save()
+            registrar(
+                [movimiento(stock, stock.cantidad, 'pedido_ingreso', referencia_id=self.id, usuario=usuario)
+                 for stock in nuevos_lotes]
+                + [movimiento(stock, consolidados[(stock.producto_id, stock.sub_ubicacion_id)], 'pedido_ingreso',
+                              referencia_id=self.id, usuario=usuario)
+                   for stock in actualizados]
+            )
 
     def __str__(self):
         return f"Pedido {self.id} - {self.destino.nombre} ({self.get_estado_display()})"
@@ -158,23 +445,39 @@ class PedidoItem(models.Model):
         related_name='pedido_items_origen',
         help_text="De donde se tomó el producto en el almacén del admin (campo legacy)"
     )
-    
-    # Múltiples sub-ubicaciones origen (cuando se distribuye entre varias)
-    sub_ubicaciones_origen_detalle = models.JSONField(
-        null=True,
-        blank=True,
-        help_text="Array de {sub_ubicacion_id, cantidad} cuando el stock se toma de múltiples sub-ubicaciones"
-    )
 
     @property
     def es_de_distribuidor(self):
-        """Retorna True si este item proviene de distribuidor (sub_ubicaciones_origen_detalle vacío)"""
-        return not self.sub_ubicaciones_origen_detalle
+        """Retorna True si este item proviene de distribuidor (sin orígenes registrados)"""
+        return not self.origenes.all()
 
     @property
     def es_de_sucursal(self):
-        """Retorna True si este item proviene de sucursal (sub_ubicaciones_origen_detalle con datos)"""
-        return bool(self.sub_ubicaciones_origen_detalle)
+        """Retorna True si este item proviene de sucursal (con orígenes registrados)"""
+        return bool(self.origenes.all())
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto.nombre} (Pedido {self.pedido.id})"
+
+
+class PedidoItemOrigen(models.Model):
+    """
+    De qué sub-ubicación y lote salió cada parte de un item abastecido desde
+    una sucursal: una fila por lote consumido al aprobar. Permite agregar las
+    transferencias entre sucursales directamente en la base.
+    """
+    pedido_item = models.ForeignKey(PedidoItem, on_delete=models.CASCADE, related_name='origenes')
+    sub_ubicacion = models.ForeignKey(SubUbicacion, on_delete=models.CASCADE, related_name='pedido_items_origenes')
+    lote = models.CharField(max_length=100, null=True, blank=True)
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3)
+    fecha = models.DateTimeField(default=timezone.now, help_text="Momento de la aprobación")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha'], name='pedorigen_fecha_idx'),
+            models.Index(fields=['sub_ubicacion', 'fecha'], name='pedorigen_sub_fecha_idx'),
+        ]
+        verbose_name_plural = "Orígenes de items de pedido"
 
     def __str__(self):
-        return f"{self.cantidad} x {self.producto.nombre} (Pedido {self.pedido.id})"
\ No newline at end of file
+        return f"{self.cantidad} de {self.sub_ubicacion_id} (item {self.pedido_item_id})"
\ No newline at end of file
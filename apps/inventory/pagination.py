@@ -0,0 +1,139 @@
+"""
+Paginación por keyset (cursor) sobre una clave compuesta indexada.
+
+A diferencia de PageNumberPagination, cada página se obtiene con un
+WHERE (a, b, c) > (x, y, z) ORDER BY a, b, c LIMIT n, así que el costo no
+crece con la profundidad de la página.
+"""
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def filtro_keyset(campos, valores, descendente=False):
+    """
+    Arma el Q equivalente a (campos) > (valores) (o < si descendente),
+    expandido como comparación lexicográfica portable entre motores.
+    """
+    operador = 'lt' if descendente else 'gt'
+    filtro = Q()
+    for i, campo in enumerate(campos):
+        condicion = Q(**{f'{campo}__{operador}': valores[i]})
+        for campo_previo, valor_previo in zip(campos[:i], valores[:i]):
+            condicion &= Q(**{campo_previo: valor_previo})
+        filtro |= condicion
+    return filtro
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor sobre `ordering` (tupla de campos que juntos son únicos
+    y están cubiertos por un índice). El cursor es opaco: base64 de
+    {"p": [valores de la clave], "r": 1 si se pagina hacia atrás}.
+    """
+    ordering = ('id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_page_size(self, request):
+        valor = request.query_params.get(self.page_size_query_param)
+        if valor and valor.isdigit() and int(valor) > 0:
+            return min(int(valor), self.max_page_size)
+        return self.page_size
+
+    def _decodificar(self, request):
+        crudo = request.query_params.get(self.cursor_query_param)
+        if not crudo:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(crudo.encode('ascii')).decode('utf-8'))
+            posicion = data['p']
+            if len(posicion) != len(self.ordering):
+                raise ValueError
+            return posicion, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _codificar(self, obj, reverso):
+        posicion = [getattr(obj, campo) for campo in self.ordering]
+        crudo = json.dumps({'p': posicion, 'r': 1 if reverso else 0}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size_actual = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        posicion, reverso = self._decodificar(request)
+
+        if reverso:
+            queryset = queryset.order_by(*[f'-{campo}' for campo in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if posicion is not None:
+            # Los valores vienen del cliente: un cursor armado a mano puede no
+            # convertirse al tipo de los campos
+            try:
+                queryset = queryset.filter(filtro_keyset(self.ordering, posicion, descendente=reverso))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        resultados = list(queryset[:self.page_size_actual + 1])
+        hay_mas = len(resultados) > self.page_size_actual
+        resultados = resultados[:self.page_size_actual]
+        if reverso:
+            resultados.reverse()
+
+        # Hacia adelante hay siguiente si sobró una fila; hacia atrás, siempre que
+        # hayamos venido desde una página posterior.
+        tiene_siguiente = hay_mas if not reverso else posicion is not None
+        tiene_anterior = posicion is not None if not reverso else hay_mas
+
+        self.next_link = self._codificar(resultados[-1], False) if resultados and tiene_siguiente else None
+        self.previous_link = self._codificar(resultados[0], True) if resultados and tiene_anterior else None
+        if not resultados:
+            self.previous_link = remove_query_param(self.base_url, self.cursor_query_param) if posicion else None
+        return resultados
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class StockKeysetPagination(KeysetPagination):
+    """Orden por (sub_ubicacion, producto, id), cubierto por stock_sub_prod_id_idx."""
+    ordering = ('sub_ubicacion_id', 'producto_id', 'id')
+
+
+class StockResumenKeysetPagination(KeysetPagination):
+    """Orden por (ubicacion, producto, sub_ubicacion), cubierto por stockres_ubic_prod_sub_idx."""
+    ordering = ('ubicacion_id', 'producto_id', 'sub_ubicacion_id')
+
+
+class MovimientoKeysetPagination(KeysetPagination):
+    """Historial de movimientos en orden de inserción (id)."""
+    ordering = ('id',)
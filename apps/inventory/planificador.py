@@ -0,0 +1,198 @@
+"""
+Planificador de orígenes para aprobar un pedido.
+
+A partir de una única lectura de stock arma el body de `aprobar`: cada item se
+abastece entero desde una sola sucursal (repartido entre sus sub-ubicaciones)
+o, si ninguna alcanza, queda a cargo del distribuidor.
+
+Elegir el mínimo de sucursales es un problema de cobertura de conjuntos, así
+que se resuelve con el greedy clásico: en cada ronda se toma la sucursal que
+cubre más items pendientes (a igualdad, la de stock más viejo). Dentro de la
+sucursal elegida se toman los lotes más viejos primero, en el mismo orden que
+usa descontar_fifo, de modo que lo planificado es lo que después se descuenta.
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from .models import PedidoItem, Stock
+
+
+CAMPOS_LOTE = (
+    'id', 'producto_id', 'cantidad', 'fecha_ingreso', 'sub_ubicacion_id', 'sub_ubicacion__nombre',
+    'sub_ubicacion__ubicacion_id', 'sub_ubicacion__ubicacion__nombre',
+)
+
+
+def _orden_fifo(lote):
+    # Mismo criterio que services._orden_fifo: los lotes sin fecha van al final
+    return (lote['fecha_ingreso'] is None, lote['fecha_ingreso'] or date.min, lote['id'])
+
+
+def leer_lotes(producto_ids, excluir_ubicacion_id=None):
+    """
+    Lectura única del stock disponible: ({ubicacion_id: {producto_id: [lotes
+    FIFO]}}, {ubicacion_id: nombre}). Cada lote es un dict cuya 'cantidad' va
+    bajando a medida que se planifica, así varios pedidos pueden planificarse
+    contra la misma oferta.
+    """
+    filas = Stock.objects.filter(producto_id__in=producto_ids, cantidad__gt=0)
+    if excluir_ubicacion_id is not None:
+        filas = filas.exclude(sub_ubicacion__ubicacion_id=excluir_ubicacion_id)
+    filas = filas.values(*CAMPOS_LOTE).order_by()
+    return agrupar_lotes(filas)
+
+
+def agrupar_lotes(filas):
+    """
+    Agrupa filas con CAMPOS_LOTE (de leer_lotes o armadas a partir de lotes
+    ya bloqueados) en la estructura que devuelve leer_lotes().
+    """
+    lotes = defaultdict(lambda: defaultdict(list))
+    nombres = {}
+    for fila in filas:
+        ubicacion_id = fila['sub_ubicacion__ubicacion_id']
+        nombres[ubicacion_id] = fila['sub_ubicacion__ubicacion__nombre']
+        lotes[ubicacion_id][fila['producto_id']].append(fila)
+    for por_producto in lotes.values():
+        for lista in por_producto.values():
+            lista.sort(key=_orden_fifo)
+    return lotes, nombres
+
+
+def _cubiertos(totales, items):
+    """Items que la sucursal puede cubrir completos, descontando lo que ya cubrió en esta ronda."""
+    restante = {}
+    cubiertos = []
+    for item in items:
+        producto_id = item['producto_id']
+        if producto_id not in restante:
+            restante[producto_id] = totales.get(producto_id, 0)
+        if restante[producto_id] >= item['cantidad']:
+            restante[producto_id] -= item['cantidad']
+            cubiertos.append(item)
+    return cubiertos
+
+
+def _mas_viejo(lotes, items):
+    return min(
+        _orden_fifo(next(lote for lote in lotes[item['producto_id']] if lote['cantidad'] > 0))[:2]
+        for item in items
+    )
+
+
+def consumir(lotes, cantidad):
+    """Consume `cantidad` de la lista de lotes FIFO y devuelve {sub_ubicacion_id: cantidad}."""
+    pendiente = cantidad
+    por_sub = {}
+    for lote in lotes:
+        if pendiente <= 0:
+            break
+        tomado = min(lote['cantidad'], pendiente)
+        if tomado <= 0:
+            continue
+        lote['cantidad'] -= tomado
+        pendiente -= tomado
+        por_sub[lote['sub_ubicacion_id']] = por_sub.get(lote['sub_ubicacion_id'], 0) + tomado
+    return por_sub
+
+
+def _texto(cantidad):
+    # Sólo para la respuesta: texto decimal exacto ("0.3", "2"), que aprobar vuelve
+    # a leer como Decimal; un float JSON perdería precisión al sumarse
+    return format(cantidad.normalize(), 'f')
+
+
+def _asignar(lotes, item):
+    """Consume los lotes más viejos y devuelve [{sub_ubicacion, cantidad}] agrupado por sub-ubicación."""
+    nombres = {lote['sub_ubicacion_id']: lote['sub_ubicacion__nombre'] for lote in lotes[item['producto_id']]}
+    return [
+        {'sub_ubicacion': sub_id, 'sub_ubicacion_nombre': nombres[sub_id], 'cantidad': Decimal(str(cantidad))}
+        for sub_id, cantidad in consumir(lotes[item['producto_id']], item['cantidad']).items()
+    ]
+
+
+def planificar(items, lotes, nombres, destino_id):
+    """
+    Planifica los items ({id, producto_id, producto__nombre, cantidad}) contra
+    la oferta de leer_lotes(), salteando el destino, y consume lo asignado.
+    Devuelve el body de aprobar (ver planificar_origenes).
+    """
+    totales = {
+        ubicacion_id: {
+            producto_id: sum(lote['cantidad'] for lote in lista)
+            for producto_id, lista in por_producto.items()
+        }
+        for ubicacion_id, por_producto in lotes.items()
+        if ubicacion_id != destino_id
+    }
+
+    plan = {}
+    pendientes = items
+    sucursales_origen = []
+    while pendientes and totales:
+        candidatas = []
+        for ubicacion_id, totales_ubicacion in totales.items():
+            cubiertos = _cubiertos(totales_ubicacion, pendientes)
+            if cubiertos:
+                candidatas.append((-len(cubiertos), _mas_viejo(lotes[ubicacion_id], cubiertos), ubicacion_id, cubiertos))
+        if not candidatas:
+            break
+        _, _, ubicacion_id, cubiertos = min(candidatas, key=lambda c: c[:3])
+        del totales[ubicacion_id]
+        for item in cubiertos:
+            plan[item['id']] = {
+                'origen_tipo': 'sucursal',
+                'origen_sucursal': ubicacion_id,
+                'sub_ubicaciones_origen': _asignar(lotes[ubicacion_id], item),
+            }
+        sucursales_origen.append({
+            'sucursal_id': ubicacion_id,
+            'sucursal_nombre': nombres[ubicacion_id],
+            'items': len(cubiertos),
+        })
+        ids_cubiertos = {item['id'] for item in cubiertos}
+        pendientes = [item for item in pendientes if item['id'] not in ids_cubiertos]
+
+    resultado = []
+    for item in items:
+        asignacion = plan.get(item['id'], {'origen_tipo': 'distribuidor'})
+        resultado.append({
+            'id': item['id'],
+            'producto_nombre': item['producto__nombre'],
+            'cantidad': item['cantidad'],
+            **asignacion,
+        })
+    return {
+        'items': resultado,
+        'sucursales_origen': sucursales_origen,
+        'items_distribuidor': len(pendientes),
+    }
+
+
+def planificar_origenes(pedido):
+    """
+    Devuelve un body listo para POST /pedidos/{id}/aprobar/:
+    {
+        "items": [{"id", "producto_nombre", "cantidad", "origen_tipo",
+                   "origen_sucursal", "sub_ubicaciones_origen": [...]}, ...],
+        "sucursales_origen": [{"sucursal_id", "sucursal_nombre", "items"}, ...],
+        "items_distribuidor": <cantidad>
+    }
+    Las cantidades de sub_ubicaciones_origen van como texto decimal ("0.3"):
+    el JSON de la respuesta las conserva exactas y aprobar las suma en Decimal.
+    Los campos extra (nombres, resumen) son informativos; aprobar los ignora.
+    Dos queries: items del pedido y stock de sus productos fuera del destino.
+    """
+    items = list(
+        PedidoItem.objects.filter(pedido=pedido)
+        .values('id', 'producto_id', 'producto__nombre', 'cantidad')
+        .order_by('id')
+    )
+    lotes, nombres = leer_lotes({item['producto_id'] for item in items}, excluir_ubicacion_id=pedido.destino_id)
+    plan = planificar(items, lotes, nombres, pedido.destino_id)
+    for item in plan['items']:
+        for origen in item.get('sub_ubicaciones_origen', []):
+            origen['cantidad'] = _texto(origen['cantidad'])
+    return plan
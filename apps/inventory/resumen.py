@@ -0,0 +1,271 @@
+"""
+Resumen de stock por producto × sub-ubicación (StockResumen).
+
+Todo cambio de Stock pasa por ledger.registrar(), que llama a
+aplicar_movimientos() con los movimientos dentro de la misma transacción.
+Ese es el camino caliente (ventas, pedidos, fabricaciones) y no relee Stock
+por par: suma los deltas con un único UPDATE (cantidad = cantidad + delta)
+sobre todas las filas de resumen tocadas, sin SELECT ... FOR UPDATE previo.
+La cantidad de lotes y el próximo vencimiento se ajustan en el mismo UPDATE
+cuando un lote pasa de vacío a tener stock; como saber el nuevo próximo
+vencimiento cuando se agota un lote perecedero exige mirar los demás lotes,
+esos pares (poco frecuentes: una vez por lote) se recalculan con
+actualizar(), igual que los pares sin fila de resumen todavía.
+
+actualizar() es el recálculo completo de un conjunto de pares: bloquea las
+filas de resumen en orden de id y las recalcula desde Stock con una query
+agrupada. Lo usan los caminos que no mueven cantidad o cambian otros campos
+del lote (archivar lotes agotados, cambiar vencimientos, el admin, la edición
+de un lote), además de los casos de arriba. Con el aislamiento READ
+COMMITTED que usa Django en MySQL, la lectura posterior al bloqueo ve lo que
+ya confirmó la otra transacción, y un UPDATE con delta de otra transacción
+espera al bloqueo o se aplica después sobre el valor recalculado.
+
+verificar() compara el resumen contra Stock y reconstruir() lo regenera
+(`manage.py verificar_resumen_stock`). Todos los caminos de escritura marcan
+un cambio de datos (cambios.registrar_cambio) para los reportes cacheados.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Min, Q, Sum, Value, When
+from django.utils import timezone
+
+from . import cambios
+from .models import Stock, StockResumen
+
+BATCH = 2000
+# Pares por UPDATE con deltas (cada par agrega un WHEN a cada CASE)
+TANDA_DELTAS = 500
+CAMPOS = ('ubicacion_id', 'cantidad', 'lotes', 'proximo_vencimiento')
+CERO = Decimal('0.000')
+
+
+def _filtro_pares(pares):
+    filtro = Q()
+    for producto_id, sub_id in pares:
+        filtro |= Q(producto_id=producto_id, sub_ubicacion_id=sub_id)
+    return filtro
+
+
+def _calcular(stock_qs):
+    """{(producto_id, sub_ubicacion_id): (ubicacion_id, cantidad, lotes, proximo_vencimiento)} desde Stock."""
+    filas = (
+        stock_qs.values('producto_id', 'sub_ubicacion_id', 'sub_ubicacion__ubicacion_id')
+        .annotate(
+            total=Sum('cantidad'),
+            con_stock=Count('id', filter=Q(cantidad__gt=0)),
+            proximo=Min('fecha_vencimiento', filter=Q(cantidad__gt=0)),
+        )
+        .order_by()
+    )
+    return {
+        (fila['producto_id'], fila['sub_ubicacion_id']): (
+            fila['sub_ubicacion__ubicacion_id'], fila['total'], fila['con_stock'], fila['proximo'],
+        )
+        for fila in filas
+    }
+
+
+def _valores(fila):
+    return tuple(getattr(fila, campo) for campo in CAMPOS)
+
+
+def actualizar(pares):
+    """
+    Recalcula desde Stock el resumen de los pares (producto_id, sub_ubicacion_id) dados:
+    un SELECT ... FOR UPDATE del resumen, una query agrupada sobre Stock y a
+    lo sumo un DELETE, un bulk_update y un bulk_create.
+    """
+    pares = set(pares)
+    if not pares:
+        return
+    filtro = _filtro_pares(pares)
+    cambios.registrar_cambio()
+    with transaction.atomic(savepoint=False):
+        existentes = {
+            (fila.producto_id, fila.sub_ubicacion_id): fila
+            for fila in StockResumen.objects.select_for_update().filter(filtro).order_by('id')
+        }
+        calculados = _calcular(Stock.objects.filter(filtro))
+
+        ahora = timezone.now()
+        sobrantes = []
+        cambiadas = []
+        nuevas = []
+        for par in sorted(pares):
+            valores = calculados.get(par)
+            fila = existentes.get(par)
+            if valores is None:
+                if fila:
+                    sobrantes.append(fila.id)
+            elif fila is None:
+                nuevas.append(StockResumen(
+                    producto_id=par[0], sub_ubicacion_id=par[1], actualizado=ahora, **dict(zip(CAMPOS, valores))
+                ))
+            elif _valores(fila) != valores:
+                for campo, valor in zip(CAMPOS, valores):
+                    setattr(fila, campo, valor)
+                fila.actualizado = ahora
+                cambiadas.append(fila)
+
+        if sobrantes:
+            StockResumen.objects.filter(id__in=sobrantes).delete()
+        if cambiadas:
+            StockResumen.objects.bulk_update(cambiadas, [*CAMPOS, 'actualizado'])
+        if nuevas:
+            try:
+                with transaction.atomic():
+                    StockResumen.objects.bulk_create(nuevas)
+            except IntegrityError:
+                # Otra transacción creó la fila del mismo par: ya existe, se recalcula bloqueándola
+                actualizar((fila.producto_id, fila.sub_ubicacion_id) for fila in nuevas)
+
+
+def _deltas(movimientos):
+    """
+    Agrupa los movimientos por par y, con una lectura de los lotes tocados
+    (que esta transacción ya tiene bloqueados), detecta los lotes que pasaron
+    de vacío a tener stock o al revés. Devuelve ({par: [delta de cantidad,
+    delta de lotes, vencimiento de los lotes que volvieron]}, pares a
+    recalcular completos).
+    """
+    por_stock = defaultdict(lambda: CERO)
+    par_de_stock = {}
+    recalcular = set()
+    for mov in movimientos:
+        par = (mov.producto_id, mov.sub_ubicacion_id)
+        if not mov.cantidad:
+            # Sin delta cambió otra cosa del lote (p. ej. la fecha de ingreso)
+            recalcular.add(par)
+            continue
+        por_stock[mov.stock_id] += mov.cantidad
+        par_de_stock[mov.stock_id] = par
+
+    posteriores = {
+        stock_id: (cantidad, vencimiento)
+        for stock_id, cantidad, vencimiento in Stock.objects.filter(id__in=list(por_stock)).values_list(
+            'id', 'cantidad', 'fecha_vencimiento'
+        )
+    }
+    deltas = {}
+    for stock_id, delta in por_stock.items():
+        par = par_de_stock[stock_id]
+        if stock_id not in posteriores:
+            # Lote borrado
+            recalcular.add(par)
+            continue
+        despues, vencimiento = posteriores[stock_id]
+        antes = despues - delta
+        acumulado = deltas.setdefault(par, [CERO, 0, None])
+        acumulado[0] += delta
+        if antes <= 0 < despues:
+            acumulado[1] += 1
+            if vencimiento and (acumulado[2] is None or vencimiento < acumulado[2]):
+                acumulado[2] = vencimiento
+        elif despues <= 0 < antes:
+            acumulado[1] -= 1
+            if vencimiento:
+                # Podía ser el próximo vencimiento del par
+                recalcular.add(par)
+    return {par: valores for par, valores in deltas.items() if par not in recalcular}, recalcular
+
+
+def _sumar(deltas, ahora):
+    """Un UPDATE con CASE por par para todas las filas; devuelve cuántas filas actualizó."""
+    def caso(valores, campo):
+        return Case(
+            *[When(producto_id=par[0], sub_ubicacion_id=par[1], then=Value(valor)) for par, valor in valores],
+            default=Value(0), output_field=campo,
+        )
+
+    cambios_campos = {
+        'cantidad': F('cantidad') + caso(
+            [(par, valores[0]) for par, valores in deltas.items()],
+            DecimalField(max_digits=14, decimal_places=3),
+        ),
+        'actualizado': ahora,
+    }
+    lotes = [(par, valores[1]) for par, valores in deltas.items() if valores[1]]
+    if lotes:
+        cambios_campos['lotes'] = F('lotes') + caso(lotes, IntegerField())
+    vencimientos = [(par, valores[2]) for par, valores in deltas.items() if valores[2]]
+    if vencimientos:
+        cambios_campos['proximo_vencimiento'] = Case(
+            *[
+                When(Q(producto_id=par[0], sub_ubicacion_id=par[1])
+                     & (Q(proximo_vencimiento__isnull=True) | Q(proximo_vencimiento__gt=vencimiento)),
+                     then=Value(vencimiento))
+                for par, vencimiento in vencimientos
+            ],
+            default=F('proximo_vencimiento'),
+        )
+    return StockResumen.objects.filter(_filtro_pares(deltas)).update(**cambios_campos)
+
+
+def aplicar_movimientos(movimientos):
+    """
+    Aplica al resumen los movimientos (StockMovimiento, guardados o no) de
+    una operación, después de modificar Stock: una lectura de los lotes
+    tocados y un UPDATE con los deltas por tanda de pares. Los pares que no
+    se pueden resolver por delta se recalculan con actualizar().
+    """
+    if not movimientos:
+        return
+    deltas, recalcular = _deltas(movimientos)
+    cambios.registrar_cambio()
+    ahora = timezone.now()
+    pares = sorted(deltas)
+    for i in range(0, len(pares), TANDA_DELTAS):
+        tanda = {par: deltas[par] for par in pares[i:i + TANDA_DELTAS]}
+        if _sumar(tanda, ahora) < len(tanda):
+            # Pares sin fila de resumen: se crean recalculando
+            existentes = set(
+                StockResumen.objects.filter(_filtro_pares(tanda)).values_list('producto_id', 'sub_ubicacion_id')
+            )
+            recalcular.update(set(tanda) - existentes)
+    if recalcular:
+        actualizar(recalcular)
+
+
+def reconstruir():
+    """Regenera el resumen completo desde Stock. Devuelve la cantidad de filas."""
+    with transaction.atomic():
+        StockResumen.objects.all().delete()
+        ahora = timezone.now()
+        filas = [
+            StockResumen(producto_id=producto_id, sub_ubicacion_id=sub_id, actualizado=ahora,
+                         **dict(zip(CAMPOS, valores)))
+            for (producto_id, sub_id), valores in _calcular(Stock.objects.all()).items()
+        ]
+        StockResumen.objects.bulk_create(filas, batch_size=BATCH)
+        cambios.registrar_cambio()
+    return len(filas)
+
+
+def verificar(reparar=False):
+    """
+    Compara el resumen con lo que resulta de sumar Stock. Devuelve
+    {'faltantes', 'sobrantes', 'distintos'} con los pares en cada caso; con
+    reparar=True recalcula esos pares.
+    """
+    esperados = _calcular(Stock.objects.all())
+    actuales = {
+        (fila[0], fila[1]): fila[2:]
+        for fila in StockResumen.objects.values_list('producto_id', 'sub_ubicacion_id', *CAMPOS).iterator(
+            chunk_size=BATCH
+        )
+    }
+    diferencias = {
+        'faltantes': sorted(set(esperados) - set(actuales)),
+        'sobrantes': sorted(set(actuales) - set(esperados)),
+        'distintos': sorted(par for par, valores in esperados.items()
+                            if par in actuales and actuales[par] != valores),
+    }
+    if reparar:
+        pares = [par for lista in diferencias.values() for par in lista]
+        for i in range(0, len(pares), BATCH):
+            actualizar(pares[i:i + BATCH])
+    return diferencias
@@ -1,6 +1,112 @@
+from collections import defaultdict, deque
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
-from .models import Pedido, PedidoItem, Stock
-from apps.locations.serializers import UbicacionSerializer
+from .models import Pedido, PedidoItem, Stock, StockMovimiento, StockResumen
+
+
+class RelacionEnLote(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que, dentro de una ListaEnLote, toma el objeto de
+    los precargados por la lista en vez de hacer una query por fila. Los ids
+    que no están precargados (inexistentes o inválidos) siguen el camino
+    normal, así que los errores son los mismos.
+    """
+    en_lote = None
+
+    def to_internal_value(self, data):
+        if self.en_lote is not None and not isinstance(data, bool):
+            try:
+                return self.en_lote[self.get_queryset().model._meta.pk.to_python(data)]
+            except (KeyError, TypeError, DjangoValidationError):
+                pass
+        return super().to_internal_value(data)
+
+
+class ListaEnLote(serializers.ListSerializer):
+    """
+    Lista anidada que resuelve los RelacionEnLote de todas sus filas con una
+    query por campo (in_bulk) antes de validarlas.
+    """
+
+    def to_internal_value(self, data):
+        campos = [campo for campo in self.child.fields.values()
+                  if isinstance(campo, RelacionEnLote) and not campo.read_only]
+        filas = [fila for fila in data if isinstance(fila, dict)] if isinstance(data, list) else []
+        for campo in campos:
+            pk = campo.get_queryset().model._meta.pk
+            ids = set()
+            for fila in filas:
+                valor = fila.get(campo.field_name)
+                if valor is None or isinstance(valor, bool):
+                    continue
+                try:
+                    ids.add(pk.to_python(valor))
+                except (TypeError, DjangoValidationError):
+                    continue
+            campo.en_lote = campo.get_queryset().in_bulk(ids) if ids else {}
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for campo in campos:
+                campo.en_lote = None
+
+
+def _cambiar(fila, datos):
+    """Aplica `datos` sobre la instancia y devuelve los campos que cambiaron (sin leer relaciones)."""
+    cambiados = []
+    for nombre, valor in datos.items():
+        campo = fila._meta.get_field(nombre)
+        if campo.is_relation:
+            actual = getattr(fila, campo.attname)
+            nuevo = valor.pk if valor is not None else None
+        else:
+            actual, nuevo = getattr(fila, nombre), valor
+        if actual != nuevo:
+            setattr(fila, nombre, valor)
+            cambiados.append(nombre)
+    return cambiados
+
+
+def sincronizar_anidados(existentes, datos, clave, crear):
+    """
+    Lleva las filas `existentes` (instancias, en orden de id) a la lista
+    `datos` (validated_data de una lista anidada) con a lo sumo un DELETE, un
+    bulk_update y un bulk_create.
+
+    Cada dato se empareja con la primera fila libre que tenga la misma
+    relación `clave` (p. ej. 'producto'): esa fila conserva su id y sólo se
+    actualiza si algo cambió. Los datos sin pareja se crean con crear(dato) y
+    las filas que sobran se borran.
+    """
+    libres = defaultdict(deque)
+    modelo = None
+    for fila in existentes:
+        modelo = type(fila)
+        libres[getattr(fila, modelo._meta.get_field(clave).attname)].append(fila)
+
+    cambiadas = []
+    campos = set()
+    nuevas = []
+    for dato in datos:
+        cola = libres.get(dato[clave].pk)
+        if not cola:
+            nuevas.append(crear(dato))
+            continue
+        fila = cola.popleft()
+        cambiados = _cambiar(fila, dato)
+        if cambiados:
+            cambiadas.append(fila)
+            campos.update(cambiados)
+
+    sobrantes = [fila.pk for cola in libres.values() for fila in cola]
+    if sobrantes:
+        modelo.objects.filter(pk__in=sobrantes).delete()
+    if cambiadas:
+        modelo.objects.bulk_update(cambiadas, sorted(campos))
+    if nuevas:
+        type(nuevas[0]).objects.bulk_create(nuevas)
 
 class StockSerializer(serializers.ModelSerializer):
     cantidad = serializers.DecimalField(max_digits=12, decimal_places=3, coerce_to_string=False)
@@ -22,12 +128,39 @@ class StockSerializer(serializers.ModelSerializer):
                   'fecha_ingreso', 'lote', 'fecha_vencimiento', 'dias_para_vencer']
         read_only_fields = ['ultima_actualizacion', 'fecha_vencimiento', 'dias_para_vencer']
 
+class StockMovimientoSerializer(serializers.ModelSerializer):
+    cantidad = serializers.DecimalField(max_digits=12, decimal_places=3, coerce_to_string=False)
+    tipo_display = serializers.ReadOnlyField(source='get_tipo_display')
+    producto_nombre = serializers.ReadOnlyField(source='producto.nombre')
+    sub_ubicacion_nombre = serializers.ReadOnlyField(source='sub_ubicacion.nombre')
+    usuario_nombre = serializers.ReadOnlyField(source='usuario.username')
+
+    class Meta:
+        model = StockMovimiento
+        fields = ['id', 'fecha', 'tipo', 'tipo_display', 'cantidad', 'stock', 'lote',
+                  'producto', 'producto_nombre', 'sub_ubicacion', 'sub_ubicacion_nombre',
+                  'referencia_id', 'usuario', 'usuario_nombre']
+        read_only_fields = fields
+
+class StockResumenSerializer(serializers.ModelSerializer):
+    cantidad = serializers.DecimalField(max_digits=14, decimal_places=3, coerce_to_string=False)
+    producto_nombre = serializers.ReadOnlyField(source='producto.nombre')
+    ubicacion_nombre = serializers.ReadOnlyField(source='ubicacion.nombre')
+    sub_ubicacion_nombre = serializers.ReadOnlyField(source='sub_ubicacion.nombre')
+
+    class Meta:
+        model = StockResumen
+        fields = ['producto', 'producto_nombre', 'ubicacion', 'ubicacion_nombre', 'sub_ubicacion',
+                  'sub_ubicacion_nombre', 'cantidad', 'lotes', 'proximo_vencimiento', 'actualizado']
+        read_only_fields = fields
+
 class PedidoItemSerializer(serializers.ModelSerializer):
-    
+    serializer_related_field = RelacionEnLote
     producto_nombre = serializers.ReadOnlyField(source='producto.nombre')
 
     class Meta:
         model = PedidoItem
+        list_serializer_class = ListaEnLote
         fields = ['id', 'producto', 'producto_nombre', 'cantidad', 'precio_costo_momento', 'sub_ubicacion_destino', 'sub_ubicacion_origen']
 
 class PedidoSerializer(serializers.ModelSerializer):
@@ -48,14 +181,14 @@ class PedidoSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.pdf_archivo.url)
         return None
 
+    @transaction.atomic
     def create(self, validated_data):
-       
         items_data = validated_data.pop('items')
         pedido = Pedido.objects.create(**validated_data)
-        for item_data in items_data:
-            PedidoItem.objects.create(pedido=pedido, **item_data)
+        PedidoItem.objects.bulk_create([PedidoItem(pedido=pedido, **item_data) for item_data in items_data])
         return pedido
-    
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         # Extraer los items anidados si existen
         items_data = validated_data.pop('items', None)
@@ -63,15 +196,17 @@ class PedidoSerializer(serializers.ModelSerializer):
         # Actualizar los campos del pedido
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        # Sólo los campos editados: el estado lo cambian las transiciones, no este save
+        instance.save(update_fields=[*validated_data, 'fecha_actualizacion'])
         
-        # Si se enviaron items, reemplazar los existentes
+        # Si se enviaron items, llevar los existentes a la lista nueva: las
+        # líneas que no cambiaron conservan su id (y sus orígenes)
         if items_data is not None:
-            # Eliminar los items existentes
-            instance.items.all().delete()
-            
-            # Crear los nuevos items
-            for item_data in items_data:
-                PedidoItem.objects.create(pedido=instance, **item_data)
+            sincronizar_anidados(
+                PedidoItem.objects.filter(pedido=instance).order_by('id'),
+                items_data,
+                clave='producto',
+                crear=lambda item_data: PedidoItem(pedido=instance, **item_data),
+            )
         
         return instance
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Servicios de stock compartidos por ventas, pedidos y fabricaciones.
+
+descontar_fifo() recibe todas las demandas de una operación. Si la operación
+toca un único par (producto, sub-ubicación) y ese par tiene un único lote con
+stock (p. ej. productos sin caducidad, consolidados en lote=None), se
+descuenta con un UPDATE condicional sin bloqueo previo. En cualquier otro caso
+bloquea los lotes de todos los pares con un único SELECT ... FOR UPDATE
+ordenado por id, planifica la asignación FIFO en memoria y la persiste con un
+solo bulk_update. Los consumos quedan registrados en el libro de movimientos
+con un solo bulk insert.
+
+Orden de bloqueo: toda operación toma los bloqueos de Stock en orden
+ascendente de id. El UPDATE condicional bloquea una sola fila y sólo cuando es
+el único bloqueo de Stock de la operación; si no actualiza (stock
+insuficiente), con READ COMMITTED (el nivel que Django usa en MySQL) la fila
+examinada se libera y el par sigue por el SELECT ... FOR UPDATE ordenado. Dos
+operaciones no pueden esperarse en orden cruzado sobre lotes de stock;
+con_reintentos() queda para los conflictos con otras tablas.
+"""
+
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from apps.locations.models import SubUbicacion
+from apps.products.models import Producto
+
+from . import ledger
+from .models import SecuenciaLote, Stock
+
+CERO = Decimal('0.000')
+PRECISION = Decimal('0.001')
+
+# Permite desactivar el camino rápido (p. ej. para comparar en bench_venta_concurrente)
+USAR_DECREMENTO_CONDICIONAL = True
+
+# Deadlock (1213) y lock wait timeout (1205) de MySQL; serialización y deadlock de PostgreSQL
+CODIGOS_MYSQL_REINTENTABLES = {1205, 1213}
+SQLSTATE_REINTENTABLES = {'40001', '40P01'}
+
+
+class StockInsuficiente(ValueError):
+    """No hay stock suficiente para cubrir una demanda."""
+
+
+def es_error_de_bloqueo(exc):
+    """True si el error de base de datos es un deadlock o conflicto de bloqueo reintentable."""
+    causa = exc.__cause__ or exc
+    if causa.args and causa.args[0] in CODIGOS_MYSQL_REINTENTABLES:
+        return True
+    if (getattr(causa, 'pgcode', None) or getattr(causa, 'sqlstate', None)) in SQLSTATE_REINTENTABLES:
+        return True
+    mensaje = str(exc).lower()
+    return 'deadlock' in mensaje or 'database is locked' in mensaje
+
+
+def con_reintentos(funcion, intentos=4, espera_base=0.02, al_reintentar=None):
+    """
+    Ejecuta funcion(), que debe abrir su propia transacción, y la reintenta
+    ante deadlocks o errores de serialización con backoff exponencial y jitter.
+    Dentro de un atomic exterior no reintenta: la transacción ya está abortada
+    y el error se propaga para que la reintente quien la abrió.
+    al_reintentar(intento, exc) se llama antes de cada reintento (métricas).
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            return funcion()
+        except DatabaseError as exc:
+            if (intento == intentos or not es_error_de_bloqueo(exc)
+                    or transaction.get_connection().in_atomic_block):
+                raise
+            if al_reintentar:
+                al_reintentar(intento, exc)
+            time.sleep(espera_base * (2 ** (intento - 1)) * (1 + random.random()))
+
+
+def _pk(valor):
+    return getattr(valor, 'pk', valor)
+
+
+def _orden_fifo(stock):
+    # FIFO por fecha de ingreso; los lotes sin fecha van al final
+    return (stock.fecha_ingreso is None, stock.fecha_ingreso, stock.id)
+
+
+def _nombres(demanda, producto_id, sub_id):
+    """Nombres legibles para los mensajes de error (sólo se consultan si hace falta)."""
+    producto = demanda['producto']
+    sub = demanda['sub_ubicacion']
+    producto_nombre = producto.nombre if isinstance(producto, Producto) else (
+        Producto.objects.filter(id=producto_id).values_list('nombre', flat=True).first()
+    )
+    sub_nombre = sub.nombre if isinstance(sub, SubUbicacion) else (
+        SubUbicacion.objects.filter(id=sub_id).values_list('nombre', flat=True).first()
+    )
+    return producto_nombre, sub_nombre
+
+
+def _filtro_pares(pares):
+    filtro = Q()
+    for producto_id, sub_id in pares:
+        filtro |= Q(producto_id=producto_id, sub_ubicacion_id=sub_id)
+    return filtro
+
+
+def bloquear_lotes(pares):
+    """
+    Bloquea (SELECT ... FOR UPDATE) todos los lotes con stock de los pares
+    (producto_id, sub_ubicacion_id) en orden de id, y los devuelve agrupados
+    por par y ordenados FIFO. Debe llamarse dentro de transaction.atomic().
+    """
+    lotes = defaultdict(list)
+    if not pares:
+        return lotes
+
+    for stock in Stock.objects.select_for_update().filter(_filtro_pares(pares), cantidad__gt=0).order_by('id'):
+        lotes[(stock.producto_id, stock.sub_ubicacion_id)].append(stock)
+    for candidatos in lotes.values():
+        candidatos.sort(key=_orden_fifo)
+    return lotes
+
+
+def lotes_unicos(pares):
+    """
+    Lectura sin bloqueo: {par: (stock_id, lote)} para los pares que tienen
+    exactamente un lote con stock. Los demás pares no aparecen.
+    """
+    if not pares:
+        return {}
+    filas = (
+        Stock.objects.filter(_filtro_pares(pares), cantidad__gt=0)
+        .values('producto_id', 'sub_ubicacion_id')
+        .annotate(lotes=Count('id'), stock_id=Max('id'), lote_unico=Max('lote'))
+        .order_by()
+    )
+    return {
+        (fila['producto_id'], fila['sub_ubicacion_id']): (fila['stock_id'], fila['lote_unico'])
+        for fila in filas
+        if fila['lotes'] == 1
+    }
+
+
+def decrementar_condicional(stock_id, cantidad, ahora=None):
+    """
+    UPDATE ... SET cantidad = cantidad - x WHERE id = ... AND cantidad >= x.
+    Devuelve True si la fila se actualizó (había stock suficiente).
+    """
+    actualizadas = Stock.objects.filter(id=stock_id, cantidad__gte=cantidad).update(
+        cantidad=F('cantidad') - cantidad,
+        ultima_actualizacion=ahora or timezone.now(),
+    )
+    return actualizadas == 1
+
+
+def descontar_fifo(demandas, tipo='ajuste', referencia_id=None, usuario=None, decremento_condicional=None,
+                   lotes_bloqueados=None, crear_referencia=None):
+    """
+    Descuenta stock para una lista de demandas usando FIFO por lote.
+
+    demandas: lista de dicts {producto, sub_ubicacion, cantidad}; producto y
+    sub_ubicacion pueden ser instancias o ids. tipo, referencia_id y usuario
+    se registran en cada StockMovimiento generado; una demanda puede traer su
+    propio 'referencia_id' (p. ej. al aprobar varios pedidos juntos).
+    decremento_condicional=False fuerza el camino bloqueante; por defecto rige
+    USAR_DECREMENTO_CONDICIONAL. Aun habilitado, el UPDATE condicional sólo se
+    usa si las demandas son todas del mismo par (ver el orden de bloqueo en el
+    docstring del módulo).
+    lotes_bloqueados: lo devuelto por bloquear_lotes() en la misma transacción,
+    si quien llama ya bloqueó y validó los lotes (p. ej. la sincronización de
+    ventas en lote); no se vuelven a leer y se descuenta sobre esas instancias.
+    crear_referencia: función sin argumentos que se llama una sola vez, con
+    todas las demandas ya validadas y antes de escribir el libro; lo que
+    devuelve es el referencia_id (p. ej. insertar la venta sólo si hay stock).
+
+    Devuelve, en el mismo orden que las demandas, la lista de lotes consumidos
+    por cada una: [{'stock_id', 'lote', 'sub_ubicacion_id', 'cantidad'}, ...].
+    Lanza StockInsuficiente si alguna demanda no puede cubrirse; en ese caso no
+    se escribe nada. Debe llamarse dentro de transaction.atomic().
+    """
+    normalizadas = [
+        (_pk(d['producto']), _pk(d['sub_ubicacion']), Decimal(d['cantidad']).quantize(PRECISION))
+        for d in demandas
+    ]
+
+    requerido = defaultdict(lambda: CERO)
+    for producto_id, sub_id, cantidad in normalizadas:
+        requerido[(producto_id, sub_id)] += cantidad
+
+    ahora = timezone.now()
+    # Savepoint propio: si una demanda falla se deshacen también los decrementos rápidos
+    with transaction.atomic():
+        # Camino rápido: un único par con un único lote, decremento condicional
+        # sin SELECT ... FOR UPDATE. Con más pares, todos los bloqueos van por
+        # el SELECT ordenado por id
+        rapidos = {}
+        if decremento_condicional is None:
+            decremento_condicional = USAR_DECREMENTO_CONDICIONAL
+        if decremento_condicional and lotes_bloqueados is None and len(requerido) == 1:
+            for par, (stock_id, lote) in lotes_unicos(list(requerido)).items():
+                if decrementar_condicional(stock_id, requerido[par], ahora):
+                    rapidos[par] = (stock_id, lote)
+
+        # Varios lotes, sin stock suficiente o cambios concurrentes: camino bloqueante
+        if lotes_bloqueados is None:
+            lotes = bloquear_lotes([par for par in requerido if par not in rapidos])
+        else:
+            lotes = lotes_bloqueados
+
+        # Validar todo antes de tocar ningún lote del camino bloqueante
+        for demanda, (producto_id, sub_id, _) in zip(demandas, normalizadas):
+            par = (producto_id, sub_id)
+            if par in rapidos:
+                continue
+            disponible = sum((s.cantidad for s in lotes.get(par, [])), CERO)
+            if not lotes.get(par):
+                producto_nombre, sub_nombre = _nombres(demanda, producto_id, sub_id)
+                raise StockInsuficiente(f"No hay stock de {producto_nombre} en {sub_nombre}")
+            if disponible < requerido[par]:
+                producto_nombre, sub_nombre = _nombres(demanda, producto_id, sub_id)
+                raise StockInsuficiente(
+                    f"Stock insuficiente de {producto_nombre} en {sub_nombre}. "
+                    f"Disponible: {disponible}, requerido: {requerido[par]}."
+                )
+
+        if crear_referencia is not None:
+            referencia_id = crear_referencia()
+
+        # Planificar en memoria
+        modificados = {}
+        movimientos = []
+        asignaciones = []
+        for demanda, (producto_id, sub_id, cantidad) in zip(demandas, normalizadas):
+            referencia = demanda.get('referencia_id', referencia_id)
+            par = (producto_id, sub_id)
+            if par in rapidos:
+                stock_id, lote = rapidos[par]
+                lote_unico = Stock(id=stock_id, producto_id=producto_id, sub_ubicacion_id=sub_id, lote=lote)
+                movimientos.append(ledger.movimiento(
+                    lote_unico, -cantidad, tipo, referencia_id=referencia, usuario=usuario, fecha=ahora
+                ))
+                asignaciones.append([{
+                    'stock_id': stock_id,
+                    'lote': lote,
+                    'sub_ubicacion_id': sub_id,
+                    'cantidad': cantidad,
+                }])
+                continue
+
+            restante = cantidad
+            consumos = []
+            for stock in lotes[par]:
+                if restante <= 0:
+                    break
+                if stock.cantidad <= 0:
+                    continue
+                tomar = min(stock.cantidad, restante)
+                stock.cantidad = (stock.cantidad - tomar).quantize(PRECISION)
+                stock.ultima_actualizacion = ahora
+                modificados[stock.id] = stock
+                movimientos.append(ledger.movimiento(
+                    stock, -tomar, tipo, referencia_id=referencia, usuario=usuario, fecha=ahora
+                ))
+                consumos.append({
+                    'stock_id': stock.id,
+                    'lote': stock.lote,
+                    'sub_ubicacion_id': sub_id,
+                    'cantidad': tomar,
+                })
+                restante -= tomar
+            asignaciones.append(consumos)
+
+        if modificados:
+            Stock.objects.bulk_update(list(modificados.values()), ['cantidad', 'ultima_actualizacion'])
+        ledger.registrar(movimientos)
+    return asignaciones
+
+
+def asignar_codigos_lote(prefijo, cantidad, fecha=None):
+    """
+    Reserva `cantidad` códigos de lote únicos con un UPDATE atómico sobre el
+    contador del prefijo: PREFIJO-AAAAMMDD-000123. El contador queda bloqueado
+    hasta el fin de la transacción que lo llama, así que no hay colisiones
+    entre recepciones o fabricaciones concurrentes.
+    """
+    fecha = fecha or timezone.localdate()
+    with transaction.atomic():
+        if not SecuenciaLote.objects.filter(prefijo=prefijo).update(ultimo=F('ultimo') + cantidad):
+            try:
+                with transaction.atomic():
+                    SecuenciaLote.objects.create(prefijo=prefijo, ultimo=cantidad)
+            except IntegrityError:
+                # Otro proceso creó el contador en paralelo
+                SecuenciaLote.objects.filter(prefijo=prefijo).update(ultimo=F('ultimo') + cantidad)
+        ultimo = SecuenciaLote.objects.filter(prefijo=prefijo).values_list('ultimo', flat=True).get()
+    return [f"{prefijo}-{fecha:%Y%m%d}-{numero:06d}" for numero in range(ultimo - cantidad + 1, ultimo + 1)]
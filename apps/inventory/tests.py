@@ -1,3 +1,1056 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.locations.models import SubUbicacion, Ubicacion
+from apps.products.models import Categoria, Producto
+from apps.users.models import User
+
+from . import archivo, ledger, planificador, resumen, services, utils, views
+from .transferencias import reporte_transferencias
+from .models import (
+    Pedido, PedidoItem, PedidoItemOrigen, Stock, StockArchivado, StockMovimiento, StockResumen, StockSnapshot,
+)
+from .serializers import PedidoSerializer
+
+
+class PedidoListadoTests(TestCase):
+    """El listado de pedidos no debe hacer N+1 al crecer pedidos e items."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.sucursales = [Ubicacion.objects.create(nombre=f'Sucursal {i}', tipo='sucursal') for i in range(3)]
+        cls.almacen = Ubicacion.objects.create(nombre='Almacén', tipo='almacen')
+        categoria = Categoria.objects.create(nombre='Bebidas')
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(10)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _crear_pedidos(self, cantidad, items_por_pedido, estado='pendiente'):
+        for i in range(cantidad):
+            pedido = Pedido.objects.create(
+                creado_por=self.admin,
+                destino=self.sucursales[i % len(self.sucursales)],
+                estado=estado,
+                origen_tipo='sucursal',
+                origen_sucursal=self.almacen,
+            )
+            PedidoItem.objects.bulk_create([
+                PedidoItem(
+                    pedido=pedido,
+                    producto=self.productos[j % len(self.productos)],
+                    cantidad=j + 1,
+                    precio_costo_momento=Decimal('60'),
+                )
+                for j in range(items_por_pedido)
+            ])
+
+    def _listar(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            respuesta = self.client.get('/api/inventory/pedidos/', params)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(ctx.captured_queries), respuesta
+
+    def test_cantidad_de_queries_constante(self):
+        self._crear_pedidos(2, 1)
+        queries_pocos, respuesta = self._listar(page_size=100)
+        self.assertEqual(respuesta.data['count'], 2)
+
+        self._crear_pedidos(40, 8)
+        queries_muchos, respuesta = self._listar(page_size=100)
+        self.assertEqual(respuesta.data['count'], 42)
+        self.assertEqual(len(respuesta.data['results'][0]['items']), 8)
+        self.assertEqual(queries_pocos, queries_muchos)
+
+    def test_paginacion(self):
+        self._crear_pedidos(25, 1)
+        _, respuesta = self._listar()
+        self.assertEqual(respuesta.data['count'], 25)
+        self.assertEqual(len(respuesta.data['results']), 20)
+        self.assertIsNotNone(respuesta.data['next'])
+
+    def test_filtros(self):
+        self._crear_pedidos(3, 1, estado='pendiente')
+        self._crear_pedidos(3, 1, estado='aprobado')
+        viejo = Pedido.objects.order_by('id').first()
+        Pedido.objects.filter(pk=viejo.pk).update(fecha_creacion=timezone.now() - timedelta(days=10))
+
+        _, respuesta = self._listar(estado='aprobado')
+        self.assertEqual(respuesta.data['count'], 3)
+        _, respuesta = self._listar(estado='aprobado,pendiente', destino=self.sucursales[0].id)
+        self.assertEqual(respuesta.data['count'], 2)
+
+        hoy = timezone.localdate()
+        _, respuesta = self._listar(fecha_desde=str(hoy - timedelta(days=1)))
+        self.assertEqual(respuesta.data['count'], 5)
+        _, respuesta = self._listar(fecha_hasta=str(hoy - timedelta(days=5)))
+        self.assertEqual([p['id'] for p in respuesta.data['results']], [viejo.id])
+
+        respuesta = self.client.get('/api/inventory/pedidos/', {'fecha_desde': 'ayer'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_sucursal_solo_ve_sus_pedidos(self):
+        self._crear_pedidos(6, 2)
+        usuario = User.objects.create_user(
+            username='suc_test', password='x', rol='sucursal', sucursal_asignada=self.sucursales[1]
+        )
+        self.client.force_authenticate(usuario)
+        _, respuesta = self._listar()
+        self.assertEqual(respuesta.data['count'], 2)
+        self.assertTrue(all(p['destino'] == self.sucursales[1].id for p in respuesta.data['results']))
+
+
+class StockListadoTests(TestCase):
+    """Listado de stock paginado por cursor y exportación NDJSON por páginas keyset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        subs = [SubUbicacion.objects.create(ubicacion=sucursal, nombre=f'Sub {i}', tipo='ambiente') for i in range(2)]
+        categoria = Categoria.objects.create(nombre='Almacén')
+        productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(3)
+        ]
+        # Creados en desorden respecto de la clave (sub_ubicacion, producto, id)
+        for sub in reversed(subs):
+            for producto in reversed(productos):
+                Stock.objects.create(producto=producto, sub_ubicacion=sub, cantidad=5, lote='A')
+        Stock.objects.create(producto=productos[0], sub_ubicacion=subs[0], cantidad=0, lote='B')
+        cls.orden = list(
+            Stock.objects.order_by('sub_ubicacion_id', 'producto_id', 'id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _get(self, url, params=None):
+        respuesta = self.client.get(url, params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.data
+
+    def test_recorre_paginas_en_orden_de_clave(self):
+        pagina = self._get('/api/inventory/stock/', {'page_size': 3})
+        self.assertIsNone(pagina['previous'])
+        ids, paginas = [], []
+        while True:
+            ids += [fila['id'] for fila in pagina['results']]
+            paginas.append(pagina)
+            if not pagina['next']:
+                break
+            pagina = self._get(pagina['next'])
+        self.assertEqual(ids, self.orden)
+        self.assertEqual([len(p['results']) for p in paginas], [3, 3, 1])
+
+        # Hacia atrás desde la última página
+        anterior = self._get(paginas[-1]['previous'])
+        self.assertEqual([fila['id'] for fila in anterior['results']], self.orden[3:6])
+
+        filtrado = self._get('/api/inventory/stock/', {'solo_con_stock': 'true', 'page_size': 50})
+        self.assertEqual(len(filtrado['results']), 6)
+
+    def test_cursor_invalido_es_404(self):
+        def cursor(valor):
+            return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode()
+
+        for crudo in ('no-es-base64!', cursor({'x': 1}), cursor({'p': [1, 2]}),
+                      cursor({'p': ['a', 'b', 'c']}), cursor({'p': [[1], {}, None]})):
+            with self.subTest(cursor=crudo):
+                respuesta = self.client.get('/api/inventory/stock/', {'cursor': crudo})
+                self.assertEqual(respuesta.status_code, 404)
+
+    def test_exportacion_ndjson_por_paginas(self):
+        with mock.patch.object(views.StockViewSet, 'ndjson_chunk_size', 3):
+            respuesta = self.client.get('/api/inventory/stock/', {'formato': 'ndjson'})
+            self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+            with CaptureQueriesContext(connection) as contexto:
+                lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linea)['id'] for linea in lineas], self.orden)
+        # Tres páginas de 3, 3 y 1 filas, cada una con su LIMIT
+        lecturas = [q['sql'] for q in contexto.captured_queries if 'FROM "inventory_stock"' in q['sql']]
+        self.assertEqual(len(lecturas), 3)
+        self.assertTrue(all('LIMIT 3' in sql for sql in lecturas))
+
+
+class PedidoEscrituraAnidadaTests(TestCase):
+    """Crear o editar los items de un pedido no hace una query por línea."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        categoria = Categoria.objects.create(nombre='Bebidas')
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(100)
+        ]
+
+    def _items(self, cantidad):
+        return [
+            {'producto': producto.id, 'cantidad': i + 1, 'precio_costo_momento': '60.00'}
+            for i, producto in enumerate(self.productos[:cantidad])
+        ]
+
+    def _guardar(self, instancia, data, **kwargs):
+        serializer = PedidoSerializer(instancia, data=data, **kwargs)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            pedido = serializer.save(**({} if instancia else {'creado_por': self.admin}))
+        return pedido, len(ctx.captured_queries)
+
+    def _ids(self, pedido):
+        return list(pedido.items.order_by('id').values_list('id', flat=True))
+
+    def test_crear_en_queries_constantes(self):
+        _, queries_pocos = self._guardar(None, {'destino': self.sucursal.id, 'items': self._items(2)})
+        pedido, queries_muchos = self._guardar(None, {'destino': self.sucursal.id, 'items': self._items(100)})
+        self.assertEqual(pedido.items.count(), 100)
+        self.assertEqual(queries_pocos, queries_muchos)
+
+    def test_editar_una_linea_conserva_ids(self):
+        pedido, _ = self._guardar(None, {'destino': self.sucursal.id, 'items': self._items(100)})
+        ids = self._ids(pedido)
+        items = self._items(100)
+        items[40]['cantidad'] = 999
+
+        _, queries = self._guardar(pedido, {'items': items}, partial=True)
+
+        self.assertLessEqual(queries, 8)
+        self.assertEqual(self._ids(pedido), ids)
+        self.assertEqual(PedidoItem.objects.get(id=ids[40]).cantidad, 999)
+        self.assertEqual(PedidoItem.objects.filter(pedido=pedido, cantidad=999).count(), 1)
+
+    def test_altas_bajas_y_cambios(self):
+        pedido, _ = self._guardar(None, {'destino': self.sucursal.id, 'items': self._items(10)})
+        ids = self._ids(pedido)
+        items = self._items(10)
+        del items[3]
+        items[0]['precio_costo_momento'] = '75.00'
+        items.append({'producto': self.productos[50].id, 'cantidad': 5, 'precio_costo_momento': '60.00'})
+
+        self._guardar(pedido, {'items': items}, partial=True)
+
+        nuevos = self._ids(pedido)
+        self.assertNotIn(ids[3], nuevos)
+        self.assertEqual(nuevos[:9], ids[:3] + ids[4:])
+        self.assertEqual(len(nuevos), 10)
+        self.assertEqual(PedidoItem.objects.get(id=ids[0]).precio_costo_momento, Decimal('75.00'))
+        self.assertEqual(PedidoItem.objects.get(id=nuevos[-1]).producto_id, self.productos[50].id)
+
+    def test_producto_inexistente(self):
+        items = self._items(3)
+        items[1]['producto'] = 999999
+        serializer = PedidoSerializer(data={'destino': self.sucursal.id, 'items': items})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('producto', serializer.errors['items'][1])
+
+
+class TransicionesPedidoTests(TransactionTestCase):
+    """Las transiciones de estado son UPDATE condicionales: sólo una request gana."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        self.almacen = Ubicacion.objects.create(nombre='Almacén', tipo='almacen')
+        self.sub_almacen = SubUbicacion.objects.create(ubicacion=self.almacen, nombre='Depósito', tipo='ambiente')
+        self.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        self.sub_sucursal = SubUbicacion.objects.create(ubicacion=self.sucursal, nombre='Góndola', tipo='ambiente')
+        producto = Producto.objects.create(
+            nombre='Agua', categoria=Categoria.objects.create(nombre='Bebidas'), tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        self.stock = Stock.objects.create(producto=producto, sub_ubicacion=self.sub_almacen, cantidad=100)
+        self.pedido = Pedido.objects.create(creado_por=self.admin, destino=self.sucursal, estado='pendiente')
+        self.item = PedidoItem.objects.create(
+            pedido=self.pedido, producto=producto, cantidad=10, precio_costo_momento=Decimal('60')
+        )
+
+    def _body_aprobar(self):
+        return {'items': [{
+            'id': self.item.id,
+            'origen_tipo': 'sucursal',
+            'origen_sucursal': self.almacen.id,
+            'sub_ubicaciones_origen': [{'sub_ubicacion': self.sub_almacen.id, 'cantidad': 10}],
+        }]}
+
+    # Necesita bloqueo por fila: en sqlite las escrituras concurrentes fallan en vez de esperar
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_aprobaciones_concurrentes_descuentan_una_vez(self):
+        hilos = 4
+        barrera = threading.Barrier(hilos)
+        codigos = []
+
+        def aprobar():
+            try:
+                cliente = APIClient()
+                cliente.force_authenticate(self.admin)
+                barrera.wait()
+                respuesta = cliente.post(
+                    f'/api/inventory/pedidos/{self.pedido.id}/aprobar/', self._body_aprobar(), format='json'
+                )
+                codigos.append(respuesta.status_code)
+            finally:
+                connection.close()
+
+        descontar_fifo = views.descontar_fifo
+
+        def descontar_lento(*args, **kwargs):
+            # Ensancha la ventana entre leer el pedido y commitear la aprobación
+            time.sleep(0.2)
+            return descontar_fifo(*args, **kwargs)
+
+        threads = [threading.Thread(target=aprobar) for _ in range(hilos)]
+        with mock.patch.object(views, 'descontar_fifo', side_effect=descontar_lento):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(codigos.count(200), 1, codigos)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad, 90)
+        salidas = StockMovimiento.objects.filter(tipo='pedido_salida', referencia_id=self.pedido.id)
+        self.assertEqual(salidas.aggregate(total=Sum('cantidad'))['total'], -10)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, 'aprobado')
+
+    def test_instancia_desactualizada_pierde_la_transicion(self):
+        otra = Pedido.objects.get(pk=self.pedido.pk)
+        self.assertTrue(self.pedido.transicionar('pendiente', 'aprobado'))
+        self.assertFalse(otra.transicionar('pendiente', 'rechazado'))
+        self.assertEqual(Pedido.objects.get(pk=self.pedido.pk).estado, 'aprobado')
+        with self.assertRaises(ValueError):
+            self.pedido.transicionar('aprobado', 'pendiente')
+
+    def test_recibir_exige_pedido_aprobado(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.admin)
+        body = {'items': [{'id': self.item.id, 'sub_ubicacion_destino': self.sub_sucursal.id}]}
+
+        respuesta = cliente.post(f'/api/inventory/pedidos/{self.pedido.id}/recibir/', body, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.item.refresh_from_db()
+        self.assertIsNone(self.item.sub_ubicacion_destino_id)
+
+        cliente.post(f'/api/inventory/pedidos/{self.pedido.id}/aprobar/', self._body_aprobar(), format='json')
+        respuesta = cliente.post(f'/api/inventory/pedidos/{self.pedido.id}/recibir/', body, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        respuesta = cliente.post(f'/api/inventory/pedidos/{self.pedido.id}/recibir/', body, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        recibido = Stock.objects.filter(sub_ubicacion=self.sub_sucursal).aggregate(total=Sum('cantidad'))['total']
+        self.assertEqual(recibido, 10)
+
+
+class VencimientoStockTests(TestCase):
+    """fecha_vencimiento persistida: se calcula al guardar y sigue a dias_caducidad del producto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=sucursal, nombre='Heladera', tipo='heladera')
+        cls.categoria = Categoria.objects.create(nombre='Lácteos')
+        cls.producto = Producto.objects.create(
+            nombre='Leche', categoria=cls.categoria, tipo_conservacion='heladera',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'), dias_caducidad=10,
+        )
+        cls.hoy = timezone.localdate()
+
+    def _lote(self, lote, dias_atras, cantidad=5):
+        return Stock.objects.create(producto=self.producto, sub_ubicacion=self.sub, cantidad=cantidad,
+                                    lote=lote, fecha_ingreso=self.hoy - timedelta(days=dias_atras))
+
+    def test_se_calcula_al_guardar(self):
+        stock = self._lote('L1', 3)
+        self.assertEqual(stock.fecha_vencimiento, self.hoy + timedelta(days=7))
+        self.assertEqual(stock.dias_para_vencer, 7)
+
+        stock.fecha_ingreso = self.hoy
+        stock.save(update_fields=['fecha_ingreso'])
+        self.assertEqual(Stock.objects.get(id=stock.id).fecha_vencimiento, self.hoy + timedelta(days=10))
+
+        sin_fecha = Stock.objects.create(producto=self.producto, sub_ubicacion=self.sub, cantidad=1, lote='L2')
+        self.assertIsNone(sin_fecha.fecha_vencimiento)
+
+    def test_cambio_de_dias_caducidad_recalcula_lotes_y_resumen(self):
+        viejo, nuevo = self._lote('L1', 8), self._lote('L2', 1)
+        resumen.reconstruir()
+
+        self.producto.dias_caducidad = 30
+        self.producto.save()
+        self.assertEqual(
+            dict(Stock.objects.values_list('id', 'fecha_vencimiento')),
+            {viejo.id: self.hoy + timedelta(days=22), nuevo.id: self.hoy + timedelta(days=29)},
+        )
+        self.assertEqual(StockResumen.objects.get().proximo_vencimiento, self.hoy + timedelta(days=22))
+
+        self.producto.dias_caducidad = None
+        self.producto.save()
+        self.assertFalse(Stock.objects.exclude(fecha_vencimiento=None).exists())
+        self.assertIsNone(StockResumen.objects.get().proximo_vencimiento)
+
+    def test_guardar_otros_campos_no_recalcula(self):
+        self._lote('L1', 3)
+        with mock.patch.object(Stock, 'recalcular_vencimientos') as recalcular:
+            self.producto.precio_venta = Decimal('120')
+            self.producto.save()
+            # Una categoría con el mismo id que un producto no dispara nada
+            categoria, _ = Categoria.objects.get_or_create(id=self.producto.id, defaults={'nombre': 'Otra'})
+            categoria.nombre = 'Lácteos frescos'
+            categoria.save()
+        recalcular.assert_not_called()
+
+
+class DescontarFifoTests(TestCase):
+    """descontar_fifo: orden FIFO, errores, camino rápido vs bloqueante y rollback."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(6)
+        ]
+        for producto in cls.productos:
+            Stock.objects.create(producto=producto, sub_ubicacion=cls.sub, cantidad=10)
+
+    def _demandas(self, cantidad_pares, cantidad=1):
+        return [
+            {'producto': producto, 'sub_ubicacion': self.sub, 'cantidad': cantidad}
+            for producto in self.productos[:cantidad_pares]
+        ]
+
+    def _updates_de_stock(self, demandas):
+        with CaptureQueriesContext(connection) as contexto:
+            services.descontar_fifo(demandas)
+        return [q for q in contexto.captured_queries if q['sql'].startswith('UPDATE "inventory_stock"')]
+
+    def test_consume_lotes_en_orden_fifo(self):
+        hoy = timezone.localdate()
+        producto = self.productos[0]
+        Stock.objects.filter(producto=producto).delete()
+        nuevo = Stock.objects.create(producto=producto, sub_ubicacion=self.sub, cantidad=5, lote='B',
+                                     fecha_ingreso=hoy)
+        viejo = Stock.objects.create(producto=producto, sub_ubicacion=self.sub, cantidad=5, lote='A',
+                                     fecha_ingreso=hoy - timedelta(days=3))
+        sin_fecha = Stock.objects.create(producto=producto, sub_ubicacion=self.sub, cantidad=5, lote='C')
+        resumen.reconstruir()
+
+        asignaciones = services.descontar_fifo(
+            [{'producto': producto.id, 'sub_ubicacion': self.sub.id, 'cantidad': 12}], tipo='venta'
+        )
+        self.assertEqual(
+            [(c['lote'], c['cantidad']) for c in asignaciones[0]],
+            [('A', Decimal('5.000')), ('B', Decimal('5.000')), ('C', Decimal('2.000'))],
+        )
+        for stock, esperado in ((viejo, 0), (nuevo, 0), (sin_fecha, 3)):
+            stock.refresh_from_db()
+            self.assertEqual(stock.cantidad, esperado)
+        movimientos = StockMovimiento.objects.filter(tipo='venta', producto=producto)
+        self.assertEqual(movimientos.aggregate(total=Sum('cantidad'))['total'], -12)
+        self.assertFalse(any(resumen.verificar().values()))
+
+    def test_mensajes_de_stock_insuficiente(self):
+        with self.assertRaisesMessage(
+            services.StockInsuficiente,
+            'Stock insuficiente de Producto 0 en Góndola. Disponible: 10.000, requerido: 11.000.',
+        ):
+            services.descontar_fifo(self._demandas(1, cantidad=11))
+
+        otra = SubUbicacion.objects.create(ubicacion=self.sucursal, nombre='Cámara', tipo='ambiente')
+        with self.assertRaisesMessage(services.StockInsuficiente, 'No hay stock de Producto 0 en Cámara'):
+            services.descontar_fifo([{'producto': self.productos[0].id, 'sub_ubicacion': otra.id, 'cantidad': 1}])
+
+    def test_camino_rapido_solo_con_un_par(self):
+        condicional = mock.patch.object(services, 'decrementar_condicional', wraps=services.decrementar_condicional)
+        # Un par (aunque venga en dos demandas): un único UPDATE condicional
+        with condicional as espia:
+            self.assertEqual(len(self._updates_de_stock(self._demandas(1) * 2)), 1)
+        espia.assert_called_once()
+        # Varios pares: ningún UPDATE condicional, un solo bulk_update
+        with condicional as espia:
+            self.assertEqual(len(self._updates_de_stock(self._demandas(3))), 1)
+        espia.assert_not_called()
+        self.assertEqual(Stock.objects.get(producto=self.productos[0]).cantidad, 7)
+        self.assertEqual(Stock.objects.get(producto=self.productos[2]).cantidad, 9)
+
+    def test_varios_pares_bloquean_todo_en_orden_de_id_antes_de_escribir(self):
+        demandas = list(reversed(self._demandas(4)))
+        with CaptureQueriesContext(connection) as contexto:
+            services.descontar_fifo(demandas)
+        de_stock = [q['sql'] for q in contexto.captured_queries if '"inventory_stock"' in q['sql'].split(' WHERE ')[0]]
+        # Una lectura (SELECT ... FOR UPDATE en MySQL/PostgreSQL) ordenada por
+        # id y después la única escritura; lo que sigue es el resumen
+        escrituras = [i for i, sql in enumerate(de_stock) if sql.startswith('UPDATE')]
+        self.assertEqual(escrituras, [1])
+        self.assertTrue(de_stock[0].startswith('SELECT'))
+        self.assertIn('ORDER BY "inventory_stock"."id" ASC', de_stock[0])
+
+    def test_falla_no_deja_descuentos(self):
+        demandas = self._demandas(2)
+        demandas[1]['cantidad'] = 50
+        with self.assertRaises(services.StockInsuficiente):
+            with transaction.atomic():
+                services.descontar_fifo(demandas)
+        self.assertEqual(Stock.objects.get(producto=self.productos[0]).cantidad, 10)
+        self.assertFalse(StockMovimiento.objects.exists())
+
+        # Un par con stock insuficiente: el UPDATE condicional no actualiza y
+        # el par sigue por el camino bloqueante, que informa el faltante
+        with self.assertRaisesMessage(services.StockInsuficiente, 'Disponible: 10.000, requerido: 50.000.'):
+            services.descontar_fifo(demandas[1:])
+        self.assertFalse(StockMovimiento.objects.exists())
+
+
+class LibroStockTests(TestCase):
+    """stock_a_fecha reproduce el saldo de un día pasado desde el último snapshot."""
+
+    @classmethod
+    def setUpTestData(cls):
+        sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=sucursal, nombre='Góndola', tipo='ambiente')
+        cls.producto = Producto.objects.create(
+            nombre='Yerba', categoria=Categoria.objects.create(nombre='Almacén'), tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.stock = Stock.objects.create(producto=cls.producto, sub_ubicacion=cls.sub, cantidad=65, lote='L1')
+        hoy = timezone.localdate()
+        cls.dias = [hoy - timedelta(days=n) for n in (5, 4, 3, 2, 1)]
+        # Cada delta a media tarde de su día: el saldo actual (65) es la suma del libro
+        deltas = [100, 0, -20, -10, -5]
+        ledger.registrar([
+            ledger.movimiento(cls.stock, delta, 'ajuste', fecha=ledger.fin_del_dia(dia) - timedelta(hours=8))
+            for dia, delta in zip(cls.dias, deltas)
+        ], resumir=False)
+
+    def _saldo(self, fecha):
+        return sum((fila['cantidad'] for fila in ledger.stock_a_fecha(fecha, producto_id=self.producto.id)),
+                   ledger.CERO)
+
+    def test_snapshot_mas_tramo_de_movimientos(self):
+        # Sin snapshot se suma el libro completo
+        self.assertEqual(self._saldo(self.dias[3]), 70)
+
+        self.assertEqual(ledger.tomar_snapshot(self.dias[1]), 1)
+        self.assertEqual(StockSnapshot.objects.get(fecha=self.dias[1]).cantidad, 100)
+        # Desde el snapshot: 100 - 20 - 10
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(self._saldo(self.dias[3]), 70)
+        self.assertEqual(len(contexto), 3)
+        self.assertEqual(self._saldo(self.dias[1]), 100)
+        self.assertEqual(self._saldo(self.dias[0] - timedelta(days=1)), 0)
+
+        # Hasta hoy coincide con Stock
+        self.assertEqual(self._saldo(timezone.localdate()), Stock.objects.get(id=self.stock.id).cantidad)
+        fila = ledger.stock_a_fecha(timezone.localdate(), sub_ubicacion_id=self.sub.id)[0]
+        self.assertEqual((fila['stock_id'], fila['lote']), (self.stock.id, 'L1'))
+
+    def test_snapshot_reemplaza_el_del_mismo_dia(self):
+        ledger.tomar_snapshot(self.dias[2])
+        ledger.tomar_snapshot(self.dias[2])
+        self.assertEqual(StockSnapshot.objects.get().cantidad, 80)
+
+
+class ArchivoLotesTests(TestCase):
+    """archivar_lotes mueve a StockArchivado sólo los lotes agotados fuera de la retención."""
+
+    @classmethod
+    def setUpTestData(cls):
+        sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=sucursal, nombre='Heladera', tipo='heladera')
+        categoria = Categoria.objects.create(nombre='Lácteos')
+        cls.leche, cls.yogur = [
+            Producto.objects.create(
+                nombre=nombre, categoria=categoria, tipo_conservacion='heladera',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'), dias_caducidad=20,
+            )
+            for nombre in ('Leche', 'Yogur')
+        ]
+        cls.viejo = timezone.now() - timedelta(days=40)
+        cls.lotes = {}
+        for producto, lote, cantidad, dias in (
+            (cls.leche, 'A', 0, 40),     # se archiva
+            (cls.leche, 'B', 0, 10),     # dentro de la retención
+            (cls.leche, 'C', 5, 40),     # todavía tiene stock
+            (cls.leche, None, 0, 40),    # consolidado
+            (cls.yogur, 'Y', 0, 40),     # se archiva y era el único lote del par
+        ):
+            stock = Stock.objects.create(producto=producto, sub_ubicacion=cls.sub, cantidad=cantidad, lote=lote,
+                                         fecha_ingreso=timezone.localdate() - timedelta(days=dias))
+            Stock.objects.filter(id=stock.id).update(ultima_actualizacion=timezone.now() - timedelta(days=dias))
+            cls.lotes[lote] = stock
+        resumen.reconstruir()
+
+    def _archivar(self, *argumentos):
+        salida = io.StringIO()
+        call_command('archivar_lotes', *argumentos, stdout=salida)
+        return salida.getvalue()
+
+    def test_archiva_solo_lotes_agotados_fuera_de_la_retencion(self):
+        self.assertIn('2 lotes archivados', self._archivar('--tanda', '1'))
+
+        archivados = {a.lote: a for a in StockArchivado.objects.all()}
+        self.assertEqual(set(archivados), {'A', 'Y'})
+        self.assertEqual(archivados['A'].id, self.lotes['A'].id)
+        self.assertEqual(archivados['A'].fecha_vencimiento, self.lotes['A'].fecha_vencimiento)
+        self.assertEqual(set(Stock.objects.values_list('lote', flat=True)), {'B', 'C', None})
+
+        # El par que se quedó sin registros pierde su fila de resumen; el otro no cambia
+        self.assertEqual(list(StockResumen.objects.values_list('producto_id', 'cantidad', 'lotes')),
+                         [(self.leche.id, Decimal('5'), 1)])
+        self.assertFalse(any(resumen.verificar().values()))
+
+        # Con una retención menor entra también el lote de hace 10 días
+        self.assertIn('1 lotes archivados', self._archivar('--dias', '5'))
+        self.assertIn(self.lotes['B'].id, set(StockArchivado.objects.values_list('id', flat=True)))
+
+    def test_referencias_se_resuelven_en_el_archivo(self):
+        archivo.archivar_lotes_agotados()
+        lotes = archivo.resolver_lotes([self.lotes['A'].id, self.lotes['C'].id, 999999])
+        self.assertIsInstance(lotes[self.lotes['A'].id], StockArchivado)
+        self.assertIsInstance(lotes[self.lotes['C'].id], Stock)
+        self.assertNotIn(999999, lotes)
+
+        self.assertIsInstance(archivo.buscar_lote(self.leche.id, self.sub.id, 'A'), StockArchivado)
+        self.assertIsInstance(archivo.buscar_lote(self.leche.id, self.sub.id, 'C'), Stock)
+        self.assertIsNone(archivo.buscar_lote(self.leche.id, self.sub.id, 'Z'))
+
+    def test_lote_restaurado_se_vuelve_a_archivar(self):
+        archivo.archivar_lotes_agotados()
+        original = StockArchivado.objects.get(id=self.lotes['A'].id)
+        restaurado = Stock.objects.create(id=original.id, producto=self.leche, sub_ubicacion=self.sub,
+                                          cantidad=0, lote='A', fecha_ingreso=timezone.localdate())
+        Stock.objects.filter(id=restaurado.id).update(ultima_actualizacion=self.viejo)
+
+        self.assertEqual(archivo.archivar_lotes_agotados(), 1)
+        self.assertEqual(StockArchivado.objects.get(id=original.id).fecha_ingreso, timezone.localdate())
+        self.assertEqual(StockArchivado.objects.count(), 2)
+
+    def test_parametros_invalidos(self):
+        with self.assertRaises(CommandError):
+            self._archivar('--tanda', '0')
+
+
+class RecepcionPedidoTests(TestCase):
+    """marcar_como_recibido reparte los items según destinos y suma stock una sola vez."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.gondola = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        cls.deposito = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Depósito', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.fideos = Producto.objects.create(
+            nombre='Fideos', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.leche = Producto.objects.create(
+            nombre='Leche', categoria=categoria, tipo_conservacion='ambiente', dias_caducidad=10,
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.existente = Stock.objects.create(producto=cls.fideos, sub_ubicacion=cls.gondola, cantidad=10)
+        resumen.reconstruir()
+
+    def setUp(self):
+        self.pedido = Pedido.objects.create(creado_por=self.admin, destino=self.sucursal, estado='aprobado')
+        PedidoItem.objects.bulk_create([
+            PedidoItem(pedido=self.pedido, producto=producto, cantidad=cantidad, precio_costo_momento=Decimal('60'))
+            for producto, cantidad in ((self.fideos, 5), (self.fideos, 3), (self.leche, 4), (self.leche, 2))
+        ])
+        self.items = list(self.pedido.items.order_by('id'))
+
+    def _destinos(self):
+        subs = (self.gondola, self.deposito, self.gondola, self.gondola)
+        return {item.id: sub.id for item, sub in zip(self.items, subs)}
+
+    def test_reparte_por_sub_ubicacion_y_consolida(self):
+        self.pedido.marcar_como_recibido(usuario=self.admin, destinos=self._destinos())
+
+        self.assertEqual(Pedido.objects.get(id=self.pedido.id).estado, 'recibido')
+        self.assertEqual(
+            list(self.pedido.items.order_by('id').values_list('sub_ubicacion_destino_id', flat=True)),
+            [self.gondola.id, self.deposito.id, self.gondola.id, self.gondola.id],
+        )
+        # Sin caducidad: se suma al lote consolidado existente o se crea uno por sub-ubicación
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.cantidad, 15)
+        self.assertEqual(Stock.objects.get(producto=self.fideos, sub_ubicacion=self.deposito, lote=None).cantidad, 3)
+        # Con caducidad: un lote nuevo por item, con vencimiento
+        lotes = list(Stock.objects.filter(producto=self.leche).order_by('lote'))
+        self.assertEqual([lote.cantidad for lote in lotes], [4, 2])
+        self.assertEqual(len({lote.lote for lote in lotes}), 2)
+        self.assertTrue(all(lote.fecha_vencimiento for lote in lotes))
+
+        ingresos = StockMovimiento.objects.filter(tipo='pedido_ingreso', referencia_id=self.pedido.id)
+        self.assertEqual(ingresos.aggregate(total=Sum('cantidad'))['total'], 14)
+        self.assertFalse(any(resumen.verificar().values()))
+
+    def test_segunda_recepcion_rechazada(self):
+        self.pedido.marcar_como_recibido(usuario=self.admin, destinos=self._destinos())
+        with self.assertRaisesMessage(Exception, 'Solo se pueden recibir pedidos que estén en estado Aprobado.'):
+            Pedido.objects.get(id=self.pedido.id).marcar_como_recibido(usuario=self.admin, destinos=self._destinos())
+        self.assertEqual(Stock.objects.get(id=self.existente.id).cantidad, 15)
+        self.assertEqual(Stock.objects.filter(producto=self.leche).count(), 2)
+
+    def test_item_ajeno_no_recibe_nada(self):
+        destinos = self._destinos()
+        destinos[0] = self.gondola.id
+        with self.assertRaisesMessage(Exception, f'El item con id 0 no pertenece al pedido {self.pedido.id}'):
+            self.pedido.marcar_como_recibido(usuario=self.admin, destinos=destinos)
+        self.assertEqual(Pedido.objects.get(id=self.pedido.id).estado, 'aprobado')
+        self.assertFalse(StockMovimiento.objects.exists())
+
+
+class RemitoStorageTests(TestCase):
+    """Cada versión del remito tiene su archivo; las viejas se borran fuera del request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        producto = Producto.objects.create(
+            nombre='Agua', categoria=Categoria.objects.create(nombre='Bebidas'), tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.pedido = Pedido.objects.create(creado_por=cls.admin, destino=cls.sucursal, estado='pendiente')
+        PedidoItem.objects.create(pedido=cls.pedido, producto=producto, cantidad=3, precio_costo_momento=Decimal('60'))
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        configuracion = override_settings(MEDIA_ROOT=media)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def test_versiones_y_limpieza(self):
+        anterior = utils.obtener_remito(self.pedido)
+        self.assertEqual(utils.obtener_remito(self.pedido), anterior)
+
+        self.pedido.transicionar('pendiente', 'aprobado')
+        actual = utils.obtener_remito(self.pedido)
+        self.assertNotEqual(actual, anterior)
+        # Generar la versión nueva no borra la que otro request podría estar sirviendo
+        self.assertTrue(default_storage.exists(anterior))
+
+        self.assertEqual(utils.limpiar_remitos(), 1)
+        self.assertFalse(default_storage.exists(anterior))
+        self.assertTrue(default_storage.exists(actual))
+        self.assertEqual(utils.limpiar_remitos(), 0)
+
+    def test_exportar_por_http_sin_pool(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.admin)
+        with mock.patch.object(utils, 'ProcessPoolExecutor', side_effect=AssertionError('pool en un request')):
+            respuesta = cliente.get('/api/inventory/pedidos/exportar_remitos/', {'estado': 'pendiente'})
+            contenido = b''.join(respuesta.streaming_content)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(zipfile.ZipFile(io.BytesIO(contenido)).namelist(), [f'remito_{self.pedido.id}.pdf'])
+
+        respuesta = cliente.get('/api/inventory/pedidos/exportar_remitos/', {'fecha_desde': '2026-13-01'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class PlanificadorTests(TestCase):
+    """Las cantidades planificadas se mantienen en Decimal; la respuesta las da como texto exacto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        destino = Ubicacion.objects.create(nombre='Destino', tipo='sucursal')
+        origen = Ubicacion.objects.create(nombre='Origen', tipo='sucursal')
+        cls.subs = [
+            SubUbicacion.objects.create(ubicacion=origen, nombre=nombre, tipo='ambiente')
+            for nombre in ('Góndola', 'Depósito', 'Cámara')
+        ]
+        categoria = Categoria.objects.create(nombre='Fiambres')
+        cls.queso = Producto.objects.create(
+            nombre='Queso', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.jamon = Producto.objects.create(
+            nombre='Jamón', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        hoy = timezone.localdate()
+        for dias, sub, cantidad in ((3, 0, '0.1'), (2, 1, '0.2'), (1, 2, '5')):
+            Stock.objects.create(producto=cls.queso, sub_ubicacion=cls.subs[sub], cantidad=Decimal(cantidad),
+                                 lote=f'Q{dias}', fecha_ingreso=hoy - timedelta(days=dias))
+        Stock.objects.create(producto=cls.jamon, sub_ubicacion=cls.subs[0], cantidad=4)
+        cls.pedido = Pedido.objects.create(creado_por=admin, destino=destino, estado='pendiente')
+        PedidoItem.objects.create(pedido=cls.pedido, producto=cls.queso, cantidad=1, precio_costo_momento=Decimal('60'))
+        PedidoItem.objects.create(pedido=cls.pedido, producto=cls.jamon, cantidad=2, precio_costo_momento=Decimal('60'))
+
+    def test_cantidades_exactas(self):
+        items = list(PedidoItem.objects.filter(pedido=self.pedido)
+                     .values('id', 'producto_id', 'producto__nombre', 'cantidad').order_by('id'))
+        lotes, nombres = planificador.leer_lotes({item['producto_id'] for item in items})
+        plan = planificador.planificar(items, lotes, nombres, self.pedido.destino_id)
+        queso = [origen['cantidad'] for origen in plan['items'][0]['sub_ubicaciones_origen']]
+        self.assertEqual(queso, [Decimal('0.1'), Decimal('0.2'), Decimal('0.7')])
+        self.assertTrue(all(isinstance(cantidad, Decimal) for cantidad in queso))
+        self.assertEqual(sum(queso), 1)
+
+        respuesta = planificador.planificar_origenes(self.pedido)
+        self.assertEqual(
+            [origen['cantidad'] for origen in respuesta['items'][0]['sub_ubicaciones_origen']],
+            ['0.1', '0.2', '0.7'],
+        )
+        jamon = respuesta['items'][1]['sub_ubicaciones_origen']
+        self.assertEqual(jamon, [{'sub_ubicacion': self.subs[0].id, 'sub_ubicacion_nombre': 'Góndola', 'cantidad': '2'}])
+
+    def test_el_plan_se_envia_tal_cual_a_aprobar(self):
+        # 0.3 + 0.6 + 0.1 como floats da 0.9999999999999999
+        salame = Producto.objects.create(
+            nombre='Salame', categoria=self.queso.categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        hoy = timezone.localdate()
+        for dias, sub, cantidad in ((3, 0, '0.3'), (2, 1, '0.6'), (1, 2, '5')):
+            Stock.objects.create(producto=salame, sub_ubicacion=self.subs[sub], cantidad=Decimal(cantidad),
+                                 lote=f'S{dias}', fecha_ingreso=hoy - timedelta(days=dias))
+        pedido = Pedido.objects.create(creado_por=self.pedido.creado_por, destino=self.pedido.destino,
+                                       estado='pendiente')
+        PedidoItem.objects.create(pedido=pedido, producto=salame, cantidad=1, precio_costo_momento=Decimal('60'))
+
+        client = APIClient()
+        client.force_authenticate(pedido.creado_por)
+        plan = client.get(f'/api/inventory/pedidos/{pedido.id}/planificar_origen/').json()
+        self.assertEqual([origen['cantidad'] for origen in plan['items'][0]['sub_ubicaciones_origen']],
+                         ['0.3', '0.6', '0.1'])
+
+        respuesta = client.post(f'/api/inventory/pedidos/{pedido.id}/aprobar/', plan, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual(
+            sorted(Stock.objects.filter(producto=salame).values_list('lote', 'cantidad')),
+            [('S1', Decimal('4.9')), ('S2', Decimal('0')), ('S3', Decimal('0'))],
+        )
+        self.assertEqual(PedidoItemOrigen.objects.filter(pedido_item__pedido=pedido).count(), 3)
+
+
+class AprobacionLoteTests(TestCase):
+    """Un lote parcialmente factible aprueba lo que alcanza e informa el resto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.almacen = Ubicacion.objects.create(nombre='Almacén', tipo='almacen')
+        cls.deposito = SubUbicacion.objects.create(ubicacion=cls.almacen, nombre='Depósito', tipo='ambiente')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.producto = Producto.objects.create(
+            nombre='Agua', categoria=Categoria.objects.create(nombre='Bebidas'), tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.stock = Stock.objects.create(producto=cls.producto, sub_ubicacion=cls.deposito, cantidad=10)
+        resumen.reconstruir()
+
+    def _pedido(self, cantidad):
+        pedido = Pedido.objects.create(creado_por=self.admin, destino=self.sucursal, estado='pendiente')
+        item = PedidoItem.objects.create(
+            pedido=pedido, producto=self.producto, cantidad=cantidad, precio_costo_momento=Decimal('60')
+        )
+        return pedido, item
+
+    def _manual(self, pedido, item):
+        return {'id': pedido.id, 'items': [{
+            'id': item.id, 'origen_tipo': 'sucursal', 'origen_sucursal': self.almacen.id,
+            'sub_ubicaciones_origen': [{'sub_ubicacion': self.deposito.id, 'cantidad': item.cantidad}],
+        }]}
+
+    def test_lote_parcialmente_factible(self):
+        primero, segundo, tercero = self._pedido(6), self._pedido(6), self._pedido(4)
+        cliente = APIClient()
+        cliente.force_authenticate(self.admin)
+        respuesta = cliente.post('/api/inventory/pedidos/aprobar_lote/', {'pedidos': [
+            self._manual(*primero), self._manual(*segundo), {'id': tercero[0].id, 'auto': True},
+        ]}, format='json')
+
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual((respuesta.data['aprobados'], respuesta.data['fallidos']), (2, 1))
+        self.assertEqual([r['ok'] for r in respuesta.data['resultados']], [True, False, True])
+        self.assertIn('Stock insuficiente', respuesta.data['resultados'][1]['error'])
+        self.assertEqual(
+            dict(Pedido.objects.filter(id__in=[p.id for p, _ in (primero, segundo, tercero)]).values_list('id', 'estado')),
+            {primero[0].id: 'aprobado', segundo[0].id: 'pendiente', tercero[0].id: 'aprobado'},
+        )
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad, 0)
+        salidas = StockMovimiento.objects.filter(tipo='pedido_salida')
+        self.assertEqual(dict(salidas.values_list('referencia_id').annotate(total=Sum('cantidad'))),
+                         {primero[0].id: -6, tercero[0].id: -4})
+        self.assertFalse(any(resumen.verificar().values()))
+
+    def test_ids_como_texto(self):
+        (pedido, item), (invalido, item_invalido) = self._pedido(3), self._pedido(1)
+        texto = self._manual(pedido, item)
+        texto['items'][0]['origen_sucursal'] = str(self.almacen.id)
+        texto['items'][0]['sub_ubicaciones_origen'][0]['sub_ubicacion'] = str(self.deposito.id)
+        malo = self._manual(invalido, item_invalido)
+        malo['items'][0]['sub_ubicaciones_origen'][0]['sub_ubicacion'] = 'depósito'
+
+        cliente = APIClient()
+        cliente.force_authenticate(self.admin)
+        respuesta = cliente.post('/api/inventory/pedidos/aprobar_lote/', {'pedidos': [texto, malo]}, format='json')
+
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual([r['ok'] for r in respuesta.data['resultados']], [True, False])
+        self.assertIn('sub_ubicacion inválido', respuesta.data['resultados'][1]['error'])
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad, 7)
+        item.refresh_from_db()
+        self.assertEqual(item.sub_ubicacion_origen_id, self.deposito.id)
+
+
+class MigracionOrigenesTests(TransactionTestCase):
+    """0016 pasa el JSON de orígenes a PedidoItemOrigen y lo reconstruye al revertir."""
+
+    antes = [('inventory', '0015_pedido_indexes')]
+    despues = [('inventory', '0016_pedidoitemorigen')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def _migrar(self, destino):
+        # El estado que devuelve migrate() refleja también las apps que dependen de inventory
+        return MigrationExecutor(connection).migrate(destino).apps
+
+    def test_ida_y_vuelta_con_varios_origenes(self):
+        apps = self._migrar(self.antes)
+        Ubicacion = apps.get_model('locations', 'Ubicacion')
+        SubUbicacion = apps.get_model('locations', 'SubUbicacion')
+        Producto = apps.get_model('products', 'Producto')
+        Pedido = apps.get_model('inventory', 'Pedido')
+        PedidoItem = apps.get_model('inventory', 'PedidoItem')
+
+        usuario = apps.get_model('users', 'User').objects.create(username='admin_test', password='x', rol='admin')
+        origen = Ubicacion.objects.create(nombre='Origen', tipo='sucursal')
+        destino = Ubicacion.objects.create(nombre='Destino', tipo='sucursal')
+        gondola = SubUbicacion.objects.create(ubicacion=origen, nombre='Góndola', tipo='ambiente')
+        camara = SubUbicacion.objects.create(ubicacion=origen, nombre='Cámara', tipo='ambiente')
+        producto = Producto.objects.create(
+            nombre='Agua', categoria=apps.get_model('products', 'Categoria').objects.create(nombre='Bebidas'),
+            tipo_conservacion='ambiente', precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        pedido = Pedido.objects.create(creado_por=usuario, destino=destino, estado='aprobado',
+                                       origen_tipo='sucursal', origen_sucursal=origen)
+        repartido = PedidoItem.objects.create(
+            pedido=pedido, producto=producto, cantidad=4, precio_costo_momento=Decimal('60'),
+            sub_ubicacion_origen=gondola,
+            sub_ubicaciones_origen_detalle=[
+                {'sub_ubicacion_id': gondola.id, 'sub_ubicacion_nombre': 'Góndola', 'cantidad': 2.5},
+                {'sub_ubicacion_id': camara.id, 'sub_ubicacion_nombre': 'Cámara', 'cantidad': 1.5},
+            ],
+        )
+        viejo = PedidoItem.objects.create(
+            pedido=pedido, producto=producto, cantidad=3, precio_costo_momento=Decimal('60'),
+            sub_ubicacion_origen=camara,
+        )
+
+        apps = self._migrar(self.despues)
+        origenes = apps.get_model('inventory', 'PedidoItemOrigen').objects.order_by('pedido_item_id', 'sub_ubicacion_id')
+        self.assertEqual(
+            list(origenes.values_list('pedido_item_id', 'sub_ubicacion_id', 'cantidad', 'lote')),
+            [(repartido.id, gondola.id, Decimal('2.5'), None), (repartido.id, camara.id, Decimal('1.5'), None),
+             (viejo.id, camara.id, Decimal('3'), None)],
+        )
+
+        apps = self._migrar(self.antes)
+        detalles = dict(apps.get_model('inventory', 'PedidoItem').objects.values_list('id', 'sub_ubicaciones_origen_detalle'))
+        self.assertEqual(detalles[repartido.id], [
+            {'sub_ubicacion_id': gondola.id, 'sub_ubicacion_nombre': 'Góndola', 'cantidad': 2.5},
+            {'sub_ubicacion_id': camara.id, 'sub_ubicacion_nombre': 'Cámara', 'cantidad': 1.5},
+        ])
+        self.assertEqual(detalles[viejo.id], [
+            {'sub_ubicacion_id': camara.id, 'sub_ubicacion_nombre': 'Cámara', 'cantidad': 3.0},
+        ])
+
+
+class ReporteTransferenciasTests(TestCase):
+    """Agrupa lo enviado por sucursal de origen y por ruta, sin contar movimientos internos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.norte, cls.sur, cls.centro = [
+            Ubicacion.objects.create(nombre=nombre, tipo='sucursal') for nombre in ('Norte', 'Sur', 'Centro')
+        ]
+        subs = {
+            ubicacion.id: SubUbicacion.objects.create(ubicacion=ubicacion, nombre='Depósito', tipo='ambiente')
+            for ubicacion in (cls.norte, cls.sur, cls.centro)
+        }
+        producto = Producto.objects.create(
+            nombre='Agua', categoria=Categoria.objects.create(nombre='Bebidas'), tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('10'),
+        )
+        cls.hoy = timezone.localdate()
+        hace_una_semana = timezone.now() - timedelta(days=7)
+        envios = (
+            (cls.norte, cls.centro, 5, None),
+            (cls.norte, cls.centro, 3, None),
+            (cls.norte, cls.sur, 2, hace_una_semana),
+            (cls.sur, cls.centro, 4, None),
+            (cls.centro, cls.centro, 9, None),  # dentro de la misma sucursal: no es transferencia
+        )
+        for origen, destino, cantidad, fecha in envios:
+            pedido = Pedido.objects.create(creado_por=admin, destino=destino, estado='aprobado')
+            item = PedidoItem.objects.create(
+                pedido=pedido, producto=producto, cantidad=cantidad, precio_costo_momento=Decimal('10')
+            )
+            PedidoItemOrigen.objects.create(
+                pedido_item=item, sub_ubicacion=subs[origen.id], cantidad=cantidad, fecha=fecha or timezone.now()
+            )
+
+    def test_por_origen_y_por_ruta(self):
+        with self.assertNumQueries(2):
+            reporte = reporte_transferencias()
+        self.assertEqual(
+            [(fila['sucursal_nombre'], fila['cantidad'], fila['costo'], fila['pedidos']) for fila in reporte['por_origen']],
+            [('Norte', 10.0, 100.0, 3), ('Sur', 4.0, 40.0, 1)],
+        )
+        self.assertEqual(
+            [(fila['origen_nombre'], fila['destino_nombre'], fila['cantidad']) for fila in reporte['por_ruta']],
+            [('Norte', 'Sur', 2.0), ('Norte', 'Centro', 8.0), ('Sur', 'Centro', 4.0)],
+        )
+
+    def test_filtros(self):
+        reporte = reporte_transferencias(desde=self.hoy, sucursal_id=self.norte.id)
+        self.assertEqual([(f['sucursal_id'], f['cantidad']) for f in reporte['por_origen']], [(self.norte.id, 8.0)])
@@ -1,36 +1,280 @@
-from reportlab.pdfgen import canvas
+import io
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .models import Pedido, PedidoItem
+
+DIRECTORIO_REMITOS = 'remitos'
+TANDA_EXPORTACION = 200
+
 
 class RemitoPDFGenerator:
-    def __init__(self, buffer, pedido):
+    MARGEN_INFERIOR = 60
+    ALTO_FILA = 20
+    ANCHO_PRODUCTO = 280
+
+    def __init__(self, buffer, pedido, items=None):
         self.buffer = buffer
         self.pedido = pedido
+        self.items = items
         self.p = canvas.Canvas(self.buffer, pagesize=letter)
         self.width, self.height = letter
+        self.pagina = 1
 
     def generar(self):
         self._escribir_cabecera()
         self._escribir_tabla_items()
+        self._escribir_pie()
         self.p.showPage()
         self.p.save()
 
+    def _items(self):
+        if self.items is not None:
+            return self.items
+        # Usa los items precargados si el pedido vino con prefetch; si no, una sola query con su producto
+        if 'items' in getattr(self.pedido, '_prefetched_objects_cache', {}):
+            return list(self.pedido.items.all())
+        return list(self.pedido.items.select_related('producto').order_by('id'))
+
     def _escribir_cabecera(self):
+        titulo = f"REMITO DE PEDIDO #{self.pedido.id}"
+        if self.pagina > 1:
+            titulo += " (continuación)"
         self.p.setFont("Helvetica-Bold", 16)
-        self.p.drawString(100, self.height - 50, f"REMITO DE PEDIDO #{self.pedido.id}")
-        
+        self.p.drawString(100, self.height - 50, titulo)
+
         self.p.setFont("Helvetica", 12)
         self.p.drawString(100, self.height - 80, f"Destino: {self.pedido.destino.nombre}")
         self.p.drawString(100, self.height - 100, f"Fecha: {self.pedido.fecha_creacion.strftime('%d/%m/%Y')}")
         self.p.line(100, self.height - 110, 500, self.height - 110)
 
-    def _escribir_tabla_items(self):
-        y = self.height - 140
+    def _escribir_encabezado_tabla(self, y):
         self.p.setFont("Helvetica-Bold", 12)
         self.p.drawString(100, y, "Producto")
         self.p.drawString(400, y, "Cantidad")
-        
         self.p.setFont("Helvetica", 11)
-        for item in self.pedido.items.all():
-            y -= 20
-            self.p.drawString(100, y, item.producto.nombre)
-            self.p.drawString(400, y, str(item.cantidad))
\ No newline at end of file
+
+    def _escribir_pie(self):
+        self.p.setFont("Helvetica", 9)
+        self.p.drawRightString(500, 30, f"Página {self.pagina}")
+
+    def _nueva_pagina(self):
+        self._escribir_pie()
+        self.p.showPage()
+        self.pagina += 1
+        self._escribir_cabecera()
+        y = self.height - 140
+        self._escribir_encabezado_tabla(y)
+        return y
+
+    def _recortar(self, texto, ancho, fuente="Helvetica", tamano=11):
+        if stringWidth(texto, fuente, tamano) <= ancho:
+            return texto
+        while texto and stringWidth(texto + "…", fuente, tamano) > ancho:
+            texto = texto[:-1]
+        return texto + "…"
+
+    def _escribir_tabla_items(self):
+        y = self.height - 140
+        self._escribir_encabezado_tabla(y)
+
+        for item in self._items():
+            y -= self.ALTO_FILA
+            if y < self.MARGEN_INFERIOR:
+                y = self._nueva_pagina() - self.ALTO_FILA
+            self.p.drawString(100, y, self._recortar(item.producto.nombre, self.ANCHO_PRODUCTO))
+            self.p.drawString(400, y, str(item.cantidad))
+
+
+def renderizar_remito(pedido):
+    """Devuelve el PDF del remito en bytes."""
+    buffer = io.BytesIO()
+    RemitoPDFGenerator(buffer, pedido).generar()
+    return buffer.getvalue()
+
+
+def ruta_remito(pedido):
+    """Ruta en storage de la versión actual del remito: cambia con cada fecha_actualizacion."""
+    version = pedido.fecha_actualizacion.strftime('%Y%m%d%H%M%S%f')
+    return f"{DIRECTORIO_REMITOS}/{pedido.id}/{version}.pdf"
+
+
+def obtener_remito(pedido):
+    """
+    Devuelve la ruta en storage del remito del pedido, renderizándolo sólo si
+    no existe todavía para esta versión. No borra nada: cada versión tiene su
+    propio archivo, así que un request nunca pisa ni elimina el archivo que
+    otro está sirviendo. Las versiones viejas las borra limpiar_remitos().
+    """
+    ruta = ruta_remito(pedido)
+    if default_storage.exists(ruta):
+        return ruta
+    # Si otro request la guardó en paralelo, el storage elige otro nombre libre
+    return default_storage.save(ruta, ContentFile(renderizar_remito(pedido)))
+
+
+def limpiar_remitos():
+    """
+    Borra del storage los remitos que no corresponden a la versión actual de
+    su pedido (o de pedidos que ya no existen). Pensado para correr fuera de
+    los requests (cron). Devuelve la cantidad de archivos borrados.
+    """
+    if not default_storage.exists(DIRECTORIO_REMITOS):
+        return 0
+    directorios, _ = default_storage.listdir(DIRECTORIO_REMITOS)
+    pedido_ids = [int(nombre) for nombre in directorios if nombre.isdigit()]
+    vigentes = {
+        ruta_remito(SimpleNamespace(id=pedido_id, fecha_actualizacion=fecha_actualizacion))
+        for pedido_id, fecha_actualizacion in Pedido.objects.filter(id__in=pedido_ids).values_list(
+            'id', 'fecha_actualizacion'
+        )
+    }
+    borrados = 0
+    for pedido_id in pedido_ids:
+        directorio = f"{DIRECTORIO_REMITOS}/{pedido_id}"
+        _, archivos = default_storage.listdir(directorio)
+        for archivo in archivos:
+            ruta = f"{directorio}/{archivo}"
+            if ruta not in vigentes:
+                default_storage.delete(ruta)
+                borrados += 1
+    return borrados
+
+
+class _SalidaZip(io.RawIOBase):
+    """
+    Destino no posicionable para ZipFile: acumula lo escrito hasta que se
+    vacía. Como no admite seek, zipfile escribe cada entrada con descriptor
+    de datos y nunca vuelve atrás, así que el ZIP puede emitirse por partes.
+    """
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _renderizar_datos(datos):
+    """Worker del pool: renderiza un remito a partir de datos planos (sin base de datos)."""
+    pedido, items = datos
+    buffer = io.BytesIO()
+    RemitoPDFGenerator(buffer, pedido, items).generar()
+    return pedido.id, buffer.getvalue()
+
+
+def _datos_remitos(pedidos, tamano_tanda):
+    """
+    Recorre los pedidos por tandas con dos queries por tanda (cabeceras e
+    items) y devuelve, por cada uno, una tupla (pedido, items) de objetos
+    simples que se pueden pasar a otro proceso.
+    """
+    cabeceras = pedidos.values('id', 'destino__nombre', 'fecha_creacion', 'fecha_actualizacion')
+    tanda = []
+    for fila in cabeceras.iterator(chunk_size=tamano_tanda):
+        tanda.append(fila)
+        if len(tanda) == tamano_tanda:
+            yield from _armar_tanda(tanda)
+            tanda = []
+    if tanda:
+        yield from _armar_tanda(tanda)
+
+
+def _armar_tanda(tanda):
+    items = {fila['id']: [] for fila in tanda}
+    filas_items = (
+        PedidoItem.objects.filter(pedido_id__in=items)
+        .order_by('pedido_id', 'id')
+        .values_list('pedido_id', 'producto__nombre', 'cantidad')
+    )
+    for pedido_id, nombre, cantidad in filas_items:
+        items[pedido_id].append(SimpleNamespace(producto=SimpleNamespace(nombre=nombre), cantidad=cantidad))
+    for fila in tanda:
+        pedido = SimpleNamespace(
+            id=fila['id'],
+            destino=SimpleNamespace(nombre=fila['destino__nombre']),
+            fecha_creacion=fila['fecha_creacion'],
+            fecha_actualizacion=fila['fecha_actualizacion'],
+        )
+        yield pedido, items[pedido.id]
+
+
+def _remito_guardado(pedido):
+    """(pedido_id, pdf) si el remito de esta versión ya está en el storage (ver obtener_remito)."""
+    ruta = ruta_remito(pedido)
+    if not default_storage.exists(ruta):
+        return None
+    with default_storage.open(ruta, 'rb') as archivo:
+        return pedido.id, archivo.read()
+
+
+def _remitos_en_proceso(datos):
+    """Rinde (pedido_id, pdf) en el orden de entrada renderizando en el proceso actual."""
+    for pedido, items in datos:
+        yield _remito_guardado(pedido) or _renderizar_datos((pedido, items))
+
+
+def _remitos_en_paralelo(datos, procesos):
+    """
+    Rinde (pedido_id, pdf) en el orden de entrada. Los remitos que ya están en
+    el storage se leen de ahí; el resto se renderiza en un pool de procesos con
+    a lo sumo 2 * procesos trabajos en vuelo, así que en memoria nunca hay más
+    que unos pocos PDFs a la vez.
+    """
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        pendientes = deque()
+        for pedido, items in datos:
+            pendientes.append(_remito_guardado(pedido) or pool.submit(_renderizar_datos, (pedido, items)))
+            while len(pendientes) > 2 * procesos:
+                yield _resultado(pendientes.popleft())
+        while pendientes:
+            yield _resultado(pendientes.popleft())
+
+
+def _resultado(pendiente):
+    return pendiente if isinstance(pendiente, tuple) else pendiente.result()
+
+
+def exportar_remitos_zip(pedidos, procesos=None, tamano_tanda=TANDA_EXPORTACION):
+    """
+    Genera un ZIP con el remito de cada pedido del queryset, emitido por
+    partes (bytes) a medida que se renderizan: sirve tanto para
+    StreamingHttpResponse como para escribir a un archivo.
+
+    procesos: tamaño del pool de renderizado, a lo sumo
+    settings.REMITOS_MAX_PROCESOS (que es también el valor por defecto);
+    0 renderiza en el proceso actual, sin pool.
+    """
+    maximo = max(settings.REMITOS_MAX_PROCESOS, 1)
+    procesos = maximo if procesos is None else min(procesos, maximo)
+    remitos = _datos_remitos(pedidos, tamano_tanda)
+    remitos = _remitos_en_paralelo(remitos, procesos) if procesos else _remitos_en_proceso(remitos)
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        for pedido_id, pdf in remitos:
+            archivo_zip.writestr(f'remito_{pedido_id}.pdf', pdf)
+            yield salida.vaciar()
+    yield salida.vaciar()
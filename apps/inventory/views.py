@@ -1,26 +1,111 @@
-import io
+import copy
+import json
+from datetime import timedelta
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from django.db import transaction
+from django.db.models import Prefetch
 
 from apps.users.permissions import IsAdminUser
-from .models import PedidoItem, Stock
+from .models import PedidoItem, Stock, StockMovimiento, StockResumen
 from .models import Pedido
-from .serializers import PedidoSerializer, StockSerializer
-from django.http import FileResponse
-from .utils import RemitoPDFGenerator 
+from .serializers import PedidoSerializer, StockMovimientoSerializer, StockResumenSerializer, StockSerializer
+from .aprobacion import aplicar_aprobacion, aprobar_en_lote, preparar_aprobacion, registrar_origenes
+from .disponibilidad import calcular_disponibilidad
+from .planificador import planificar_origenes
+from . import ledger, resumen
+from .pagination import (
+    MovimientoKeysetPagination, StockKeysetPagination, StockResumenKeysetPagination, filtro_keyset,
+)
+from .transferencias import reporte_transferencias
+from .services import con_reintentos, descontar_fifo
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+from django.http import FileResponse, StreamingHttpResponse
+from .utils import exportar_remitos_zip, obtener_remito
+
+def fecha_param(params, nombre):
+    """Lee un parámetro YYYY-MM-DD de `params`; ValidationError si el formato es inválido."""
+    valor = params.get(nombre)
+    if not valor:
+        return None
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ValidationError({nombre: 'Debe tener formato YYYY-MM-DD.'})
+    return fecha
+
+
+def fecha_query_param(request, nombre):
+    """Lee un query param YYYY-MM-DD; ValidationError si el formato es inválido."""
+    return fecha_param(request.query_params, nombre)
+
+
+def filtrar_pedidos(qs, params):
+    """
+    Filtros del listado de pedidos: estado (uno o varios separados por coma),
+    destino, fecha_desde y fecha_hasta (YYYY-MM-DD, inclusive, sobre
+    fecha_creacion). `params` es un QueryDict o un dict; lo usan el listado,
+    exportar_remitos y el comando exportar_remitos.
+    """
+    estado = params.get('estado')
+    if estado:
+        qs = qs.filter(estado__in=[e.strip() for e in estado.split(',') if e.strip()])
+    destino = params.get('destino')
+    if destino:
+        if not str(destino).isdigit():
+            raise ValidationError({'destino': 'Debe ser un id numérico.'})
+        qs = qs.filter(destino_id=destino)
+    desde = fecha_param(params, 'fecha_desde')
+    if desde:
+        qs = qs.filter(fecha_creacion__gte=ledger.fin_del_dia(desde - timedelta(days=1)))
+    hasta = fecha_param(params, 'fecha_hasta')
+    if hasta:
+        qs = qs.filter(fecha_creacion__lt=ledger.fin_del_dia(hasta))
+    return qs
+
+
+class PedidoPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
 
 class PedidoViewSet(viewsets.ModelViewSet):
+    """
+    Listado paginado, con destino, origen e items (con su producto) precargados:
+    la cantidad de queries no depende de cuántos pedidos o items haya.
+    Filtros: estado (uno o varios separados por coma), destino, fecha_desde y
+    fecha_hasta (YYYY-MM-DD, inclusive, sobre fecha_creacion); los mismos
+    aplican a exportar_remitos.
+    """
     serializer_class = PedidoSerializer
+    pagination_class = PedidoPagination
 
     def get_queryset(self):
         user = self.request.user
-        
-        if user.is_superuser or user.rol == 'admin':
-            return Pedido.objects.all()
-        
-        return Pedido.objects.filter(destino=user.sucursal_asignada)
+        qs = Pedido.objects.select_related('destino', 'origen_sucursal').order_by('-fecha_creacion', '-id')
+        if self.action in ('list', 'retrieve'):
+            # Las acciones que modifican items los consultan por su cuenta
+            qs = qs.prefetch_related(
+                Prefetch('items', queryset=PedidoItem.objects.select_related('producto').order_by('id'))
+            )
+
+        if not (user.is_superuser or user.rol == 'admin'):
+            qs = qs.filter(destino=user.sucursal_asignada)
+
+        if self.action not in ('list', 'exportar_remitos'):
+            return qs
+        return self._filtrar(qs)
+
+    def _filtrar(self, qs):
+        return filtrar_pedidos(qs, self.request.query_params)
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -35,12 +120,9 @@ class PedidoViewSet(viewsets.ModelViewSet):
     def enviar_a_revision(self, request, pk=None):
         """Pasa el pedido de Borrador a Pendiente de Aprobación."""
         pedido = self.get_object()
-        if pedido.estado != 'borrador':
+        if not pedido.transicionar('borrador', 'pendiente'):
             return Response({'error': 'Solo pedidos en borrador pueden enviarse a revisión.'}, 
                             status=status.HTTP_400_BAD_REQUEST)
-        
-        pedido.estado = 'pendiente'
-        pedido.save()
         return Response({'status': 'Pedido enviado a revisión del administrador.'})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
@@ -80,109 +162,28 @@ class PedidoViewSet(viewsets.ModelViewSet):
 
         try:
             with transaction.atomic():
-                # Contadores para determinar el origen_tipo del pedido
-                items_distribuidor = []
-                items_sucursal = []
-                sucursales_origen_set = set()
-
-                # Procesar cada item según su origen
-                for item_data in items_data:
-                    try:
-                        item = PedidoItem.objects.get(id=item_data['id'], pedido=pedido)
-                        origen_tipo_item = item_data.get('origen_tipo', 'distribuidor')
-
-                        if origen_tipo_item == 'sucursal':
-                            items_sucursal.append(item_data)
-                            origen_sucursal_id = item_data.get('origen_sucursal')
-
-                            if not origen_sucursal_id:
-                                raise Exception(f"El producto {item.producto.nombre} marcado como 'sucursal' no tiene sucursal de origen especificada.")
-
-                            sucursales_origen_set.add(origen_sucursal_id)
-
-                            # Reutilizar lógica existente de descuento FIFO
-                            sub_ubicaciones_origen = item_data.get('sub_ubicaciones_origen', [])
-
-                            if not sub_ubicaciones_origen:
-                                raise Exception(f"El producto {item.producto.nombre} no tiene sub-ubicaciones de origen especificadas.")
-
-                            # Validar que la suma de cantidades coincide con la cantidad pedida
-                            total_cantidad = sum(ub['cantidad'] for ub in sub_ubicaciones_origen)
-                            if total_cantidad != item.cantidad:
-                                raise Exception(f"La cantidad total asignada para {item.producto.nombre} ({total_cantidad}) no coincide con la cantidad pedida ({item.cantidad})")
-
-                            # Procesar cada sub-ubicación y descontar stock usando FIFO
-                            detalles_origen = []
-                            for ub_data in sub_ubicaciones_origen:
-                                sub_ubicacion_id = ub_data['sub_ubicacion']
-                                cantidad_a_tomar = ub_data['cantidad']
-
-                                # Obtener todos los lotes del producto en esta sub-ubicación
-                                # Ordenar por fecha_ingreso (FIFO) - los sin fecha van al final
-                                stocks_disponibles = Stock.objects.filter(
-                                    producto=item.producto,
-                                    sub_ubicacion_id=sub_ubicacion_id,
-                                    cantidad__gt=0
-                                ).order_by('fecha_ingreso', 'id')
-
-                                if not stocks_disponibles.exists():
-                                    raise Exception(f"No hay stock de {item.producto.nombre} en la sub-ubicación especificada de la sucursal origen.")
-
-                                # Verificar que hay stock suficiente en total
-                                total_disponible = sum(s.cantidad for s in stocks_disponibles)
-                                if total_disponible < cantidad_a_tomar:
-                                    raise Exception(f"Stock insuficiente en la sub-ubicación para {item.producto.nombre}. Disponible: {total_disponible}, Requerido: {cantidad_a_tomar}")
-
-                                # Descontar de los lotes usando FIFO
-                                cantidad_restante = cantidad_a_tomar
-                                for stock_origen in stocks_disponibles:
-                                    if cantidad_restante <= 0:
-                                        break
-
-                                    cantidad_a_descontar = min(stock_origen.cantidad, cantidad_restante)
-                                    stock_origen.cantidad -= cantidad_a_descontar
-                                    stock_origen.save()
-
-                                    cantidad_restante -= cantidad_a_descontar
-
-                                # Guardar detalle
-                                detalles_origen.append({
-                                    'sub_ubicacion_id': sub_ubicacion_id,
-                                    'sub_ubicacion_nombre': stocks_disponibles.first().sub_ubicacion.nombre,
-                                    'cantidad': cantidad_a_tomar
-                                })
-
-                            # Guardar los detalles en el item
-                            item.sub_ubicaciones_origen_detalle = detalles_origen
-                            if detalles_origen:
-                                item.sub_ubicacion_origen_id = detalles_origen[0]['sub_ubicacion_id']
-                            item.save()
-
-                        elif origen_tipo_item == 'distribuidor':
-                            items_distribuidor.append(item_data)
-                            # No descontar stock, dejar sub_ubicaciones_origen_detalle vacío
-                            item.sub_ubicaciones_origen_detalle = None
-                            item.sub_ubicacion_origen = None
-                            item.save()
-
-                    except PedidoItem.DoesNotExist:
-                        raise Exception(f"El item con id {item_data['id']} no pertenece al pedido {pedido.id}")
-
-                # Determinar el origen_tipo del pedido
-                if len(items_sucursal) == 0:
-                    pedido.origen_tipo = 'distribuidor'
-                    pedido.origen_sucursal = None
-                elif len(items_distribuidor) == 0:
-                    pedido.origen_tipo = 'sucursal'
-                    # Usar la primera sucursal origen encontrada
-                    pedido.origen_sucursal_id = list(sucursales_origen_set)[0] if sucursales_origen_set else None
-                else:
-                    pedido.origen_tipo = 'mixto'
-                    # Para pedidos mixtos, guardar la primera sucursal origen
-                    pedido.origen_sucursal_id = list(sucursales_origen_set)[0] if sucursales_origen_set else None
-
-                pedido.estado = 'aprobado'
-                pedido.save()
+                # Gana el primero que actualiza la fila: una aprobación concurrente
+                # espera el bloqueo y después ya no encuentra el pedido pendiente
+                if not pedido.transicionar('pendiente', 'aprobado'):
+                    return Response({'error': 'Solo pedidos pendientes pueden ser aprobados.'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+                items_pedido = {
+                    item.id: item
+                    for item in pedido.items.select_related('producto')
+                }
+                plan = preparar_aprobacion(items_data, items_pedido, pedido.id)
+
+                # Descontar stock usando FIFO: un único bloqueo y bulk_update para todo el pedido
+                asignaciones = descontar_fifo(
+                    plan['demandas'], tipo='pedido_salida', referencia_id=pedido.id, usuario=request.user
+                )
+                registrar_origenes(plan['demandas'], asignaciones)
+
+                aplicar_aprobacion(pedido, plan)
+                if plan['items']:
+                    PedidoItem.objects.bulk_update(plan['items'], ['sub_ubicacion_origen'])
+                pedido.save(update_fields=['origen_tipo', 'origen_sucursal'])
 
             return Response({
                 'status': 'Pedido aprobado exitosamente.',
@@ -192,6 +193,61 @@ class PedidoViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def aprobar_lote(self, request):
+        """
+        Aprueba varios pedidos pendientes en una sola transacción.
+        Body: {"pedidos": [{"id": 1, "items": [...]}, {"id": 2, "auto": true}, ...]}
+        con items en el mismo formato que aprobar; "auto" usa planificar_origen.
+        Responde el resultado de cada pedido; los que fallan quedan pendientes.
+        """
+        solicitudes = request.data.get('pedidos')
+        if not isinstance(solicitudes, list) or not solicitudes:
+            raise ValidationError({'pedidos': 'Debe ser una lista no vacía.'})
+        if not all(isinstance(s, dict) and isinstance(s.get('id'), int) for s in solicitudes):
+            raise ValidationError({'pedidos': 'Cada pedido debe tener un id numérico.'})
+
+        def aprobar():
+            with transaction.atomic():
+                return aprobar_en_lote(solicitudes, usuario=request.user)
+
+        resultados = con_reintentos(aprobar)
+        return Response({
+            'aprobados': sum(1 for r in resultados if r['ok']),
+            'fallidos': sum(1 for r in resultados if not r['ok']),
+            'resultados': resultados,
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def transferencias(self, request):
+        """
+        Cuánto envió cada sucursal a las demás. Filtros: fecha_desde y
+        fecha_hasta (YYYY-MM-DD, inclusive, por fecha de aprobación) y
+        sucursal (id de la sucursal de origen).
+        """
+        sucursal = request.query_params.get('sucursal')
+        if sucursal and not sucursal.isdigit():
+            raise ValidationError({'sucursal': 'Debe ser un id numérico.'})
+        return Response(reporte_transferencias(
+            desde=fecha_query_param(request, 'fecha_desde'),
+            hasta=fecha_query_param(request, 'fecha_hasta'),
+            sucursal_id=int(sucursal) if sucursal else None,
+        ))
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def planificar_origen(self, request, pk=None):
+        """
+        Propone desde dónde abastecer cada item del pedido pendiente: la menor
+        cantidad de sucursales posible, lotes más viejos primero y distribuidor
+        para lo que ninguna sucursal cubre. La respuesta se puede enviar tal
+        cual como body de aprobar.
+        """
+        pedido = self.get_object()
+        if pedido.estado != 'pendiente':
+            return Response({'error': 'Solo se planifican pedidos pendientes.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(planificar_origenes(pedido))
+
     @action(detail=True, methods=['post'])
     def subir_pdf(self, request, pk=None):
         """Sube el PDF de la orden de compra al pedido."""
@@ -208,9 +264,9 @@ class PedidoViewSet(viewsets.ModelViewSet):
             return Response({'error': 'El archivo debe ser un PDF.'}, 
                             status=status.HTTP_400_BAD_REQUEST)
         
-        # Guardar el archivo
+        # Guardar el archivo (sólo esos campos: el estado pudo cambiar mientras tanto)
         pedido.pdf_archivo = pdf_file
-        pedido.save()
+        pedido.save(update_fields=['pdf_archivo', 'fecha_actualizacion'])
         
         serializer = self.get_serializer(pedido, context={'request': request})
         return Response({
@@ -222,12 +278,9 @@ class PedidoViewSet(viewsets.ModelViewSet):
     def rechazar(self, request, pk=None):
         """El Admin rechaza el pedido pendiente."""
         pedido = self.get_object()
-        if pedido.estado != 'pendiente':
+        if not pedido.transicionar('pendiente', 'rechazado'):
             return Response({'error': 'Solo pedidos pendientes pueden ser rechazados.'}, 
                             status=status.HTTP_400_BAD_REQUEST)
-        
-        pedido.estado = 'rechazado'
-        pedido.save()
         return Response({'status': 'Pedido rechazado.'})
 
     @action(detail=True, methods=['post'])
@@ -240,18 +293,9 @@ class PedidoViewSet(viewsets.ModelViewSet):
         items_data = request.data.get('items', [])
         
         try:
-            for item_update in items_data:
-                try:
-                    item = PedidoItem.objects.get(id=item_update['id'], pedido=pedido)
-                    item.sub_ubicacion_destino_id = item_update['sub_ubicacion_destino']
-                    item.save()
-                except PedidoItem.DoesNotExist:
-                    return Response(
-                        {'error': f"El item con id {item_update['id']} no pertenece al pedido {pedido.id}"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            pedido.marcar_como_recibido()
+            # Las sub-ubicaciones destino se asignan recién después de ganar la transición aprobado -> recibido
+            destinos = {item_update['id']: item_update['sub_ubicacion_destino'] for item_update in items_data}
+            pedido.marcar_como_recibido(usuario=request.user, destinos=destinos)
             return Response({'status': 'Pedido recibido y stock actualizado'}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -259,15 +303,28 @@ class PedidoViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def descargar_pdf(self, request, pk=None):
         pedido = self.get_object()
-        buffer = io.BytesIO()
-        
-        # Delegamos la responsabilidad del diseño a la clase utils
-        reporte = RemitoPDFGenerator(buffer, pedido)
-        reporte.generar()
-        
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=f'remito_{pedido.id}.pdf')
+
+        # Se renderiza una vez por versión del pedido y después se sirve desde storage
+        ruta = obtener_remito(pedido)
+        return FileResponse(default_storage.open(ruta, 'rb'), as_attachment=True, filename=f'remito_{pedido.id}.pdf')
     
+    @action(detail=False, methods=['get'])
+    def exportar_remitos(self, request):
+        """
+        Descarga en un solo ZIP los remitos de todos los pedidos que cumplen los
+        filtros del listado (estado, destino, fecha_desde, fecha_hasta). Los PDFs
+        se renderizan en el mismo proceso (sin pool: cada request es un worker
+        del servidor) y el ZIP se envía a medida que se arma; para exportaciones
+        grandes está el comando exportar_remitos.
+        """
+        pedidos = self.get_queryset()
+        if not pedidos.exists():
+            return Response({'error': 'Ningún pedido cumple los filtros.'}, status=status.HTTP_404_NOT_FOUND)
+
+        respuesta = StreamingHttpResponse(exportar_remitos_zip(pedidos, procesos=0), content_type='application/zip')
+        respuesta['Content-Disposition'] = 'attachment; filename="remitos.zip"'
+        return respuesta
+
     @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
     def disponibilidad_sucursales(self, request, pk=None):
         """
@@ -289,49 +346,45 @@ class PedidoViewSet(viewsets.ModelViewSet):
             }
         ]
         """
-        from apps.locations.models import Ubicacion
-        from django.db.models import Sum
-        
         pedido = self.get_object()
-        items = pedido.items.all()
-        
-        # Obtener todas las sucursales excepto el destino
-        sucursales = Ubicacion.objects.exclude(id=pedido.destino.id)
-        
-        resultado = []
-        
-        for suc in sucursales:
-            # Para cada sucursal, verificar si tiene stock de todos los productos requeridos
-            productos_info = []
-            puede_completar = True
-            
-            for item in items:
-                # Sumar el stock disponible en todas las sub-ubicaciones de esta sucursal para este producto
-                stock_total = Stock.objects.filter(
-                    producto=item.producto,
-                    sub_ubicacion__ubicacion=suc
-                ).aggregate(total=Sum('cantidad'))['total'] or 0
-                
-                suficiente = stock_total >= item.cantidad
-                if not suficiente:
-                    puede_completar = False
-                
-                productos_info.append({
-                    'producto_id': item.producto.id,
-                    'producto_nombre': item.producto.nombre,
-                    'cantidad_requerida': item.cantidad,
-                    'cantidad_disponible': stock_total,
-                    'suficiente': suficiente
-                })
-            
-            resultado.append({
-                'sucursal_id': suc.id,
-                'sucursal_nombre': suc.nombre,
-                'puede_completar': puede_completar,
-                'productos': productos_info
-            })
-        
-        return Response(resultado)
+        return Response(calcular_disponibilidad([pedido])[pedido.id])
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def disponibilidad_pendientes(self, request):
+        """
+        Modo batch de disponibilidad_sucursales: devuelve la matriz para todos los
+        pedidos pendientes (o los indicados con ?pedidos=1,2,3) en un solo request.
+        Retorna: [
+            {
+                "pedido_id": int,
+                "destino_id": int,
+                "destino_nombre": str,
+                "sucursales": [ ...mismo formato que disponibilidad_sucursales... ]
+            }
+        ]
+        """
+        pedidos_qs = self.get_queryset().select_related('destino').order_by('id')
+        ids = request.query_params.get('pedidos')
+        if ids:
+            try:
+                pedidos_qs = pedidos_qs.filter(id__in=[int(i) for i in ids.split(',') if i.strip()])
+            except ValueError:
+                return Response({'error': 'El parámetro pedidos debe ser una lista de ids separados por coma.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        else:
+            pedidos_qs = pedidos_qs.filter(estado='pendiente')
+
+        pedidos = list(pedidos_qs)
+        matriz = calcular_disponibilidad(pedidos)
+        return Response([
+            {
+                'pedido_id': pedido.id,
+                'destino_id': pedido.destino_id,
+                'destino_nombre': pedido.destino.nombre,
+                'sucursales': matriz[pedido.id],
+            }
+            for pedido in pedidos
+        ])
 
 class StockViewSet(viewsets.ModelViewSet):
     """
@@ -339,8 +392,19 @@ class StockViewSet(viewsets.ModelViewSet):
     Usuarios de sucursal solo ven su stock.
     Admins ven todo el stock.
     Admins pueden crear y actualizar registros de stock.
+
+    El listado se pagina por cursor (keyset) sobre (sub_ubicacion, producto, id).
+    Con ?formato=ndjson se exporta todo el resultado como NDJSON en streaming,
+    leyendo páginas por keyset de ndjson_chunk_size filas para mantener la
+    memoria acotada (iterator() no alcanza: mysqlclient trae el resultado
+    completo al cliente).
+
+    Las altas, modificaciones y bajas hechas por acá quedan registradas como
+    movimientos de tipo 'ajuste' en el libro de stock.
     """
     serializer_class = StockSerializer
+    pagination_class = StockKeysetPagination
+    ndjson_chunk_size = 2000
     
     def get_permissions(self):
         """
@@ -384,4 +448,141 @@ class StockViewSet(viewsets.ModelViewSet):
         if solo_con_stock and solo_con_stock.lower() in ['true', '1', 'yes']:
             queryset = queryset.filter(cantidad__gt=0)
         
-        return queryset
\ No newline at end of file
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('formato') == 'ndjson':
+            return self._exportar_ndjson()
+        return super().list(request, *args, **kwargs)
+
+    def _exportar_ndjson(self):
+        orden = StockKeysetPagination.ordering
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*orden)
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        tamanio = self.ndjson_chunk_size
+
+        def filas():
+            posicion = None
+            while True:
+                pagina = queryset if posicion is None else queryset.filter(filtro_keyset(orden, posicion))
+                pagina = list(pagina[:tamanio])
+                for stock in pagina:
+                    data = serializer_class(stock, context=context).data
+                    yield json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                if len(pagina) < tamanio:
+                    return
+                posicion = [getattr(pagina[-1], campo) for campo in orden]
+
+        response = StreamingHttpResponse(filas(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="stock.ndjson"'
+        return response
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            stock = serializer.save()
+            ledger.registrar([ledger.movimiento(stock, stock.cantidad, 'ajuste', usuario=self.request.user)])
+
+    def perform_update(self, serializer):
+        anterior = copy.copy(serializer.instance)
+        with transaction.atomic():
+            stock = serializer.save()
+            mismo_lote = (
+                (anterior.producto_id, anterior.sub_ubicacion_id, anterior.lote)
+                == (stock.producto_id, stock.sub_ubicacion_id, stock.lote)
+            )
+            if mismo_lote:
+                movimientos = [ledger.movimiento(
+                    stock, stock.cantidad - anterior.cantidad, 'ajuste', usuario=self.request.user
+                )]
+            else:
+                # Se reasignó el lote: sale todo de la clave anterior y entra en la nueva
+                movimientos = [
+                    ledger.movimiento(anterior, -anterior.cantidad, 'ajuste', usuario=self.request.user),
+                    ledger.movimiento(stock, stock.cantidad, 'ajuste', usuario=self.request.user),
+                ]
+            # La edición puede cambiar fechas o reasignar el lote: el resumen se recalcula, no se suma
+            ledger.registrar(movimientos, resumir=False)
+            resumen.actualizar({(m.producto_id, m.sub_ubicacion_id) for m in movimientos})
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # El movimiento se arma antes de borrar (necesita el id) y se registra
+            # después, para que el resumen ya no cuente el lote
+            movimiento = ledger.movimiento(instance, -instance.cantidad, 'ajuste', usuario=self.request.user)
+            instance.delete()
+            ledger.registrar([movimiento])
+
+    def _filtros_libro(self):
+        """Filtros de producto/sub-ubicación/ubicación para el libro, acotados por rol."""
+        params = self.request.query_params
+        filtros = {}
+        for campo, param in (('producto_id', 'producto'), ('sub_ubicacion_id', 'sub_ubicacion'),
+                             ('ubicacion_id', 'ubicacion')):
+            valor = params.get(param)
+            if valor:
+                if not valor.isdigit():
+                    raise ValidationError({param: 'Debe ser un id numérico.'})
+                filtros[campo] = int(valor)
+        user = self.request.user
+        if user.rol == 'sucursal':
+            filtros['ubicacion_id'] = user.sucursal_asignada_id or 0
+        return filtros
+
+    @action(detail=False, methods=['get'])
+    def movimientos(self, request):
+        """
+        Historial de movimientos del libro de stock, paginado por cursor.
+        Query params: producto, sub_ubicacion, ubicacion, tipo, desde, hasta
+        (fechas YYYY-MM-DD inclusive).
+        """
+        filtros = self._filtros_libro()
+        qs = ledger.filtrar(
+            StockMovimiento.objects.select_related('producto', 'sub_ubicacion', 'usuario'), **filtros
+        )
+
+        tipo = request.query_params.get('tipo')
+        if tipo:
+            qs = qs.filter(tipo=tipo)
+        desde = fecha_query_param(request, 'desde')
+        hasta = fecha_query_param(request, 'hasta')
+        if desde:
+            qs = qs.filter(fecha__gte=ledger.fin_del_dia(desde - timedelta(days=1)))
+        if hasta:
+            qs = qs.filter(fecha__lt=ledger.fin_del_dia(hasta))
+
+        paginator = MovimientoKeysetPagination()
+        pagina = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(StockMovimientoSerializer(pagina, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def resumen(self, request):
+        """
+        Totales por producto × sub-ubicación (cantidad, lotes con stock y
+        próximo vencimiento) leídos de StockResumen, paginados por cursor.
+        Query params: producto, sub_ubicacion, ubicacion; solo_con_stock.
+        """
+        qs = StockResumen.objects.select_related('producto', 'ubicacion', 'sub_ubicacion').filter(
+            **self._filtros_libro()
+        )
+        solo_con_stock = request.query_params.get('solo_con_stock')
+        if solo_con_stock and solo_con_stock.lower() in ['true', '1', 'yes']:
+            qs = qs.filter(cantidad__gt=0)
+
+        paginator = StockResumenKeysetPagination()
+        pagina = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(StockResumenSerializer(pagina, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def a_fecha(self, request):
+        """
+        Stock por lote al cierre de una fecha (?fecha=YYYY-MM-DD, requerido),
+        calculado con el último snapshot y los movimientos posteriores.
+        Acepta los mismos filtros producto, sub_ubicacion y ubicacion.
+        """
+        fecha = fecha_query_param(request, 'fecha')
+        if not fecha:
+            return Response({'error': 'El parámetro fecha es requerido (YYYY-MM-DD).'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        lotes = ledger.stock_a_fecha(fecha, **self._filtros_libro())
+        return Response({'fecha': fecha, 'lotes': lotes})
@@ -29,5 +29,13 @@ class Producto(models.Model):
         help_text="Días de caducidad desde la compra al distribuidor. Ej: 90 días = 3 meses"
     )
 
+    def save(self, *args, **kwargs):
+        anterior = Producto.objects.filter(pk=self.pk).values('dias_caducidad').first() if self.pk else None
+        super().save(*args, **kwargs)
+        if anterior is not None and anterior['dias_caducidad'] != self.dias_caducidad:
+            # Mantener sincronizado el vencimiento persistido de los lotes existentes
+            from apps.inventory.models import Stock
+            Stock.recalcular_vencimientos(self)
+
     def __str__(self):
         return self.nombre
\ No newline at end of file
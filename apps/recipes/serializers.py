@@ -1,17 +1,21 @@
 from decimal import Decimal
 
+from django.db import transaction
 from rest_framework import serializers
 
+from apps.inventory.serializers import ListaEnLote, RelacionEnLote, sincronizar_anidados
 from apps.locations.models import SubUbicacion
 
 from .models import Fabricacion, FabricacionConsumo, Receta, RecetaInsumo
 
 
 class RecetaInsumoSerializer(serializers.ModelSerializer):
+    serializer_related_field = RelacionEnLote
     producto_insumo_nombre = serializers.ReadOnlyField(source='producto_insumo.nombre')
 
     class Meta:
         model = RecetaInsumo
+        list_serializer_class = ListaEnLote
         fields = ['id', 'producto_insumo', 'producto_insumo_nombre', 'cantidad_requerida']
 
 
@@ -42,13 +46,14 @@ class RecetaSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError('El producto final no puede ser insumo de su propia receta.')
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
         insumos_data = validated_data.pop('insumos', [])
         receta = Receta.objects.create(**validated_data)
-        for item in insumos_data:
-            RecetaInsumo.objects.create(receta=receta, **item)
+        RecetaInsumo.objects.bulk_create([RecetaInsumo(receta=receta, **item) for item in insumos_data])
         return receta
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         insumos_data = validated_data.pop('insumos', None)
 
@@ -57,9 +62,14 @@ class RecetaSerializer(serializers.ModelSerializer):
         instance.save()
 
         if insumos_data is not None:
-            instance.insumos.all().delete()
-            for item in insumos_data:
-                RecetaInsumo.objects.create(receta=instance, **item)
+            # Los insumos se emparejan por producto (únicos por receta); los que
+            # no cambiaron conservan su id y las fabricaciones que los referencian
+            sincronizar_anidados(
+                RecetaInsumo.objects.filter(receta=instance).order_by('id'),
+                insumos_data,
+                clave='producto_insumo',
+                crear=lambda item: RecetaInsumo(receta=instance, **item),
+            )
 
         return instance
 
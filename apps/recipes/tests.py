@@ -1,3 +1,76 @@
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.products.models import Categoria, Producto
+
+from .models import RecetaInsumo
+from .serializers import RecetaSerializer
+
+
+class RecetaEscrituraAnidadaTests(TestCase):
+    """Crear o editar los insumos de una receta no hace una query por insumo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Panadería')
+        cls.final = Producto.objects.create(
+            nombre='Pan', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('0'), es_fabricable=True,
+        )
+        cls.insumos = [
+            Producto.objects.create(
+                nombre=f'Insumo {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('0'), costo_compra=Decimal('10'),
+            )
+            for i in range(100)
+        ]
+
+    def _insumos(self, cantidad):
+        return [
+            {'producto_insumo': insumo.id, 'cantidad_requerida': '1.500'}
+            for insumo in self.insumos[:cantidad]
+        ]
+
+    def _guardar(self, instancia, data, **kwargs):
+        serializer = RecetaSerializer(instancia, data=data, **kwargs)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            receta = serializer.save()
+        return receta, len(ctx.captured_queries)
+
+    def _ids(self, receta):
+        return list(receta.insumos.order_by('id').values_list('id', flat=True))
+
+    def test_crear_en_queries_constantes(self):
+        receta, queries_pocos = self._guardar(None, {'producto_final': self.final.id, 'insumos': self._insumos(2)})
+        receta.delete()
+        receta, queries_muchos = self._guardar(None, {'producto_final': self.final.id, 'insumos': self._insumos(100)})
+        self.assertEqual(receta.insumos.count(), 100)
+        self.assertEqual(queries_pocos, queries_muchos)
+
+    def test_editar_un_insumo_conserva_ids(self):
+        receta, _ = self._guardar(None, {'producto_final': self.final.id, 'insumos': self._insumos(100)})
+        ids = self._ids(receta)
+        insumos = self._insumos(100)
+        insumos[10]['cantidad_requerida'] = '3.000'
+
+        _, queries = self._guardar(receta, {'insumos': insumos}, partial=True)
+
+        self.assertLessEqual(queries, 8)
+        self.assertEqual(self._ids(receta), ids)
+        self.assertEqual(RecetaInsumo.objects.get(id=ids[10]).cantidad_requerida, Decimal('3.000'))
+
+    def test_quitar_y_agregar_insumos(self):
+        receta, _ = self._guardar(None, {'producto_final': self.final.id, 'insumos': self._insumos(5)})
+        ids = self._ids(receta)
+        insumos = self._insumos(5)[1:] + [{'producto_insumo': self.insumos[60].id, 'cantidad_requerida': '2.000'}]
+
+        self._guardar(receta, {'insumos': insumos}, partial=True)
 
-# Create your tests here.
+        nuevos = self._ids(receta)
+        self.assertEqual(nuevos[:4], ids[1:])
+        self.assertEqual(len(nuevos), 5)
+        self.assertEqual(RecetaInsumo.objects.get(id=nuevos[-1]).producto_insumo_id, self.insumos[60].id)
@@ -1,17 +1,16 @@
 from decimal import Decimal
-import random
-import time
 from datetime import date
 
 from django.db import transaction
-from django.db.models import Sum
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from apps.inventory import ledger
 from apps.inventory.models import Stock
+from apps.inventory.services import asignar_codigos_lote, descontar_fifo
 from apps.locations.models import SubUbicacion
 from apps.users.permissions import IsAdminUser
 
@@ -87,53 +86,55 @@ class RecetaViewSet(viewsets.ModelViewSet):
                     creado_por=user,
                 )
 
-                for receta_insumo in receta.insumos.select_related('producto_insumo').all():
+                insumos = list(receta.insumos.select_related('producto_insumo').all())
+                origen_ids = {
+                    receta_insumo.id: sub_origen_map.get(str(receta_insumo.id)) or sub_origen_map.get(receta_insumo.id)
+                    for receta_insumo in insumos
+                }
+                subs_origen = SubUbicacion.objects.select_related('ubicacion').in_bulk(
+                    [origen_id for origen_id in origen_ids.values() if origen_id]
+                )
+
+                demandas = []
+                for receta_insumo in insumos:
                     required_qty = (Decimal(receta_insumo.cantidad_requerida) * Decimal(cantidad_producir)).quantize(Decimal('0.001'))
-                    origen_id = sub_origen_map.get(str(receta_insumo.id)) or sub_origen_map.get(receta_insumo.id)
+                    origen_id = origen_ids[receta_insumo.id]
                     if not origen_id:
                         raise ValueError(f'Falta sub-ubicación origen para el insumo {receta_insumo.producto_insumo.nombre}.')
 
-                    sub_origen = SubUbicacion.objects.select_related('ubicacion').filter(id=origen_id).first()
+                    sub_origen = subs_origen.get(origen_id)
                     if not sub_origen:
                         raise ValueError(f'Sub-ubicación origen inválida para {receta_insumo.producto_insumo.nombre}.')
 
                     if user.rol == 'sucursal' and sub_origen.ubicacion_id != user.sucursal_asignada_id:
                         raise PermissionError('Solo podés consumir insumos de tu sucursal.')
 
-                    stocks = Stock.objects.select_for_update().filter(
-                        producto=receta_insumo.producto_insumo,
-                        sub_ubicacion=sub_origen,
-                        cantidad__gt=0,
-                    ).order_by('fecha_ingreso', 'id')
-
-                    total_disponible = stocks.aggregate(total=Sum('cantidad'))['total'] or Decimal('0.000')
-                    if total_disponible < required_qty:
-                        raise ValueError(
-                            f'Stock insuficiente de {receta_insumo.producto_insumo.nombre}. Disponible: {total_disponible}, requerido: {required_qty}.'
-                        )
-
-                    restante = required_qty
-                    for stock_item in stocks:
-                        if restante <= 0:
-                            break
-
-                        consumir = min(Decimal(stock_item.cantidad), restante)
-                        stock_item.cantidad = (Decimal(stock_item.cantidad) - consumir).quantize(Decimal('0.001'))
-                        stock_item.save(update_fields=['cantidad', 'ultima_actualizacion'])
-
-                        FabricacionConsumo.objects.create(
-                            fabricacion=fabricacion,
-                            receta_insumo=receta_insumo,
-                            sub_ubicacion_origen=sub_origen,
-                            lote=stock_item.lote,
-                            cantidad_consumida=consumir,
-                        )
-                        restante -= consumir
+                    demandas.append({
+                        'producto': receta_insumo.producto_insumo,
+                        'sub_ubicacion': sub_origen,
+                        'cantidad': required_qty,
+                    })
+
+                # Descuento FIFO de todos los insumos con un único bloqueo de lotes
+                asignaciones = descontar_fifo(
+                    demandas, tipo='fabricacion_consumo', referencia_id=fabricacion.id, usuario=user
+                )
+
+                FabricacionConsumo.objects.bulk_create([
+                    FabricacionConsumo(
+                        fabricacion=fabricacion,
+                        receta_insumo=receta_insumo,
+                        sub_ubicacion_origen_id=consumo['sub_ubicacion_id'],
+                        lote=consumo['lote'],
+                        cantidad_consumida=consumo['cantidad'],
+                    )
+                    for receta_insumo, consumos in zip(insumos, asignaciones)
+                    for consumo in consumos
+                ])
 
                 # Alta de stock del producto final
                 if receta.producto_final.dias_caducidad:
-                    timestamp = int(time.time() * 1000)
-                    lote = f'FAB-{timestamp}-{random.randint(1000, 9999)}'
+                    lote = asignar_codigos_lote('FAB', 1)[0]
                     stock_final = Stock.objects.create(
                         producto=receta.producto_final,
                         sub_ubicacion=sub_destino,
@@ -151,6 +152,10 @@ class RecetaViewSet(viewsets.ModelViewSet):
                     stock_final.cantidad = (Decimal(stock_final.cantidad) + Decimal(cantidad_producir)).quantize(Decimal('0.001'))
                     stock_final.save(update_fields=['cantidad', 'ultima_actualizacion'])
 
+                ledger.registrar([ledger.movimiento(
+                    stock_final, cantidad_producir, 'fabricacion_alta', referencia_id=fabricacion.id, usuario=user
+                )])
+
                 response_data = FabricacionSerializer(fabricacion).data
                 response_data['stock_generado_id'] = stock_final.id
                 return Response(response_data, status=status.HTTP_201_CREATED)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Venta, VentaItem
+from .models import Venta, VentaDiaria, VentaDiariaSucursal, VentaItem
 
 # Register your models here.
 class VentaItemInline(admin.TabularInline):
@@ -13,3 +13,14 @@ class VentaAdmin(admin.ModelAdmin):
     list_filter = ('fecha', 'sucursal')
     search_fields = ('vendedor__username',)
     inlines = [VentaItemInline]
+
+@admin.register(VentaDiaria)
+class VentaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'sucursal', 'producto', 'unidades', 'total', 'tickets')
+    list_filter = ('fecha', 'sucursal')
+    search_fields = ('producto__nombre',)
+
+@admin.register(VentaDiariaSucursal)
+class VentaDiariaSucursalAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'sucursal', 'tickets', 'unidades', 'total')
+    list_filter = ('fecha', 'sucursal')
@@ -0,0 +1,92 @@
+"""
+Cache de los resultados del dashboard y del reporte económico.
+
+La clave se arma con los parámetros del cálculo y la versión de los datos
+(apps.inventory.cambios): cualquier escritura de ventas, stock, pedidos o
+fabricaciones cambia la versión y las entradas anteriores dejan de leerse
+(expiran solas por TTL).
+
+Single-flight: ante un miss sólo el request que toma el candado (cache.add,
+atómico en Redis, Memcached y LocMem) calcula; los idénticos que llegan mientras
+tanto esperan a que aparezca el resultado en vez de recalcularlo. Si el que
+calcula falla o el candado vence, el que espera calcula por su cuenta.
+
+Los contadores de aciertos, fallos y esperas viven en el mismo cache; con
+Redis o Memcached son globales, con LocMem (el default) son por proceso. Con
+FileBasedCache el candado y los contadores no son atómicos: puede haber
+cálculos duplicados y conteos perdidos (ver CACHES en settings).
+"""
+
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+from apps.inventory import cambios
+
+TTL = 300
+TTL_CANDADO = 30
+INTERVALO_ESPERA = 0.05
+PREFIJO = 'reportes'
+CONTADORES = ('aciertos', 'fallos', 'esperas')
+
+ACIERTO = 'HIT'
+FALLO = 'MISS'
+ESPERA = 'WAIT'
+
+
+def clave(nombre, **parametros):
+    """Clave para el reporte `nombre` con esos parámetros en la versión actual de los datos."""
+    crudo = json.dumps(parametros, sort_keys=True, default=str)
+    resumen = hashlib.sha1(crudo.encode()).hexdigest()
+    return f'{PREFIJO}:{nombre}:v{cambios.version_actual()}:{resumen}'
+
+
+def _contar(tipo):
+    nombre = f'{PREFIJO}:contador:{tipo}'
+    if not cache.add(nombre, 1, timeout=None):
+        try:
+            cache.incr(nombre)
+        except ValueError:
+            cache.add(nombre, 1, timeout=None)
+
+
+def contadores():
+    """{'aciertos', 'fallos', 'esperas', 'version'} para monitoreo."""
+    valores = cache.get_many([f'{PREFIJO}:contador:{tipo}' for tipo in CONTADORES])
+    datos = {tipo: valores.get(f'{PREFIJO}:contador:{tipo}', 0) for tipo in CONTADORES}
+    datos['version'] = cambios.version_actual()
+    return datos
+
+
+def obtener(clave, calcular):
+    """
+    Devuelve (valor, estado): el valor cacheado bajo `clave` o el que
+    devuelve calcular(), y ACIERTO, FALLO o ESPERA según de dónde salió.
+    """
+    valor = cache.get(clave)
+    if valor is not None:
+        _contar('aciertos')
+        return valor, ACIERTO
+
+    candado = f'{clave}:calculando'
+    limite = time.monotonic() + TTL_CANDADO
+    propio = cache.add(candado, 1, timeout=TTL_CANDADO)
+    while not propio and time.monotonic() < limite:
+        # Otro request está calculando lo mismo: esperar su resultado
+        time.sleep(INTERVALO_ESPERA)
+        valor = cache.get(clave)
+        if valor is not None:
+            _contar('esperas')
+            return valor, ESPERA
+        propio = cache.add(candado, 1, timeout=TTL_CANDADO)
+
+    try:
+        valor = calcular()
+        cache.set(clave, valor, timeout=TTL)
+    finally:
+        if propio:
+            cache.delete(candado)
+    _contar('fallos')
+    return valor, FALLO
@@ -0,0 +1,377 @@
+"""
+Motor de cálculo del dashboard.
+
+Cada bloque de KPIs se resuelve con un aggregate agrupado en la base de datos,
+de modo que la cantidad de queries es fija y no depende de cuántas
+sucursales, sub-ubicaciones o lotes existan. Los bloques de ventas leen de los
+rollups diarios (VentaDiaria / VentaDiariaSucursal).
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from apps.inventory.models import Pedido, Stock, StockResumen
+from apps.locations.models import Ubicacion
+from apps.recipes.models import Fabricacion
+
+from .models import VentaDiaria, VentaDiariaSucursal
+from .rollup import parsear_fecha
+
+DIAS_VENTANA_VENCIMIENTO = 30
+MAX_PROXIMOS_VENCER = 50
+MAX_STOCK_BAJO = 20
+MAX_MAS_VENDIDOS = 10
+
+
+def _urgencia(dias):
+    if dias <= 7:
+        return 'critica' if dias <= 3 else 'alta'
+    if dias <= 15:
+        return 'media'
+    return 'baja'
+
+
+class DashboardEngine:
+    """
+    Calcula todos los bloques del dashboard a partir de aggregates agrupados.
+
+    Uso:
+        engine = DashboardEngine(sucursal_id=..., fecha_desde=..., fecha_hasta=..., stock_minimo=5)
+        data = engine.calcular()
+    """
+
+    def __init__(self, sucursal_id=None, fecha_desde=None, fecha_hasta=None, stock_minimo=5, hoy=None):
+        self.sucursal_id = sucursal_id
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+        self.stock_minimo = stock_minimo
+        self.hoy = hoy or date.today()
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # QUERYSETS BASE
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def _stock_qs(self):
+        qs = Stock.objects.all()
+        if self.sucursal_id:
+            qs = qs.filter(sub_ubicacion__ubicacion_id=self.sucursal_id)
+        return qs
+
+    def _ubicaciones_qs(self):
+        qs = Ubicacion.objects.order_by('id')
+        if self.sucursal_id:
+            qs = qs.filter(id=self.sucursal_id)
+        return qs
+
+    def _rango_dias(self, qs):
+        desde = parsear_fecha(self.fecha_desde)
+        hasta = parsear_fecha(self.fecha_hasta)
+        if self.sucursal_id:
+            qs = qs.filter(sucursal_id=self.sucursal_id)
+        if desde:
+            qs = qs.filter(fecha__gte=desde)
+        if hasta:
+            qs = qs.filter(fecha__lte=hasta)
+        return qs
+
+    def _ventas_diarias_qs(self):
+        """Rollup sucursal × día: el costo depende de la cantidad de días, no de ventas."""
+        return self._rango_dias(VentaDiariaSucursal.objects.all())
+
+    def _ventas_producto_qs(self):
+        """Rollup sucursal × producto × día."""
+        return self._rango_dias(VentaDiaria.objects.all())
+
+    def _pedidos_qs(self):
+        qs = Pedido.objects.all()
+        if self.sucursal_id:
+            qs = qs.filter(destino_id=self.sucursal_id)
+        if self.fecha_desde:
+            qs = qs.filter(fecha_creacion__gte=self.fecha_desde)
+        if self.fecha_hasta:
+            qs = qs.filter(fecha_creacion__lte=self.fecha_hasta)
+        return qs
+
+    def _fabricaciones_qs(self):
+        qs = Fabricacion.objects.all()
+        if self.sucursal_id:
+            qs = qs.filter(ubicacion_id=self.sucursal_id)
+        if self.fecha_desde:
+            qs = qs.filter(creado_en__gte=self.fecha_desde)
+        if self.fecha_hasta:
+            qs = qs.filter(creado_en__lte=self.fecha_hasta)
+        return qs
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # STOCK
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def valorizacion_por_sub_ubicacion(self):
+        """Una fila por sub-ubicación con cantidad de registros y valor a precio de venta."""
+        return list(
+            self._stock_qs()
+            .values(
+                'sub_ubicacion_id',
+                'sub_ubicacion__nombre',
+                'sub_ubicacion__tipo',
+                'sub_ubicacion__ubicacion_id',
+                'sub_ubicacion__ubicacion__nombre',
+            )
+            .annotate(
+                productos_count=Count('id'),
+                valor_total=Coalesce(
+                    Sum(F('cantidad') * F('producto__precio_venta'), output_field=DecimalField()),
+                    Decimal('0'),
+                    output_field=DecimalField(),
+                ),
+            )
+            .order_by('sub_ubicacion__ubicacion_id', 'sub_ubicacion_id')
+        )
+
+    def stock_bajo(self):
+        """
+        Productos cuyo stock total (en el alcance filtrado) está por debajo del
+        mínimo. Suma el resumen por producto × sub-ubicación, no los lotes.
+        """
+        qs = StockResumen.objects.all()
+        if self.sucursal_id:
+            qs = qs.filter(ubicacion_id=self.sucursal_id)
+        return list(
+            qs
+            .values('producto_id', 'producto__nombre', 'producto__categoria__nombre')
+            .annotate(total_cantidad=Sum('cantidad'))
+            .filter(total_cantidad__lt=self.stock_minimo)
+            .order_by('producto_id')
+        )
+
+    def proximos_a_vencer(self):
+        """
+        Lotes que vencen dentro de la ventana, ordenados por fecha de vencimiento,
+        junto con los contadores por bucket (7/15/30 días).
+        """
+        qs = self._stock_qs().filter(
+            fecha_vencimiento__gte=self.hoy,
+            fecha_vencimiento__lte=self.hoy + timedelta(days=DIAS_VENTANA_VENCIMIENTO),
+        )
+
+        buckets = qs.aggregate(
+            expiring_7_days=Count('id', filter=Q(fecha_vencimiento__lte=self.hoy + timedelta(days=7))),
+            expiring_15_days=Count('id', filter=Q(fecha_vencimiento__lte=self.hoy + timedelta(days=15))),
+            expiring_30_days=Count('id'),
+        )
+
+        filas = (
+            qs.values(
+                'producto_id',
+                'producto__nombre',
+                'producto__categoria__nombre',
+                'sub_ubicacion__nombre',
+                'sub_ubicacion__ubicacion__nombre',
+                'lote',
+                'fecha_ingreso',
+                'cantidad',
+                'fecha_vencimiento',
+            )
+            .order_by('fecha_vencimiento', 'id')[:MAX_PROXIMOS_VENCER]
+        )
+
+        resultado = []
+        for fila in filas:
+            dias = (fila['fecha_vencimiento'] - self.hoy).days
+            resultado.append({
+                'producto_id': fila['producto_id'],
+                'producto_nombre': fila['producto__nombre'],
+                'categoria': fila['producto__categoria__nombre'],
+                'sucursal': fila['sub_ubicacion__ubicacion__nombre'],
+                'sub_ubicacion': fila['sub_ubicacion__nombre'],
+                'lote': fila['lote'],
+                'fecha_ingreso': str(fila['fecha_ingreso']) if fila['fecha_ingreso'] else None,
+                'fecha_vencimiento': str(fila['fecha_vencimiento']),
+                'dias_restantes': dias,
+                'cantidad': float(fila['cantidad']),
+                'urgencia': _urgencia(dias),
+            })
+        return resultado, buckets
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # VENTAS
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def totales_ventas(self):
+        return self._ventas_diarias_qs().aggregate(
+            total=Coalesce(Sum('total'), Decimal('0'), output_field=DecimalField()),
+            cantidad=Coalesce(Sum('tickets'), 0),
+        )
+
+    def ventas_por_sucursal(self):
+        return {
+            fila['sucursal_id']: fila['suma_total']
+            for fila in self._ventas_diarias_qs().values('sucursal_id').annotate(suma_total=Sum('total')).order_by()
+        }
+
+    def productos_mas_vendidos(self):
+        filas = (
+            self._ventas_producto_qs()
+            .values('producto_id', 'producto__nombre', 'producto__categoria__nombre')
+            .annotate(cantidad_vendida=Sum('unidades'), revenue=Sum('total'))
+            .order_by('-cantidad_vendida', 'producto_id')[:MAX_MAS_VENDIDOS]
+        )
+        return [
+            {
+                'producto_nombre': f['producto__nombre'],
+                'categoria': f['producto__categoria__nombre'],
+                'cantidad_vendida': f['cantidad_vendida'],
+                'revenue': round(float(f['revenue'] or 0), 2),
+            }
+            for f in filas
+        ]
+
+    def ventas_por_categoria(self):
+        filas = list(
+            self._ventas_producto_qs()
+            .values('producto__categoria__nombre')
+            .annotate(cantidad_total=Sum('unidades'), revenue=Sum('total'))
+            .order_by()
+        )
+        total_revenue = sum(float(f['revenue'] or 0) for f in filas)
+        data = [
+            {
+                'categoria': f['producto__categoria__nombre'] or 'Sin categoría',
+                'cantidad': f['cantidad_total'],
+                'revenue': round(float(f['revenue'] or 0), 2),
+                'porcentaje': round((float(f['revenue'] or 0) / total_revenue * 100) if total_revenue > 0 else 0, 1),
+            }
+            for f in filas
+        ]
+        return sorted(data, key=lambda x: x['revenue'], reverse=True)
+
+    def tendencia(self):
+        if not (self.fecha_desde and self.fecha_hasta):
+            return []
+        ventas_diarias = (
+            self._ventas_diarias_qs()
+            .values('fecha')
+            .annotate(
+                total_ventas=Sum('total'),
+                cantidad_items=Sum('unidades'),
+                cantidad_tickets=Sum('tickets'),
+            )
+            .order_by('fecha')
+        )
+        return [
+            {
+                'fecha': str(v['fecha']),
+                'total_ventas': float(v['total_ventas'] or 0),
+                'cantidad_items': v['cantidad_items'] or 0,
+                'promedio_ticket': (
+                    float(v['total_ventas'] or 0) / v['cantidad_tickets'] if v['cantidad_tickets'] else 0
+                ),
+            }
+            for v in ventas_diarias
+        ]
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # PEDIDOS Y FABRICACIONES
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def pedidos_por_estado(self):
+        conteos = dict(
+            self._pedidos_qs().values_list('estado').annotate(total=Count('id')).order_by()
+        )
+        return {estado: conteos.get(estado, 0) for estado, _ in Pedido.ESTADOS}
+
+    def totales_fabricaciones(self):
+        return self._fabricaciones_qs().aggregate(
+            cantidad=Count('id'),
+            total_producido=Coalesce(Sum('cantidad_producida'), 0),
+        )
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # ENSAMBLADO
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def calcular(self):
+        ubicaciones = list(self._ubicaciones_qs().values('id', 'nombre'))
+
+        valorizacion = self.valorizacion_por_sub_ubicacion()
+        stock_por_ubicacion = []
+        stock_value_por_ubicacion = {}
+        total_stock_value = 0.0
+        stock_items_count = 0
+        for fila in valorizacion:
+            valor = float(fila['valor_total'])
+            ub_id = fila['sub_ubicacion__ubicacion_id']
+            stock_value_por_ubicacion[ub_id] = stock_value_por_ubicacion.get(ub_id, 0.0) + valor
+            total_stock_value += valor
+            stock_items_count += fila['productos_count']
+            stock_por_ubicacion.append({
+                'sucursal': fila['sub_ubicacion__ubicacion__nombre'],
+                'sucursal_id': ub_id,
+                'sub_ubicacion': fila['sub_ubicacion__nombre'],
+                'sub_ubicacion_id': fila['sub_ubicacion_id'],
+                'tipo': fila['sub_ubicacion__tipo'],
+                'productos_count': fila['productos_count'],
+                'valor_total': round(valor, 2)
+            })
+
+        stock_bajo = self.stock_bajo()
+        stock_bajo_data = [
+            {
+                'producto_id': fila['producto_id'],
+                'producto_nombre': fila['producto__nombre'],
+                'categoria': fila['producto__categoria__nombre'],
+                'cantidad_actual': round(float(fila['total_cantidad']), 3),
+                'stock_minimo': self.stock_minimo
+            }
+            for fila in stock_bajo
+        ]
+
+        productos_proximos_vencer, buckets = self.proximos_a_vencer()
+
+        totales_ventas = self.totales_ventas()
+        total_ventas_periodo = float(totales_ventas['total'])
+        cantidad_ventas = totales_ventas['cantidad']
+        promedio_ticket = total_ventas_periodo / cantidad_ventas if cantidad_ventas > 0 else 0
+
+        pedidos_estado = self.pedidos_por_estado()
+        fabricaciones = self.totales_fabricaciones()
+
+        ventas_por_sucursal = self.ventas_por_sucursal()
+        comparativa_sucursales = [
+            {
+                'sucursal': ub['nombre'],
+                'sucursal_id': ub['id'],
+                'stock_value': round(stock_value_por_ubicacion.get(ub['id'], 0.0), 2),
+                'ventas': round(float(ventas_por_sucursal.get(ub['id']) or 0), 2)
+            }
+            for ub in ubicaciones
+        ]
+
+        return {
+            'kpis': {
+                'total_stock_value': round(total_stock_value, 2),
+                'stock_items_count': stock_items_count,
+                'low_stock_count': len(stock_bajo),
+                'stock_minimo_configurado': self.stock_minimo,
+                'expiring_7_days': buckets['expiring_7_days'],
+                'expiring_15_days': buckets['expiring_15_days'],
+                'expiring_30_days': buckets['expiring_30_days'],
+                'total_ventas_periodo': round(total_ventas_periodo, 2),
+                'total_pedidos_recibidos': pedidos_estado['recibido'],
+                'fabricaciones_periodo': fabricaciones['cantidad'],
+                'total_producido': fabricaciones['total_producido'],
+                'promedio_ticket': round(promedio_ticket, 2),
+                'cantidad_ventas': cantidad_ventas
+            },
+            'stock_por_ubicacion': stock_por_ubicacion,
+            'productos_proximos_vencer': productos_proximos_vencer,
+            'productos_mas_vendidos': self.productos_mas_vendidos(),
+            'ventas_por_categoria': self.ventas_por_categoria(),
+            'ventas_tendencia': self.tendencia(),
+            'pedidos_estado': pedidos_estado,
+            'top_productos_stock_bajo': stock_bajo_data[:MAX_STOCK_BAJO],
+            'comparativa_sucursales': comparativa_sucursales
+        }
@@ -0,0 +1,193 @@
+"""
+Reporte económico por sucursal: gastos (pedidos recibidos de distribuidor, al
+costo del pedido) contra ventas (rollup VentaDiariaSucursal).
+
+Todo sale de dos queries agrupadas por sucursal × mes, una de gastos y una de
+ventas, sin importar cuántas sucursales haya. Los períodos de comparación
+(período anterior de igual largo y mismo período del año anterior) se suman
+en las mismas queries con aggregates filtrados, así que tampoco agregan
+queries. Los importes se acumulan en Decimal y se redondean al centavo.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from apps.inventory.ledger import fin_del_dia
+from apps.inventory.models import PedidoItem
+from apps.locations.models import Ubicacion
+
+from .models import VentaDiariaSucursal
+
+ACTUAL = 'actual'
+ANTERIOR = 'periodo_anterior'
+ANIO_ANTERIOR = 'anio_anterior'
+COMPARACIONES = (ANTERIOR, ANIO_ANTERIOR)
+
+CERO = Decimal('0')
+CENTAVO = Decimal('0.01')
+DECIMA = Decimal('0.1')
+
+
+def _hace_un_anio(fecha):
+    try:
+        return fecha.replace(year=fecha.year - 1)
+    except ValueError:
+        # 29 de febrero
+        return fecha.replace(year=fecha.year - 1, day=28)
+
+
+def periodos(desde=None, hasta=None, hoy=None):
+    """
+    {nombre: (desde, hasta)} con fechas inclusive. Sin `desde` el período es
+    abierto y no hay con qué compararlo; con `desde` y sin `hasta`, el
+    período termina hoy.
+    """
+    if desde is None:
+        return {ACTUAL: (None, hasta)}
+    hasta = hasta or hoy or date.today()
+    dias = (hasta - desde).days + 1
+    return {
+        ACTUAL: (desde, hasta),
+        ANTERIOR: (desde - timedelta(days=dias), desde - timedelta(days=1)),
+        ANIO_ANTERIOR: (_hace_un_anio(desde), _hace_un_anio(hasta)),
+    }
+
+
+def _rango_fecha(campo, desde, hasta):
+    filtro = Q()
+    if desde:
+        filtro &= Q(**{f'{campo}__gte': desde})
+    if hasta:
+        filtro &= Q(**{f'{campo}__lte': hasta})
+    return filtro
+
+
+def _rango_fecha_hora(campo, desde, hasta):
+    filtro = Q()
+    if desde:
+        filtro &= Q(**{f'{campo}__gte': fin_del_dia(desde - timedelta(days=1))})
+    if hasta:
+        filtro &= Q(**{f'{campo}__lt': fin_del_dia(hasta)})
+    return filtro
+
+
+def _agrupar(qs, campo_sucursal, campo_fecha, valor, filtros):
+    """
+    Una query: importes por sucursal × mes, con una columna por período
+    (Sum filtrado). Devuelve [(sucursal_id, 'YYYY-MM', {periodo: Decimal})].
+    """
+    filas = (
+        qs.filter(reduce(or_, filtros.values()))
+        .annotate(mes=TruncMonth(campo_fecha))
+        .values(campo_sucursal, 'mes')
+        .annotate(**{nombre: Sum(valor, filter=filtro) for nombre, filtro in filtros.items()})
+        .order_by()
+    )
+    return [
+        (fila[campo_sucursal], fila['mes'].strftime('%Y-%m'),
+         {nombre: fila[nombre] or CERO for nombre in filtros})
+        for fila in filas
+    ]
+
+
+def _importes(gastos, ventas):
+    return {
+        'total_gastos': gastos.quantize(CENTAVO),
+        'total_ventas': ventas.quantize(CENTAVO),
+        'balance': (ventas - gastos).quantize(CENTAVO),
+    }
+
+
+def _variacion(actual, anterior):
+    """Variación porcentual, o None si no hay base contra la que comparar."""
+    if not anterior:
+        return None
+    return ((actual - anterior) / abs(anterior) * 100).quantize(DECIMA)
+
+
+def _bloque(acumulado, comparar):
+    gastos, ventas = acumulado['periodos'][ACTUAL]
+    bloque = _importes(gastos, ventas)
+    bloque['por_mes'] = [
+        {'mes': mes, **_importes(*acumulado['meses'][mes])}
+        for mes in sorted(acumulado['meses'])
+    ]
+    if comparar:
+        bloque['comparacion'] = {}
+        for nombre in COMPARACIONES:
+            gastos_antes, ventas_antes = acumulado['periodos'][nombre]
+            bloque['comparacion'][nombre] = {
+                **_importes(gastos_antes, ventas_antes),
+                'variacion_ventas': _variacion(ventas, ventas_antes),
+                'variacion_balance': _variacion(ventas - gastos, ventas_antes - gastos_antes),
+            }
+    return bloque
+
+
+def _acumulador(nombres):
+    return {'periodos': {nombre: [CERO, CERO] for nombre in nombres}, 'meses': {}}
+
+
+def reporte_economico(sucursal_id=None, desde=None, hasta=None, hoy=None):
+    """
+    Gastos, ventas y balance por sucursal y en total para el período
+    [desde, hasta] (fechas inclusive), con desglose mensual y, si hay
+    `desde`, la comparación contra el período anterior y el mismo período
+    del año anterior:
+
+    {'periodos': {nombre: {'desde', 'hasta'}},
+     'por_sucursal': [{sucursal_id, sucursal_nombre, total_gastos, total_ventas,
+                       balance, por_mes, comparacion}],
+     'totales': {total_gastos, total_ventas, balance, por_mes, comparacion}}
+    """
+    rangos = periodos(desde, hasta, hoy)
+    comparar = ANTERIOR in rangos
+
+    sucursales = Ubicacion.objects.all()
+    gastos_qs = PedidoItem.objects.filter(pedido__estado='recibido', pedido__origen_tipo='distribuidor')
+    ventas_qs = VentaDiariaSucursal.objects.all()
+    if sucursal_id:
+        sucursales = sucursales.filter(id=sucursal_id)
+        gastos_qs = gastos_qs.filter(pedido__destino_id=sucursal_id)
+        ventas_qs = ventas_qs.filter(sucursal_id=sucursal_id)
+
+    gastos = _agrupar(
+        gastos_qs, 'pedido__destino_id', 'pedido__fecha_creacion',
+        ExpressionWrapper(F('cantidad') * F('precio_costo_momento'),
+                          output_field=DecimalField(max_digits=14, decimal_places=2)),
+        {nombre: _rango_fecha_hora('pedido__fecha_creacion', *rango) for nombre, rango in rangos.items()},
+    )
+    ventas = _agrupar(
+        ventas_qs, 'sucursal_id', 'fecha', F('total'),
+        {nombre: _rango_fecha('fecha', *rango) for nombre, rango in rangos.items()},
+    )
+
+    por_sucursal = {}
+    totales = _acumulador(rangos)
+    for posicion, filas in enumerate((gastos, ventas)):
+        for suc_id, mes, importes in filas:
+            for acumulado in (por_sucursal.setdefault(suc_id, _acumulador(rangos)), totales):
+                for nombre, importe in importes.items():
+                    acumulado['periodos'][nombre][posicion] += importe
+                if importes[ACTUAL]:
+                    acumulado['meses'].setdefault(mes, [CERO, CERO])[posicion] += importes[ACTUAL]
+
+    return {
+        'periodos': {
+            nombre: {'desde': rango[0], 'hasta': rango[1]} for nombre, rango in rangos.items()
+        },
+        'por_sucursal': [
+            {
+                'sucursal_id': sucursal.id,
+                'sucursal_nombre': sucursal.nombre,
+                **_bloque(por_sucursal.get(sucursal.id) or _acumulador(rangos), comparar),
+            }
+            for sucursal in sucursales
+        ],
+        'totales': _bloque(totales, comparar),
+    }
@@ -0,0 +1,67 @@
+"""
+Benchmark del dashboard: cantidad de queries y latencia a distintas escalas.
+Uso: python manage.py bench_dashboard [--sucursales 40] [--lotes 150000] [--factores 1,10]
+
+Los datos sintéticos se generan dentro de una transacción que se descarta al
+final (salvo --conservar), así que puede correrse contra una base de desarrollo.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.inventory.management import sintetico
+from apps.sales.dashboard import DashboardEngine
+
+
+class Command(BaseCommand):
+    help = "Mide queries y latencia de DashboardEngine con datos sintéticos escalados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursales', type=int, default=40, help="Sucursales de la escala base.")
+        parser.add_argument('--lotes', type=int, default=150000, help="Registros de Stock de la escala base.")
+        parser.add_argument('--productos', type=int, default=300, help="Productos de la escala base.")
+        parser.add_argument('--ventas', type=int, default=20000, help="Ventas de la escala base.")
+        parser.add_argument('--factores', default='1,10', help="Multiplicadores de la escala base a medir.")
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--conservar', action='store_true', help="No descartar los datos generados.")
+
+    def handle(self, *args, **options):
+        factores = sorted(int(f) for f in options['factores'].split(','))
+        try:
+            with transaction.atomic():
+                self._correr(factores, options)
+                if not options['conservar']:
+                    raise sintetico.RollbackBenchmark()
+        except sintetico.RollbackBenchmark:
+            self.stdout.write("Datos sintéticos descartados.")
+
+    def _correr(self, factores, options):
+        productos = []
+        subs = []
+        generado = 0
+        self.stdout.write(f"{'factor':>6} {'sucursales':>10} {'lotes':>10} {'queries':>8} {'ms (min)':>10} {'ms (prom)':>10}")
+        for factor in factores:
+            # Se genera sólo el incremento respecto de la escala anterior
+            delta = factor - generado
+            productos = sintetico.crear_catalogo(options['productos'] * delta)
+            subs = sintetico.crear_sucursales(options['sucursales'] * delta)
+            sintetico.crear_lotes(productos, subs, options['lotes'] * delta)
+            sintetico.crear_ventas(productos, subs, options['ventas'] * delta)
+            generado = factor
+
+            tiempos = []
+            queries = 0
+            for _ in range(options['repeticiones']):
+                with CaptureQueriesContext(connection) as ctx:
+                    inicio = time.perf_counter()
+                    DashboardEngine(fecha_desde='2000-01-01', fecha_hasta='2100-01-01').calcular()
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                queries = len(ctx.captured_queries)
+
+            self.stdout.write(
+                f"{factor:>6} {options['sucursales'] * factor:>10} {options['lotes'] * factor:>10} "
+                f"{queries:>8} {min(tiempos):>10.1f} {sum(tiempos) / len(tiempos):>10.1f}"
+            )
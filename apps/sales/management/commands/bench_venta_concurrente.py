@@ -0,0 +1,109 @@
+"""
+Benchmark de ventas concurrentes sobre un mismo SKU de lote único.
+Uso: python manage.py bench_venta_concurrente [--hilos 16] [--ventas-por-hilo 50]
+
+Compara el camino bloqueante (SELECT ... FOR UPDATE + bulk_update) con el
+decremento condicional (UPDATE ... WHERE cantidad >= x). Cada venta se
+confirma en su propia transacción, así que los datos BENCH- se commitean y se
+borran al terminar. Pensado para MySQL; en SQLite las escrituras se serializan.
+"""
+
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from apps.inventory import services
+from apps.inventory.management import sintetico
+from apps.inventory.models import Stock
+from apps.products.models import Categoria, Producto
+from apps.sales.models import Venta
+
+MODOS = (
+    ('bloqueante', False),
+    ('condicional', True),
+)
+
+
+class Command(BaseCommand):
+    help = "Mide el throughput de ventas concurrentes del mismo producto con y sin decremento condicional."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=16)
+        parser.add_argument('--ventas-por-hilo', type=int, default=50)
+        parser.add_argument('--cantidad', type=int, default=1, help="Unidades por venta.")
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+        por_hilo = options['ventas_por_hilo']
+        cantidad = options['cantidad']
+
+        try:
+            producto, sub, vendedor = self._preparar(hilos * por_hilo * cantidad * len(MODOS))
+            self.stdout.write(f"{'modo':>12} {'ventas':>8} {'errores':>8} {'seg':>8} {'ventas/s':>10} {'stock ok':>9}")
+            for nombre, condicional in MODOS:
+                self._medir(nombre, condicional, producto, sub, vendedor, hilos, por_hilo, cantidad)
+        finally:
+            services.USAR_DECREMENTO_CONDICIONAL = True
+            sintetico.limpiar()
+            self.stdout.write("Datos sintéticos eliminados.")
+
+    def _preparar(self, unidades):
+        categoria = Categoria.objects.create(nombre=f"{sintetico.PREFIJO}-CAT-CONCURRENCIA")
+        producto = Producto.objects.create(
+            nombre=f"{sintetico.PREFIJO} Producto concurrente",
+            categoria=categoria,
+            tipo_conservacion='ambiente',
+            precio_venta=Decimal('100.00'),
+            costo_compra=Decimal('65.00'),
+            sku=f"{sintetico.PREFIJO}-CONCURRENTE",
+            dias_caducidad=None,
+        )
+        sub = sintetico.crear_sucursales(1, subs_por_sucursal=1)[0]
+        # Producto sin caducidad: un único registro consolidado con lote=None
+        Stock.objects.create(producto=producto, sub_ubicacion=sub, cantidad=unidades)
+        return producto, sub, sintetico.crear_vendedor()
+
+    def _medir(self, nombre, condicional, producto, sub, vendedor, hilos, por_hilo, cantidad):
+        services.USAR_DECREMENTO_CONDICIONAL = condicional
+        stock_inicial = Stock.objects.get(producto=producto, sub_ubicacion=sub).cantidad
+        resultados = []
+        lock = threading.Lock()
+
+        def vender():
+            hechas = errores = 0
+            try:
+                for _ in range(por_hilo):
+                    try:
+                        Venta.registrar([{
+                            'producto': producto,
+                            'sub_ubicacion_origen': sub,
+                            'cantidad': cantidad,
+                            'precio_venta_momento': producto.precio_venta,
+                        }], vendedor=vendedor, sucursal_id=sub.ubicacion_id)
+                        hechas += 1
+                    except (DatabaseError, services.StockInsuficiente):
+                        errores += 1
+            finally:
+                connection.close()
+                with lock:
+                    resultados.append((hechas, errores))
+
+        threads = [threading.Thread(target=vender) for _ in range(hilos)]
+        inicio = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        segundos = time.perf_counter() - inicio
+
+        hechas = sum(h for h, _ in resultados)
+        errores = sum(e for _, e in resultados)
+        stock_final = Stock.objects.get(producto=producto, sub_ubicacion=sub).cantidad
+        stock_ok = stock_final == stock_inicial - hechas * cantidad
+        self.stdout.write(
+            f"{nombre:>12} {hechas:>8} {errores:>8} {segundos:>8.2f} "
+            f"{hechas / segundos if segundos else 0:>10.1f} {'sí' if stock_ok else 'NO':>9}"
+        )
@@ -0,0 +1,87 @@
+"""
+Benchmark de Venta.registrar según la cantidad de líneas: queries y latencia.
+Uso: python manage.py bench_venta_lineas [--lineas 1,10,50] [--repeticiones 20]
+
+Una venta de una línea usa el decremento condicional; con más líneas, un único
+SELECT ... FOR UPDATE y un bulk_update (ver services.descontar_fifo). Mide
+también una venta rechazada por falta de stock (que no debe insertar la
+venta). La mitad de los productos tiene un único lote y la otra
+mitad dos. Los datos se generan dentro de una transacción que se descarta al
+final.
+"""
+
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.inventory.services import StockInsuficiente
+from apps.inventory.management import sintetico
+from apps.inventory.models import Stock
+from apps.sales.models import Venta
+
+class Command(BaseCommand):
+    help = "Mide queries y latencia de una venta de 1, 10 y 50 líneas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', default='1,10,50', help="Cantidades de líneas a medir.")
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        lineas = sorted(int(n) for n in options['lineas'].split(','))
+        try:
+            with transaction.atomic():
+                self._correr(lineas, options['repeticiones'])
+                raise sintetico.RollbackBenchmark()
+        except sintetico.RollbackBenchmark:
+            self.stdout.write("Datos sintéticos descartados.")
+
+    def _correr(self, lineas, repeticiones):
+        productos = sintetico.crear_catalogo(max(lineas))
+        sub = sintetico.crear_sucursales(1, subs_por_sucursal=1)[0]
+        unidades = repeticiones * len(lineas) + 1
+        Stock.objects.bulk_create([
+            Stock(producto=producto, sub_ubicacion=sub, cantidad=unidades, lote=f"{sintetico.PREFIJO}-{i}-{j}")
+            for i, producto in enumerate(productos)
+            for j in range(1 + i % 2)
+        ])
+        vendedor = sintetico.crear_vendedor()
+
+        self.stdout.write(f"{'lineas':>6} {'modo':>10} {'queries':>8} {'ms (min)':>10} {'ms (prom)':>10}")
+        for n in lineas:
+            items = [
+                {'producto': producto, 'sub_ubicacion_origen': sub, 'cantidad': 1,
+                 'precio_venta_momento': Decimal('100.00')}
+                for producto in productos[:n]
+            ]
+            tiempos = []
+            queries = 0
+            for _ in range(repeticiones):
+                with CaptureQueriesContext(connection) as ctx:
+                    inicio = time.perf_counter()
+                    Venta.registrar(items, vendedor=vendedor, sucursal_id=sub.ubicacion_id)
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                queries = len(ctx.captured_queries)
+            self.stdout.write(
+                f"{n:>6} {'aceptada':>10} {queries:>8} {min(tiempos):>10.2f} {sum(tiempos) / len(tiempos):>10.2f}"
+            )
+
+            rechazada = [dict(item, cantidad=unidades * 2) if i == n - 1 else item for i, item in enumerate(items)]
+            with CaptureQueriesContext(connection) as ctx:
+                inicio = time.perf_counter()
+                try:
+                    Venta.registrar(rechazada, vendedor=vendedor, sucursal_id=sub.ubicacion_id)
+                except StockInsuficiente:
+                    pass
+                ms = (time.perf_counter() - inicio) * 1000
+            # Aunque se deshaga, un INSERT de la venta consume un id del autoincremental
+            insert_venta = any(
+                query['sql'].startswith('INSERT') and Venta._meta.db_table in query['sql'].split('(')[0]
+                for query in ctx.captured_queries
+            )
+            self.stdout.write(
+                f"{n:>6} {'rechazada':>10} {len(ctx.captured_queries):>8} {ms:>10.2f} {'':>10} "
+                f"INSERT de venta: {'sí' if insert_venta else 'no'}"
+            )
@@ -0,0 +1,36 @@
+"""
+Reconstruye los rollups diarios de ventas desde el historial de Venta/VentaItem.
+Uso: python manage.py rebuild_ventas_diarias [--desde 2026-01-01] [--hasta 2026-01-31] [--sucursal 3]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apps.sales.rollup import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Reconstruye VentaDiaria y VentaDiariaSucursal a partir de las ventas registradas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Fecha inicial inclusive (YYYY-MM-DD).")
+        parser.add_argument('--hasta', help="Fecha final inclusive (YYYY-MM-DD).")
+        parser.add_argument('--sucursal', type=int, help="Limitar a una sucursal.")
+
+    def handle(self, *args, **options):
+        desde = self._fecha(options['desde'], '--desde')
+        hasta = self._fecha(options['hasta'], '--hasta')
+
+        resultado = reconstruir(desde=desde, hasta=hasta, sucursal_id=options['sucursal'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollup reconstruido: {resultado['ventas_diarias']} filas sucursal×producto×día, "
+            f"{resultado['ventas_diarias_sucursal']} filas sucursal×día."
+        ))
+
+    def _fecha(self, valor, opcion):
+        if not valor:
+            return None
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise CommandError(f"{opcion} debe tener formato YYYY-MM-DD.")
+        return fecha
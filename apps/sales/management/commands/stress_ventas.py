@@ -0,0 +1,193 @@
+"""
+Stress de ventas concurrentes: cientos de ventas solapadas sobre pocos productos.
+Uso: python manage.py stress_ventas [--hilos 24] [--ventas-por-hilo 25] [--productos 6]
+
+Cada venta toca 2-4 productos en orden aleatorio (mezcla de productos de lote
+único y perecederos con varios lotes). Los lotes de stock se bloquean siempre
+en orden de id, así que no debería haber deadlocks sobre Stock; los que surjan
+en otras tablas los absorbe con_reintentos(), y se reportan. Reporta throughput y reintentos, y verifica al final
+los invariantes de stock, libro de movimientos y rollups. Los datos BENCH- se
+commitean y se borran al terminar.
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.models import Count, F, Sum
+
+from apps.inventory import ledger
+from apps.inventory.management import sintetico
+from apps.inventory.models import Stock, StockMovimiento
+from apps.inventory.services import StockInsuficiente, con_reintentos, es_error_de_bloqueo
+from apps.products.models import Categoria, Producto
+from apps.sales.models import Venta, VentaDiariaSucursal, VentaItem
+
+
+class Command(BaseCommand):
+    help = "Dispara ventas concurrentes solapadas y verifica los invariantes de stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=24)
+        parser.add_argument('--ventas-por-hilo', type=int, default=25)
+        parser.add_argument('--productos', type=int, default=6)
+        parser.add_argument('--stock-por-lote', type=int, default=400)
+        parser.add_argument('--intentos', type=int, default=4, help="Intentos por venta ante deadlock (1 = sin reintentos).")
+
+    def handle(self, *args, **options):
+        try:
+            productos, sub, vendedor = self._preparar(options['productos'], options['stock_por_lote'])
+            stock_inicial = self._stock_por_producto(productos)
+            metricas = self._disparar(productos, sub, vendedor, options)
+            self._reportar(metricas)
+            self._verificar(productos, sub, stock_inicial)
+        finally:
+            sintetico.limpiar()
+            self.stdout.write("Datos sintéticos eliminados.")
+
+    def _preparar(self, n_productos, stock_por_lote):
+        categoria = Categoria.objects.create(nombre=f"{sintetico.PREFIJO}-CAT-STRESS")
+        sub = sintetico.crear_sucursales(1, subs_por_sucursal=1)[0]
+        hoy = date.today()
+        productos = []
+        lotes = []
+        for i in range(n_productos):
+            # Mitad de lote único (sin caducidad), mitad perecederos con tres lotes
+            perecedero = i % 2 == 1
+            producto = Producto.objects.create(
+                nombre=f"{sintetico.PREFIJO} Stress {i}",
+                categoria=categoria,
+                tipo_conservacion='ambiente',
+                precio_venta=Decimal('100.00'),
+                costo_compra=Decimal('65.00'),
+                sku=f"{sintetico.PREFIJO}-STRESS-{i}",
+                dias_caducidad=30 if perecedero else None,
+            )
+            productos.append(producto)
+            if perecedero:
+                for j in range(3):
+                    lotes.append(Stock.objects.create(
+                        producto=producto, sub_ubicacion=sub, cantidad=stock_por_lote,
+                        lote=f"{sintetico.PREFIJO}-STRESS-{i}-{j}", fecha_ingreso=hoy - timedelta(days=j),
+                    ))
+            else:
+                lotes.append(Stock.objects.create(producto=producto, sub_ubicacion=sub, cantidad=stock_por_lote))
+        ledger.registrar([ledger.movimiento(stock, stock.cantidad, 'saldo_inicial') for stock in lotes])
+        return productos, sub, sintetico.crear_vendedor()
+
+    def _stock_por_producto(self, productos):
+        return dict(
+            Stock.objects.filter(producto__in=productos)
+            .values('producto_id').annotate(total=Sum('cantidad'))
+            .order_by().values_list('producto_id', 'total')
+        )
+
+    def _disparar(self, productos, sub, vendedor, options):
+        metricas = defaultdict(int)
+        lock = threading.Lock()
+
+        def contar(clave, cantidad=1):
+            with lock:
+                metricas[clave] += cantidad
+
+        def vender():
+            try:
+                for _ in range(options['ventas_por_hilo']):
+                    elegidos = random.sample(productos, random.randint(2, min(4, len(productos))))
+                    items = [
+                        {
+                            'producto': producto,
+                            'sub_ubicacion_origen': sub,
+                            'cantidad': random.randint(1, 3),
+                            'precio_venta_momento': producto.precio_venta,
+                        }
+                        for producto in elegidos
+                    ]
+
+                    def registrar():
+                        Venta.registrar(items, vendedor=vendedor, sucursal_id=sub.ubicacion_id)
+
+                    try:
+                        con_reintentos(
+                            registrar,
+                            intentos=options['intentos'],
+                            al_reintentar=lambda intento, exc: contar('reintentos'),
+                        )
+                        contar('ventas')
+                    except StockInsuficiente:
+                        contar('sin_stock')
+                    except DatabaseError as exc:
+                        contar('conflictos' if es_error_de_bloqueo(exc) else 'errores')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vender) for _ in range(options['hilos'])]
+        inicio = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        metricas['segundos'] = time.perf_counter() - inicio
+        return metricas
+
+    def _reportar(self, metricas):
+        segundos = metricas['segundos']
+        self.stdout.write(
+            f"ventas: {metricas['ventas']}  sin stock: {metricas['sin_stock']}  "
+            f"conflictos: {metricas['conflictos']}  otros errores: {metricas['errores']}"
+        )
+        self.stdout.write(
+            f"reintentos: {metricas['reintentos']}  tiempo: {segundos:.2f}s  "
+            f"throughput: {metricas['ventas'] / segundos if segundos else 0:.1f} ventas/s"
+        )
+
+    def _verificar(self, productos, sub, stock_inicial):
+        chequeos = []
+
+        vendido = dict(
+            VentaItem.objects.filter(producto__in=productos)
+            .values('producto_id').annotate(total=Sum('cantidad'))
+            .order_by().values_list('producto_id', 'total')
+        )
+        stock_final = self._stock_por_producto(productos)
+        chequeos.append((
+            "stock final = inicial - vendido",
+            all(stock_final.get(p.id, 0) == stock_inicial[p.id] - vendido.get(p.id, 0) for p in productos),
+        ))
+        chequeos.append((
+            "ningún lote negativo",
+            not Stock.objects.filter(producto__in=productos, cantidad__lt=0).exists(),
+        ))
+
+        libro = dict(
+            StockMovimiento.objects.filter(producto__in=productos)
+            .values('stock_id').annotate(total=Sum('cantidad'))
+            .order_by().values_list('stock_id', 'total')
+        )
+        chequeos.append((
+            "libro de movimientos = cantidad por lote",
+            all(libro.get(s.id, 0) == s.cantidad for s in Stock.objects.filter(producto__in=productos)),
+        ))
+
+        ventas = Venta.objects.filter(sucursal_id=sub.ubicacion_id)
+        chequeos.append((
+            "ninguna venta sin items",
+            not ventas.annotate(n=Count('items')).filter(n=0).exists(),
+        ))
+        chequeos.append((
+            "total de venta = suma de items",
+            not ventas.annotate(
+                suma=Sum(F('items__cantidad') * F('items__precio_venta_momento'))
+            ).exclude(total=F('suma')).exists(),
+        ))
+        tickets = VentaDiariaSucursal.objects.filter(sucursal_id=sub.ubicacion_id).aggregate(t=Sum('tickets'))['t'] or 0
+        chequeos.append(("tickets del rollup = ventas", tickets == ventas.count()))
+
+        for descripcion, ok in chequeos:
+            estilo = self.style.SUCCESS if ok else self.style.ERROR
+            self.stdout.write(estilo(f"[{'OK' if ok else 'FALLA'}] {descripcion}"))
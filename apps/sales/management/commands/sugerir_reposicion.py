@@ -0,0 +1,51 @@
+"""
+Calcula las sugerencias de reposición y, con --generar, crea los pedidos en borrador.
+Uso: python manage.py sugerir_reposicion [--ventana 28] [--objetivo 14] [--umbral 7]
+     [--sucursal 3] [--generar --usuario admin]
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.sales import reposicion
+
+
+class Command(BaseCommand):
+    help = "Sugiere reposición por sucursal × producto según la velocidad de venta."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ventana', type=int, default=reposicion.DIAS_VENTANA, help="Días de ventas a considerar.")
+        parser.add_argument('--objetivo', type=int, default=reposicion.DIAS_OBJETIVO, help="Días de cobertura a alcanzar.")
+        parser.add_argument('--umbral', type=int, default=reposicion.DIAS_UMBRAL, help="Cobertura por debajo de la cual se sugiere pedir.")
+        parser.add_argument('--sucursal', type=int, help="Limitar a una sucursal.")
+        parser.add_argument('--generar', action='store_true', help="Crear los pedidos en borrador.")
+        parser.add_argument('--usuario', help="Usuario que figura como creador de los pedidos (requerido con --generar).")
+
+    def handle(self, *args, **options):
+        if options['ventana'] < 1 or options['objetivo'] < 1 or options['umbral'] < 0:
+            raise CommandError("--ventana y --objetivo deben ser positivos y --umbral no negativo.")
+        usuario = None
+        if options['generar']:
+            if not options['usuario']:
+                raise CommandError("--generar requiere --usuario.")
+            usuario = get_user_model().objects.filter(username=options['usuario']).first()
+            if usuario is None:
+                raise CommandError(f"No existe el usuario {options['usuario']}.")
+
+        inicio = time.perf_counter()
+        sugerencias = reposicion.calcular_sugerencias(
+            dias_ventana=options['ventana'],
+            dias_objetivo=options['objetivo'],
+            dias_umbral=options['umbral'],
+            sucursal_id=options['sucursal'],
+        )
+        segundos = time.perf_counter() - inicio
+        sucursales = len({s['sucursal_id'] for s in sugerencias})
+        self.stdout.write(
+            f"{len(sugerencias)} sugerencias en {sucursales} sucursales ({segundos:.2f} s)."
+        )
+        if usuario:
+            pedidos = reposicion.generar_pedidos(sugerencias, usuario)
+            self.stdout.write(self.style.SUCCESS(f"Pedidos en borrador creados: {len(pedidos)}."))
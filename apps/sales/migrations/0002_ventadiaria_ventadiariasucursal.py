@@ -0,0 +1,104 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Venta = apps.get_model('sales', 'Venta')
+    VentaItem = apps.get_model('sales', 'VentaItem')
+    VentaDiaria = apps.get_model('sales', 'VentaDiaria')
+    VentaDiariaSucursal = apps.get_model('sales', 'VentaDiariaSucursal')
+
+    por_producto = (
+        VentaItem.objects.annotate(dia=TruncDate('venta__fecha'))
+        .values('venta__sucursal_id', 'producto_id', 'dia')
+        .annotate(
+            unidades=Sum('cantidad'),
+            total_lineas=Sum(F('cantidad') * F('precio_venta_momento'), output_field=DecimalField()),
+            cant_tickets=Count('venta_id', distinct=True),
+        )
+        .order_by()
+    )
+    VentaDiaria.objects.bulk_create([
+        VentaDiaria(
+            sucursal_id=f['venta__sucursal_id'],
+            producto_id=f['producto_id'],
+            fecha=f['dia'],
+            unidades=f['unidades'] or 0,
+            total=f['total_lineas'] or 0,
+            tickets=f['cant_tickets'],
+        )
+        for f in por_producto
+    ], batch_size=2000)
+
+    unidades = {
+        (f['venta__sucursal_id'], f['dia']): f['unidades'] or 0
+        for f in VentaItem.objects.annotate(dia=TruncDate('venta__fecha'))
+        .values('venta__sucursal_id', 'dia').annotate(unidades=Sum('cantidad')).order_by()
+    }
+    VentaDiariaSucursal.objects.bulk_create([
+        VentaDiariaSucursal(
+            sucursal_id=f['sucursal_id'],
+            fecha=f['dia'],
+            tickets=f['cant_tickets'],
+            unidades=unidades.get((f['sucursal_id'], f['dia']), 0),
+            total=f['suma_total'] or 0,
+        )
+        # Como rollup.reconstruir: las ventas sin líneas no cuentan como tickets
+        for f in Venta.objects.filter(Exists(VentaItem.objects.filter(venta_id=OuterRef('pk'))))
+        .annotate(dia=TruncDate('fecha'))
+        .values('sucursal_id', 'dia').annotate(cant_tickets=Count('id'), suma_total=Sum('total')).order_by()
+    ], batch_size=2000)
+
+
+def noop_reverse(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0001_initial'),
+        ('products', '0003_producto_es_fabricable'),
+        ('sales', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tickets', models.PositiveIntegerField(default=0, help_text='Ventas del día que incluyeron el producto')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='products.producto')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='locations.ubicacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Ventas diarias',
+                'indexes': [models.Index(fields=['fecha', 'sucursal'], name='ventadiaria_fecha_suc_idx')],
+                'unique_together': {('sucursal', 'producto', 'fecha')},
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaSucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tickets', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias_sucursal', to='locations.ubicacion')),
+            ],
+            options={
+                'verbose_name_plural': 'Ventas diarias por sucursal',
+                'indexes': [models.Index(fields=['fecha'], name='ventadiariasuc_fecha_idx')],
+                'unique_together': {('sucursal', 'fecha')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, noop_reverse),
+    ]
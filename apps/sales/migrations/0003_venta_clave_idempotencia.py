@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0002_ventadiaria_ventadiariasucursal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, help_text='Clave generada por el punto de venta; una venta sincronizada dos veces se registra una sola vez', max_length=64, null=True, unique=True),
+        ),
+    ]
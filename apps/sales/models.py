@@ -1,65 +1,69 @@
 from django.db import models
 from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
 from apps.products.models import Producto
 from apps.locations.models import Ubicacion, SubUbicacion
-from apps.inventory.models import Stock
+from apps.inventory.services import descontar_fifo
 
 class Venta(models.Model):
     vendedor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     sucursal = models.ForeignKey(Ubicacion, on_delete=models.CASCADE, related_name='ventas')
-    fecha = models.DateTimeField(auto_now_add=True)
+    # default en vez de auto_now_add: las ventas sincronizadas conservan la
+    # fecha en que se hicieron en el punto de venta
+    fecha = models.DateTimeField(default=timezone.now, editable=False)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    clave_idempotencia = models.CharField(
+        max_length=64, unique=True, null=True, blank=True,
+        help_text="Clave generada por el punto de venta; una venta sincronizada dos veces se registra una sola vez"
+    )
 
-    def procesar_venta(self, items_data):
+    @classmethod
+    def registrar(cls, items_data, **campos):
         """
-        Lógica atómica: registra items y descuenta stock.
-        items_data: lista de diccionarios con producto, sub_ubicacion, cantidad y precio.
+        Crea la venta (campos: vendedor, sucursal, ...) con sus items y
+        descuenta el stock en una sola transacción.
+        items_data: lista de diccionarios con producto, sub_ubicacion_origen, cantidad y precio_venta_momento.
+
+        El stock se valida antes de escribir la venta: descontar_fifo llama a
+        crear_referencia recién con todas las líneas cubiertas, así una venta
+        rechazada no inserta filas ni consume ids. El total se calcula antes del
+        INSERT, los items van en un bulk_create y lanza StockInsuficiente si
+        alguna línea no alcanza.
         """
+        venta = cls(total=sum(item['cantidad'] * item['precio_venta_momento'] for item in items_data), **campos)
+
+        def insertar():
+            venta.save(force_insert=True)
+            return venta.id
+
         with transaction.atomic():
-            total_venta = 0
-            for item in items_data:
-                # 1. Validar y descontar Stock usando FIFO (First In, First Out)
-                # Obtener todos los lotes del producto en esta sub-ubicación
-                stocks_disponibles = Stock.objects.select_for_update().filter(
-                    producto=item['producto'],
-                    sub_ubicacion=item['sub_ubicacion_origen'],
-                    cantidad__gt=0
-                ).order_by('fecha_ingreso', 'id')
-                
-                if not stocks_disponibles.exists():
-                    raise Exception(f"No hay stock de {item['producto'].nombre} en {item['sub_ubicacion_origen'].nombre}")
-                
-                # Verificar que hay stock suficiente en total
-                total_disponible = sum(s.cantidad for s in stocks_disponibles)
-                if total_disponible < item['cantidad']:
-                    raise Exception(f"Stock insuficiente de {item['producto'].nombre} en {item['sub_ubicacion_origen'].nombre}")
-
-                # Descontar de los lotes usando FIFO
-                cantidad_restante = item['cantidad']
-                for stock_actual in stocks_disponibles:
-                    if cantidad_restante <= 0:
-                        break
-                    
-                    cantidad_a_descontar = min(stock_actual.cantidad, cantidad_restante)
-                    stock_actual.cantidad -= cantidad_a_descontar
-                    stock_actual.save()
-                    
-                    cantidad_restante -= cantidad_a_descontar
-
-                # 2. Crear el item de venta
-                VentaItem.objects.create(
-                    venta=self,
+            # 1. Validar y descontar Stock usando FIFO; la venta se inserta ya validada
+            descontar_fifo([
+                {
+                    'producto': item['producto'],
+                    'sub_ubicacion': item['sub_ubicacion_origen'],
+                    'cantidad': item['cantidad'],
+                }
+                for item in items_data
+            ], tipo='venta', usuario=venta.vendedor_id, crear_referencia=insertar)
+
+            # 2. Crear los items de venta
+            VentaItem.objects.bulk_create([
+                VentaItem(
+                    venta=venta,
                     producto=item['producto'],
                     sub_ubicacion_origen=item['sub_ubicacion_origen'],
                     cantidad=item['cantidad'],
                     precio_venta_momento=item['precio_venta_momento']
                 )
-                total_venta += (item['cantidad'] * item['precio_venta_momento'])
+                for item in items_data
+            ])
 
-            # 3. Actualizar el total de la venta
-            self.total = total_venta
-            self.save()
+            # 3. Acumular en el rollup diario (misma transacción)
+            from .rollup import acumular_venta
+            acumular_venta(venta, items_data)
+        return venta
 
     def __str__(self):
         return f"Venta {self.id} - {self.sucursal.nombre} ({self.fecha.strftime('%d/%m/%Y')})"
@@ -73,5 +77,47 @@ class VentaItem(models.Model):
 
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre}"
-    
-    
\ No newline at end of file
+
+
+class VentaDiaria(models.Model):
+    """
+    Rollup de ventas por sucursal × producto × día.
+    Se actualiza incrementalmente en Venta.registrar y puede reconstruirse
+    desde el historial con `python manage.py rebuild_ventas_diarias`.
+    """
+    sucursal = models.ForeignKey(Ubicacion, on_delete=models.CASCADE, related_name='ventas_diarias')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='ventas_diarias')
+    fecha = models.DateField()
+    unidades = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tickets = models.PositiveIntegerField(default=0, help_text="Ventas del día que incluyeron el producto")
+
+    class Meta:
+        unique_together = ('sucursal', 'producto', 'fecha')
+        indexes = [
+            models.Index(fields=['fecha', 'sucursal'], name='ventadiaria_fecha_suc_idx'),
+        ]
+        verbose_name_plural = "Ventas diarias"
+
+    def __str__(self):
+        return f"{self.fecha} - {self.sucursal.nombre} - {self.producto.nombre}: {self.unidades}"
+
+
+class VentaDiariaSucursal(models.Model):
+    """Rollup de ventas por sucursal × día (cantidad de tickets y facturación)."""
+    sucursal = models.ForeignKey(Ubicacion, on_delete=models.CASCADE, related_name='ventas_diarias_sucursal')
+    fecha = models.DateField()
+    tickets = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('sucursal', 'fecha')
+        indexes = [
+            models.Index(fields=['fecha'], name='ventadiariasuc_fecha_idx'),
+        ]
+        verbose_name_plural = "Ventas diarias por sucursal"
+
+    def __str__(self):
+        return f"{self.fecha} - {self.sucursal.nombre}: {self.total}"
+
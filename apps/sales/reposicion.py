@@ -0,0 +1,132 @@
+"""
+Sugerencias de reposición por sucursal × producto a partir de la velocidad de venta.
+
+La velocidad sale del rollup VentaDiaria (unidades vendidas en la ventana / días
+de la ventana) y se compara contra el stock de la sucursal más lo que ya está
+en camino (pedidos en borrador, pendientes o aprobados hacia ella). Si la
+cobertura queda por debajo del umbral, se sugiere pedir lo necesario para
+llegar a los días objetivo.
+
+Todo se resuelve con tres aggregates agrupados (ventas, stock y en camino), sin
+importar cuántos productos o sucursales haya; en Python sólo se cruzan los
+pares con ventas en la ventana.
+"""
+
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+
+from apps.inventory.models import Pedido, PedidoItem, Stock
+
+from .models import VentaDiaria
+
+DIAS_VENTANA = 28
+DIAS_OBJETIVO = 14
+DIAS_UMBRAL = 7
+ESTADOS_EN_CAMINO = ('borrador', 'pendiente', 'aprobado')
+BATCH = 2000
+
+
+def _por_par(filas, campo_sucursal, campo_total):
+    return {(fila[campo_sucursal], fila['producto_id']): fila[campo_total] for fila in filas}
+
+
+def calcular_sugerencias(dias_ventana=DIAS_VENTANA, dias_objetivo=DIAS_OBJETIVO, dias_umbral=DIAS_UMBRAL,
+                         sucursal_id=None, hoy=None):
+    """
+    Devuelve una lista de sugerencias, ordenada por sucursal y por días de
+    cobertura (los más urgentes primero):
+    [{sucursal_id, sucursal_nombre, producto_id, producto_nombre, vendidas,
+      velocidad_diaria, stock, en_camino, dias_cobertura, sugerido,
+      precio_costo}]
+
+    Sólo se consideran los pares con ventas en los últimos `dias_ventana` días
+    (incluido `hoy`); un par sin ventas no tiene velocidad de la que partir.
+    """
+    hoy = hoy or date.today()
+    ventas = VentaDiaria.objects.filter(fecha__gt=hoy - timedelta(days=dias_ventana), fecha__lte=hoy)
+    stock = Stock.objects.filter(cantidad__gt=0)
+    en_camino = PedidoItem.objects.filter(pedido__estado__in=ESTADOS_EN_CAMINO)
+    if sucursal_id:
+        ventas = ventas.filter(sucursal_id=sucursal_id)
+        stock = stock.filter(sub_ubicacion__ubicacion_id=sucursal_id)
+        en_camino = en_camino.filter(pedido__destino_id=sucursal_id)
+
+    vendidas = list(
+        ventas.values('sucursal_id', 'sucursal__nombre', 'producto_id', 'producto__nombre', 'producto__costo_compra')
+        .annotate(unidades_ventana=Sum('unidades'))
+        .filter(unidades_ventana__gt=0)
+        .order_by()
+    )
+    if not vendidas:
+        return []
+    existencias = _por_par(
+        stock.values('sub_ubicacion__ubicacion_id', 'producto_id').annotate(total=Sum('cantidad')).order_by(),
+        'sub_ubicacion__ubicacion_id', 'total',
+    )
+    pedidas = _por_par(
+        en_camino.values('pedido__destino_id', 'producto_id').annotate(total=Sum('cantidad')).order_by(),
+        'pedido__destino_id', 'total',
+    )
+
+    sugerencias = []
+    for fila in vendidas:
+        par = (fila['sucursal_id'], fila['producto_id'])
+        velocidad = fila['unidades_ventana'] / dias_ventana
+        disponible = float(existencias.get(par) or 0)
+        camino = pedidas.get(par) or 0
+        cobertura = (disponible + camino) / velocidad
+        if cobertura >= dias_umbral:
+            continue
+        sugerido = math.ceil(velocidad * dias_objetivo - disponible - camino)
+        if sugerido <= 0:
+            continue
+        sugerencias.append({
+            'sucursal_id': fila['sucursal_id'],
+            'sucursal_nombre': fila['sucursal__nombre'],
+            'producto_id': fila['producto_id'],
+            'producto_nombre': fila['producto__nombre'],
+            'vendidas': fila['unidades_ventana'],
+            'velocidad_diaria': round(velocidad, 3),
+            'stock': disponible,
+            'en_camino': camino,
+            'dias_cobertura': round(cobertura, 1),
+            'sugerido': sugerido,
+            'precio_costo': fila['producto__costo_compra'],
+        })
+    sugerencias.sort(key=lambda s: (s['sucursal_id'], s['dias_cobertura'], s['producto_id']))
+    return sugerencias
+
+
+def generar_pedidos(sugerencias, usuario):
+    """
+    Crea un pedido en borrador por sucursal con los items sugeridos (al costo
+    de compra actual del producto). Devuelve los pedidos creados. Como quedan
+    en camino, una nueva corrida no vuelve a sugerir lo mismo.
+    """
+    por_sucursal = defaultdict(list)
+    for sugerencia in sugerencias:
+        por_sucursal[sugerencia['sucursal_id']].append(sugerencia)
+
+    with transaction.atomic():
+        pedidos = [
+            Pedido.objects.create(creado_por=usuario, destino_id=sucursal_id, estado='borrador')
+            for sucursal_id in sorted(por_sucursal)
+        ]
+        PedidoItem.objects.bulk_create(
+            [
+                PedidoItem(
+                    pedido=pedido,
+                    producto_id=sugerencia['producto_id'],
+                    cantidad=sugerencia['sugerido'],
+                    precio_costo_momento=sugerencia['precio_costo'],
+                )
+                for pedido in pedidos
+                for sugerencia in por_sucursal[pedido.destino_id]
+            ],
+            batch_size=BATCH,
+        )
+    return pedidos
@@ -0,0 +1,286 @@
+"""
+Mantenimiento de los rollups diarios de ventas (VentaDiaria y VentaDiariaSucursal).
+
+acumular_venta() se llama dentro de la transacción de Venta.registrar (y
+acumular_ventas() dentro de la sincronización en lote); reconstruir()
+recalcula los rollups desde Venta/VentaItem para un rango de fechas.
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.inventory import cambios
+
+from .models import Venta, VentaDiaria, VentaDiariaSucursal, VentaItem
+
+BATCH = 2000
+
+
+def _pk(valor):
+    return getattr(valor, 'pk', valor)
+
+
+def parsear_fecha(valor):
+    """Normaliza un parámetro de fecha (date, 'YYYY-MM-DD' o ISO datetime) a date."""
+    if not valor or isinstance(valor, date):
+        return valor or None
+    fecha = parse_date(valor)
+    if fecha is None:
+        fecha_hora = parse_datetime(valor)
+        fecha = fecha_hora.date() if fecha_hora else None
+    return fecha
+
+
+def dia_de_venta(venta):
+    fecha = venta.fecha or timezone.now()
+    return timezone.localdate(fecha) if timezone.is_aware(fecha) else fecha.date()
+
+
+def _crear_o_sumar(modelo, nuevos, claves):
+    """
+    Inserta las filas nuevas del rollup. Si otra transacción insertó la misma
+    clave en paralelo, se suma con un UPDATE por fila (camino poco frecuente).
+    """
+    if not nuevos:
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.bulk_create(nuevos)
+    except IntegrityError:
+        campos = [f for f in ('unidades', 'total', 'tickets') if hasattr(nuevos[0], f)]
+        for fila in nuevos:
+            filtro = {c: getattr(fila, c) for c in claves}
+            actualizadas = modelo.objects.filter(**filtro).update(
+                **{c: F(c) + getattr(fila, c) for c in campos}
+            )
+            if not actualizadas:
+                fila.save()
+
+
+def acumular_venta(venta, items_data, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) las líneas de una venta en los rollups.
+    items_data: lista de dicts con producto, cantidad y precio_venta_momento.
+    """
+    acumular_ventas([(venta, items_data)], signo=signo)
+
+
+def _filtro_dias(claves, con_producto):
+    """Q para las filas de rollup de las claves (sucursal_id, fecha[, producto_id])."""
+    productos = defaultdict(set)
+    for clave in claves:
+        productos[clave[:2]].add(clave[2] if con_producto else None)
+    filtro = Q()
+    for (sucursal_id, fecha), producto_ids in productos.items():
+        condicion = Q(sucursal_id=sucursal_id, fecha=fecha)
+        if con_producto:
+            condicion &= Q(producto_id__in=sorted(producto_ids))
+        filtro |= condicion
+    return filtro
+
+
+def acumular_ventas(ventas_items, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) varias ventas en los rollups con una
+    lectura bloqueada por tabla, sin importar cuántas ventas sean.
+    ventas_items: lista de (venta, items_data) como en acumular_venta.
+    """
+    # (sucursal_id, fecha, producto_id) y (sucursal_id, fecha) -> [unidades, total, tickets]
+    por_producto = defaultdict(lambda: [0, Decimal('0'), 0])
+    por_sucursal = defaultdict(lambda: [0, Decimal('0'), 0])
+    for venta, items_data in ventas_items:
+        if not items_data:
+            continue
+        fecha = dia_de_venta(venta)
+        productos_venta = set()
+        dia = por_sucursal[(venta.sucursal_id, fecha)]
+        dia[2] += 1
+        for item in items_data:
+            producto_id = _pk(item['producto'])
+            total = Decimal(item['cantidad']) * Decimal(item['precio_venta_momento'])
+            acumulado = por_producto[(venta.sucursal_id, fecha, producto_id)]
+            acumulado[0] += item['cantidad']
+            acumulado[1] += total
+            if producto_id not in productos_venta:
+                productos_venta.add(producto_id)
+                acumulado[2] += 1
+            dia[0] += item['cantidad']
+            dia[1] += total
+
+    if not por_producto:
+        return
+    cambios.registrar_cambio()
+
+    # Rollup por producto: una lectura bloqueada + bulk_update + bulk_create
+    existentes = {
+        (fila.sucursal_id, fila.fecha, fila.producto_id): fila
+        for fila in VentaDiaria.objects.select_for_update().filter(
+            _filtro_dias(por_producto, con_producto=True)
+        ).order_by('sucursal_id', 'fecha', 'producto_id')
+    }
+    # Orden fijo por clave para que ventas concurrentes bloqueen/inserten igual
+    nuevos = []
+    for clave, (unidades, total, tickets) in sorted(por_producto.items()):
+        fila = existentes.get(clave)
+        if fila:
+            fila.unidades += signo * unidades
+            fila.total += signo * total
+            fila.tickets += signo * tickets
+        elif signo > 0:
+            nuevos.append(VentaDiaria(
+                sucursal_id=clave[0],
+                fecha=clave[1],
+                producto_id=clave[2],
+                unidades=unidades,
+                total=total,
+                tickets=tickets,
+            ))
+    # Al revertir, las filas que quedan sin tickets se eliminan (igual que en reconstruir)
+    vacias = [fila.id for fila in existentes.values() if fila.tickets <= 0]
+    if vacias:
+        VentaDiaria.objects.filter(id__in=vacias).delete()
+    a_actualizar = [fila for fila in existentes.values() if fila.tickets > 0]
+    if a_actualizar:
+        VentaDiaria.objects.bulk_update(a_actualizar, ['unidades', 'total', 'tickets'])
+    _crear_o_sumar(VentaDiaria, nuevos, ('sucursal_id', 'producto_id', 'fecha'))
+
+    # Rollup por sucursal
+    existentes = {
+        (fila.sucursal_id, fila.fecha): fila
+        for fila in VentaDiariaSucursal.objects.select_for_update().filter(
+            _filtro_dias(por_sucursal, con_producto=False)
+        ).order_by('sucursal_id', 'fecha')
+    }
+    nuevos = []
+    vacias = []
+    a_actualizar = []
+    for clave, (unidades, total, tickets) in sorted(por_sucursal.items()):
+        fila = existentes.get(clave)
+        if fila and fila.tickets + signo * tickets <= 0:
+            vacias.append(fila.id)
+        elif fila:
+            fila.tickets += signo * tickets
+            fila.unidades += signo * unidades
+            fila.total += signo * total
+            a_actualizar.append(fila)
+        elif signo > 0:
+            nuevos.append(VentaDiariaSucursal(
+                sucursal_id=clave[0],
+                fecha=clave[1],
+                tickets=tickets,
+                unidades=unidades,
+                total=total,
+            ))
+    if vacias:
+        VentaDiariaSucursal.objects.filter(id__in=vacias).delete()
+    if a_actualizar:
+        VentaDiariaSucursal.objects.bulk_update(a_actualizar, ['tickets', 'unidades', 'total'])
+    _crear_o_sumar(VentaDiariaSucursal, nuevos, ('sucursal_id', 'fecha'))
+
+
+def revertir_venta(venta):
+    """Descuenta de los rollups una venta ya registrada (p. ej. antes de borrarla)."""
+    items = [
+        {'producto': i.producto_id, 'cantidad': i.cantidad, 'precio_venta_momento': i.precio_venta_momento}
+        for i in venta.items.all()
+    ]
+    acumular_venta(venta, items, signo=-1)
+
+
+def reconstruir(desde=None, hasta=None, sucursal_id=None):
+    """
+    Recalcula los rollups desde el historial de ventas para el rango dado
+    (fechas inclusive). Devuelve la cantidad de filas generadas por tabla.
+    Como acumular_ventas(), sólo cuenta las ventas que tienen líneas.
+    """
+    items_qs = VentaItem.objects.annotate(dia=TruncDate('venta__fecha'))
+    ventas_qs = Venta.objects.filter(
+        Exists(VentaItem.objects.filter(venta_id=OuterRef('pk')))
+    ).annotate(dia=TruncDate('fecha'))
+    diaria_qs = VentaDiaria.objects.all()
+    diaria_suc_qs = VentaDiariaSucursal.objects.all()
+
+    if desde:
+        items_qs = items_qs.filter(dia__gte=desde)
+        ventas_qs = ventas_qs.filter(dia__gte=desde)
+        diaria_qs = diaria_qs.filter(fecha__gte=desde)
+        diaria_suc_qs = diaria_suc_qs.filter(fecha__gte=desde)
+    if hasta:
+        items_qs = items_qs.filter(dia__lte=hasta)
+        ventas_qs = ventas_qs.filter(dia__lte=hasta)
+        diaria_qs = diaria_qs.filter(fecha__lte=hasta)
+        diaria_suc_qs = diaria_suc_qs.filter(fecha__lte=hasta)
+    if sucursal_id:
+        items_qs = items_qs.filter(venta__sucursal_id=sucursal_id)
+        ventas_qs = ventas_qs.filter(sucursal_id=sucursal_id)
+        diaria_qs = diaria_qs.filter(sucursal_id=sucursal_id)
+        diaria_suc_qs = diaria_suc_qs.filter(sucursal_id=sucursal_id)
+
+    por_producto = (
+        items_qs.values('venta__sucursal_id', 'producto_id', 'dia')
+        .annotate(
+            unidades=Sum('cantidad'),
+            total_lineas=Sum(F('cantidad') * F('precio_venta_momento'), output_field=DecimalField()),
+            cant_tickets=Count('venta_id', distinct=True),
+        )
+        .order_by()
+    )
+    unidades_por_venta = (
+        items_qs.values('venta__sucursal_id', 'dia')
+        .annotate(unidades=Sum('cantidad'))
+        .order_by()
+    )
+    por_sucursal = (
+        ventas_qs.values('sucursal_id', 'dia')
+        .annotate(cant_tickets=Count('id'), suma_total=Sum('total'))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        diaria_qs.delete()
+        diaria_suc_qs.delete()
+        cambios.registrar_cambio()
+
+        filas_producto = 0
+        buffer = []
+        for fila in por_producto.iterator(chunk_size=BATCH):
+            buffer.append(VentaDiaria(
+                sucursal_id=fila['venta__sucursal_id'],
+                producto_id=fila['producto_id'],
+                fecha=fila['dia'],
+                unidades=fila['unidades'] or 0,
+                total=fila['total_lineas'] or Decimal('0'),
+                tickets=fila['cant_tickets'],
+            ))
+            if len(buffer) >= BATCH:
+                VentaDiaria.objects.bulk_create(buffer)
+                filas_producto += len(buffer)
+                buffer = []
+        if buffer:
+            VentaDiaria.objects.bulk_create(buffer)
+            filas_producto += len(buffer)
+
+        unidades = {
+            (f['venta__sucursal_id'], f['dia']): f['unidades'] or 0
+            for f in unidades_por_venta
+        }
+        filas_sucursal = [
+            VentaDiariaSucursal(
+                sucursal_id=fila['sucursal_id'],
+                fecha=fila['dia'],
+                tickets=fila['cant_tickets'],
+                unidades=unidades.get((fila['sucursal_id'], fila['dia']), 0),
+                total=fila['suma_total'] or Decimal('0'),
+            )
+            for fila in por_sucursal
+        ]
+        VentaDiariaSucursal.objects.bulk_create(filas_sucursal, batch_size=BATCH)
+
+    return {'ventas_diarias': filas_producto, 'ventas_diarias_sucursal': len(filas_sucursal)}
@@ -1,6 +1,17 @@
-from rest_framework import serializers
+from django.db import DatabaseError
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from apps.inventory.services import con_reintentos, es_error_de_bloqueo
+from . import reposicion
 from .models import Venta, VentaItem
 
+class VentaEnConflicto(APIException):
+    """La venta no pudo registrarse por bloqueos concurrentes, aun con reintentos."""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'El stock está siendo modificado por otra operación. Intentá nuevamente.'
+    default_code = 'conflicto_concurrente'
+
 class VentaItemSerializer(serializers.ModelSerializer):
     producto_nombre = serializers.ReadOnlyField(source='producto.nombre')
 
@@ -19,22 +30,48 @@ class VentaSerializer(serializers.ModelSerializer):
         read_only_fields = ['vendedor', 'vendedor_nombre', 'sucursal_nombre', 'total', 'fecha']
 
     def create(self, validated_data):
-        # La creación real la delegamos al método procesar_venta del modelo
+        # La creación real la delegamos a Venta.registrar: valida el stock,
+        # inserta la venta y descuenta en una sola transacción
         items_data = validated_data.pop('items')
-        # Asignamos el vendedor desde el request context
-        vendedor = self.context['request'].user
-        
-        venta = Venta.objects.create(**validated_data)
+
         try:
-            venta.procesar_venta(items_data)
+            return con_reintentos(lambda: Venta.registrar(items_data, **validated_data))
+        except DatabaseError as e:
+            if es_error_de_bloqueo(e):
+                raise VentaEnConflicto()
+            raise serializers.ValidationError(str(e))
         except Exception as e:
-            venta.delete() # Si falla el stock, borramos el registro de venta
             raise serializers.ValidationError(str(e))
-            
-        return venta
     
 class ReporteEconomicoSerializer(serializers.Serializer):
     sucursal_nombre = serializers.CharField()
     total_gastos = serializers.DecimalField(max_digits=12, decimal_places=2)
     total_ventas = serializers.DecimalField(max_digits=12, decimal_places=2)
-    balance = serializers.DecimalField(max_digits=12, decimal_places=2)
\ No newline at end of file
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2)
+class VentaSincronizadaItemSerializer(serializers.Serializer):
+    producto = serializers.IntegerField(min_value=1)
+    sub_ubicacion_origen = serializers.IntegerField(min_value=1)
+    cantidad = serializers.IntegerField(min_value=1)
+    precio_venta_momento = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+class VentaSincronizadaSerializer(serializers.Serializer):
+    """
+    Una venta de la sincronización en lote (ver apps.sales.sincronizacion). Las
+    relaciones llegan como ids y se resuelven para todo el lote de una vez.
+    """
+    clave = serializers.CharField(max_length=64)
+    sucursal = serializers.IntegerField(min_value=1)
+    fecha = serializers.DateTimeField(required=False)
+    items = VentaSincronizadaItemSerializer(many=True, allow_empty=False)
+
+class ReposicionSerializer(serializers.Serializer):
+    """Parámetros del cálculo de reposición (ver apps.sales.reposicion)."""
+    dias_ventana = serializers.IntegerField(min_value=1, max_value=365, default=reposicion.DIAS_VENTANA)
+    dias_objetivo = serializers.IntegerField(min_value=1, max_value=365, default=reposicion.DIAS_OBJETIVO)
+    dias_umbral = serializers.IntegerField(min_value=0, max_value=365, default=reposicion.DIAS_UMBRAL)
+    sucursal = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs['dias_umbral'] > attrs['dias_objetivo']:
+            raise serializers.ValidationError('dias_umbral no puede superar a dias_objetivo.')
+        return attrs
@@ -0,0 +1,202 @@
+"""
+Sincronización en lote de las ventas que un punto de venta acumuló sin conexión.
+
+Cada venta trae una clave de idempotencia generada por el punto de venta. Las
+claves ya registradas se informan como duplicadas sin tocar stock, así que
+reintentar un lote (o parte de él) nunca descuenta dos veces.
+
+El lote completo se resuelve con una cantidad fija de queries: una lectura de
+las claves ya registradas, una por modelo para validar los ids, un único
+SELECT ... FOR UPDATE de los lotes de stock (en orden de id, como
+descontar_fifo) y después bulk_create de Venta y VentaItem, un descontar_fifo
+sobre los lotes ya bloqueados y una actualización de los rollups. Las ventas
+se validan en el orden recibido contra el stock que dejan las anteriores del
+lote; las que no alcanzan se informan y no se escribe nada de ellas.
+
+Cada venta puede traer la fecha en que se hizo en el punto de venta; es la que
+se guarda y la que cuenta en los rollups. Sin fecha se usa la de la
+sincronización. Se rechazan fechas futuras (más allá de TOLERANCIA_RELOJ, por
+el desfasaje del reloj del punto de venta) o más viejas que MAX_ANTIGUEDAD.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from apps.inventory.services import CERO, bloquear_lotes, descontar_fifo
+from apps.locations.models import SubUbicacion, Ubicacion
+from apps.products.models import Producto
+
+from .models import Venta, VentaItem
+from .rollup import acumular_ventas
+from .serializers import VentaSincronizadaSerializer
+
+MAX_VENTAS = 500
+BATCH = 500
+MAX_ANTIGUEDAD = timedelta(days=30)
+TOLERANCIA_RELOJ = timedelta(minutes=5)
+
+
+def _fallo(clave, error):
+    return {'clave': clave, 'ok': False, 'error': error}
+
+
+def _registrada(clave, venta_id, total, duplicada):
+    return {'clave': clave, 'ok': True, 'id': venta_id, 'total': total, 'duplicada': duplicada}
+
+
+def _total(items):
+    return sum(item['cantidad'] * item['precio_venta_momento'] for item in items)
+
+
+def _error_fecha(fecha, ahora):
+    if fecha > ahora + TOLERANCIA_RELOJ:
+        return 'La fecha de la venta no puede ser futura.'
+    if fecha < ahora - MAX_ANTIGUEDAD:
+        return f'La fecha de la venta no puede tener más de {MAX_ANTIGUEDAD.days} días.'
+    return None
+
+
+def _validar_formato(datos, resultados, ahora):
+    """Valida cada venta por separado; devuelve [(posicion, venta)] de las válidas y no repetidas."""
+    validas = []
+    vistas = set()
+    for posicion, dato in enumerate(datos):
+        clave = dato.get('clave') if isinstance(dato, dict) else None
+        serializer = VentaSincronizadaSerializer(data=dato)
+        if not serializer.is_valid():
+            resultados[posicion] = _fallo(clave, serializer.errors)
+            continue
+        venta = serializer.validated_data
+        error = _error_fecha(venta['fecha'], ahora) if 'fecha' in venta else None
+        if error:
+            resultados[posicion] = _fallo(clave, {'fecha': [error]})
+            continue
+        if venta['clave'] in vistas:
+            resultados[posicion] = _fallo(clave, 'Clave repetida en el lote.')
+            continue
+        vistas.add(venta['clave'])
+        validas.append((posicion, venta))
+    return validas
+
+
+def _validar_referencias(ventas, resultados):
+    """
+    Descarta las ventas con sucursal, producto o sub-ubicación inexistentes.
+    Devuelve (ventas válidas, {producto_id: nombre}, {sub_ubicacion_id: nombre}).
+    """
+    sucursal_ids = {venta['sucursal'] for _, venta in ventas}
+    producto_ids = {item['producto'] for _, venta in ventas for item in venta['items']}
+    sub_ids = {item['sub_ubicacion_origen'] for _, venta in ventas for item in venta['items']}
+    sucursales = set(Ubicacion.objects.filter(id__in=sucursal_ids).values_list('id', flat=True))
+    productos = dict(Producto.objects.filter(id__in=producto_ids).values_list('id', 'nombre'))
+    subs = dict(SubUbicacion.objects.filter(id__in=sub_ids).values_list('id', 'nombre'))
+
+    validas = []
+    for posicion, venta in ventas:
+        if venta['sucursal'] not in sucursales:
+            resultados[posicion] = _fallo(venta['clave'], f"La sucursal {venta['sucursal']} no existe.")
+        elif any(item['producto'] not in productos for item in venta['items']):
+            resultados[posicion] = _fallo(venta['clave'], 'Algún producto de la venta no existe.')
+        elif any(item['sub_ubicacion_origen'] not in subs for item in venta['items']):
+            resultados[posicion] = _fallo(venta['clave'], 'Alguna sub-ubicación de la venta no existe.')
+        else:
+            validas.append((posicion, venta))
+    return validas, productos, subs
+
+
+def sincronizar_ventas(datos, vendedor):
+    """
+    Registra las ventas de `datos` ([{clave, sucursal, fecha?, items: [{producto,
+    sub_ubicacion_origen, cantidad, precio_venta_momento}]}], como llegan en
+    el body) a nombre de `vendedor`. Devuelve, en el mismo orden,
+    [{'clave', 'ok': True, 'id', 'total', 'duplicada'}] o
+    [{'clave', 'ok': False, 'error'}].
+
+    Debe llamarse dentro de transaction.atomic(). Si otra transacción
+    registra en paralelo una de las claves, el bulk_create lanza
+    IntegrityError: reintentando, esa venta vuelve como duplicada.
+    """
+    ahora = timezone.now()
+    resultados = [None] * len(datos)
+    validas = _validar_formato(datos, resultados, ahora)
+
+    # Reintentos del punto de venta: se informan sin volver a descontar
+    registradas = {
+        clave: (venta_id, total)
+        for clave, venta_id, total in Venta.objects.filter(
+            clave_idempotencia__in=[venta['clave'] for _, venta in validas]
+        ).values_list('clave_idempotencia', 'id', 'total')
+    }
+    nuevas = []
+    for posicion, venta in validas:
+        if venta['clave'] in registradas:
+            resultados[posicion] = _registrada(venta['clave'], *registradas[venta['clave']], duplicada=True)
+        else:
+            nuevas.append((posicion, venta))
+
+    nuevas, productos, subs = _validar_referencias(nuevas, resultados)
+
+    # Un único bloqueo de lotes para todo el lote; cada venta consume de lo
+    # que dejan las anteriores
+    lotes = bloquear_lotes(list({
+        (item['producto'], item['sub_ubicacion_origen']) for _, venta in nuevas for item in venta['items']
+    }))
+    disponible = {par: sum((stock.cantidad for stock in lista), CERO) for par, lista in lotes.items()}
+    aceptadas = []
+    for posicion, venta in nuevas:
+        requerido = defaultdict(int)
+        for item in venta['items']:
+            requerido[(item['producto'], item['sub_ubicacion_origen'])] += item['cantidad']
+        faltante = next((par for par, cantidad in requerido.items() if disponible.get(par, CERO) < cantidad), None)
+        if faltante:
+            resultados[posicion] = _fallo(
+                venta['clave'],
+                f"Stock insuficiente de {productos[faltante[0]]} en {subs[faltante[1]]}. "
+                f"Disponible: {disponible.get(faltante, CERO)}, requerido: {requerido[faltante]}."
+            )
+            continue
+        for par, cantidad in requerido.items():
+            disponible[par] -= cantidad
+        aceptadas.append((posicion, venta))
+
+    if not aceptadas:
+        return resultados
+
+    ventas = [
+        Venta(vendedor=vendedor, sucursal_id=venta['sucursal'], clave_idempotencia=venta['clave'],
+              fecha=venta.get('fecha', ahora), total=_total(venta['items']))
+        for _, venta in aceptadas
+    ]
+    Venta.objects.bulk_create(ventas, batch_size=BATCH)
+    # MySQL no devuelve los ids de un bulk_create: se leen por la clave
+    ids = dict(Venta.objects.filter(
+        clave_idempotencia__in=[venta.clave_idempotencia for venta in ventas]
+    ).values_list('clave_idempotencia', 'id'))
+    for venta in ventas:
+        venta.id = ids[venta.clave_idempotencia]
+
+    descontar_fifo(
+        [
+            {'producto': item['producto'], 'sub_ubicacion': item['sub_ubicacion_origen'],
+             'cantidad': item['cantidad'], 'referencia_id': venta.id}
+            for venta, (_, dato) in zip(ventas, aceptadas)
+            for item in dato['items']
+        ],
+        tipo='venta', usuario=vendedor.id, lotes_bloqueados=lotes,
+    )
+    VentaItem.objects.bulk_create(
+        [
+            VentaItem(venta=venta, producto_id=item['producto'], sub_ubicacion_origen_id=item['sub_ubicacion_origen'],
+                      cantidad=item['cantidad'], precio_venta_momento=item['precio_venta_momento'])
+            for venta, (_, dato) in zip(ventas, aceptadas)
+            for item in dato['items']
+        ],
+        batch_size=BATCH,
+    )
+    acumular_ventas([(venta, dato['items']) for venta, (_, dato) in zip(ventas, aceptadas)])
+
+    for venta, (posicion, _) in zip(ventas, aceptadas):
+        resultados[posicion] = _registrada(venta.clave_idempotencia, venta.id, venta.total, duplicada=False)
+    return resultados
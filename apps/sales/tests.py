@@ -1,3 +1,588 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.inventory import ledger, resumen
+from apps.inventory.models import Pedido, PedidoItem, Stock, StockResumen
+from apps.inventory.services import StockInsuficiente
+from apps.locations.models import SubUbicacion, Ubicacion
+from apps.products.models import Categoria, Producto
+from apps.users.models import User
+
+from . import cache_reportes, economico, reposicion, rollup
+from .dashboard import DashboardEngine
+from .models import Venta, VentaDiaria, VentaDiariaSucursal
+
+CERO = Decimal('0')
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CacheReportesTests(TestCase):
+    """Dashboard y reporte económico se sirven del cache hasta que una escritura cambia la versión."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_cache', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.producto = Producto.objects.create(
+            nombre='Yerba', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        Stock.objects.create(producto=cls.producto, sub_ubicacion=cls.sub, cantidad=50)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _vender(self, cantidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/sales/ventas/', {
+                'sucursal': self.sucursal.id,
+                'items': [{'producto': self.producto.id, 'sub_ubicacion_origen': self.sub.id,
+                           'cantidad': cantidad, 'precio_venta_momento': '100'}],
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+
+    def test_segunda_lectura_sale_del_cache(self):
+        primera = self.client.get('/api/sales/dashboard/')
+        with self.assertNumQueries(0):
+            segunda = self.client.get('/api/sales/dashboard/')
+        self.assertEqual(primera['X-Cache'], cache_reportes.FALLO)
+        self.assertEqual(segunda['X-Cache'], cache_reportes.ACIERTO)
+        self.assertEqual(primera.data, segunda.data)
+
+        otra = self.client.get('/api/sales/dashboard/', {'stock_minimo': 100})
+        self.assertEqual(otra['X-Cache'], cache_reportes.FALLO)
+
+    def test_una_venta_invalida_dashboard_y_reporte(self):
+        self.client.get('/api/sales/dashboard/')
+        antes = self.client.get('/api/sales/reporte-economico/')
+        self.assertEqual(antes.data['totales']['total_ventas'], 0)
+
+        self._vender(3)
+
+        dashboard = self.client.get('/api/sales/dashboard/')
+        reporte = self.client.get('/api/sales/reporte-economico/')
+        self.assertEqual(dashboard['X-Cache'], cache_reportes.FALLO)
+        self.assertEqual(reporte['X-Cache'], cache_reportes.FALLO)
+        self.assertEqual(reporte.data['totales']['total_ventas'], 300)
+
+    def test_contadores(self):
+        self.client.get('/api/sales/reporte-economico/')
+        self.client.get('/api/sales/reporte-economico/')
+        datos = self.client.get('/api/sales/dashboard/cache/').data
+        self.assertEqual((datos['aciertos'], datos['fallos'], datos['esperas']), (1, 1, 0))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_pedidos_concurrentes_calculan_una_vez(self):
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(0.2)
+            return {'total': 42}
+
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(cache_reportes.obtener('reportes:prueba', calcular)))
+            for _ in range(5)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual([valor for valor, _ in resultados], [{'total': 42}] * 5)
+        self.assertEqual(sorted(estado for _, estado in resultados),
+                         sorted([cache_reportes.FALLO] + [cache_reportes.ESPERA] * 4))
+
+    def test_si_el_calculo_falla_otro_lo_reintenta(self):
+        def fallar():
+            raise RuntimeError('caída')
+
+        with self.assertRaises(RuntimeError):
+            cache_reportes.obtener('reportes:prueba', fallar)
+        valor, estado = cache_reportes.obtener('reportes:prueba', lambda: 7)
+        self.assertEqual((valor, estado), (7, cache_reportes.FALLO))
+
+
+class ReporteEconomicoTests(TestCase):
+    """El reporte sale de queries agrupadas y compara contra los períodos anteriores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_reporte', password='x', rol='admin')
+        cls.sucursales = [Ubicacion.objects.create(nombre=f'Sucursal {i}', tipo='sucursal') for i in range(3)]
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.producto = Producto.objects.create(
+            nombre='Yerba', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        ventas = {
+            # actual (marzo-abril 2026), período anterior (enero-febrero 2026), año anterior
+            date(2026, 3, 10): Decimal('100.10'),
+            date(2026, 4, 5): Decimal('50.20'),
+            date(2026, 2, 1): Decimal('80.00'),
+            date(2025, 3, 15): Decimal('40.00'),
+        }
+        VentaDiariaSucursal.objects.bulk_create([
+            VentaDiariaSucursal(sucursal=sucursal, fecha=fecha, total=total, tickets=1, unidades=1)
+            for sucursal in cls.sucursales[:2]
+            for fecha, total in ventas.items()
+        ])
+        pedido = Pedido.objects.create(creado_por=cls.admin, destino=cls.sucursales[0], estado='recibido')
+        Pedido.objects.filter(id=pedido.id).update(
+            fecha_creacion=timezone.make_aware(datetime(2026, 3, 20, 12))
+        )
+        PedidoItem.objects.create(pedido=pedido, producto=cls.producto, cantidad=3,
+                                  precio_costo_momento=Decimal('10.05'))
+
+    def test_periodo_y_comparaciones(self):
+        with self.assertNumQueries(3):
+            reporte = economico.reporte_economico(desde=date(2026, 3, 1), hasta=date(2026, 4, 30))
+
+        self.assertEqual(reporte['periodos']['periodo_anterior'],
+                         {'desde': date(2025, 12, 30), 'hasta': date(2026, 2, 28)})
+        primera = reporte['por_sucursal'][0]
+        self.assertEqual(primera['total_ventas'], Decimal('150.30'))
+        self.assertEqual(primera['total_gastos'], Decimal('30.15'))
+        self.assertEqual(primera['balance'], Decimal('120.15'))
+        self.assertEqual([(mes['mes'], mes['total_ventas'], mes['total_gastos']) for mes in primera['por_mes']],
+                         [('2026-03', Decimal('100.10'), Decimal('30.15')), ('2026-04', Decimal('50.20'), CERO)])
+        anterior = primera['comparacion']['periodo_anterior']
+        self.assertEqual(anterior['total_ventas'], Decimal('80.00'))
+        self.assertEqual(anterior['variacion_ventas'], Decimal('87.9'))
+        self.assertEqual(primera['comparacion']['anio_anterior']['total_ventas'], Decimal('40.00'))
+
+        sin_movimientos = reporte['por_sucursal'][2]
+        self.assertEqual(sin_movimientos['total_ventas'], CERO)
+        self.assertIsNone(sin_movimientos['comparacion']['periodo_anterior']['variacion_ventas'])
+        self.assertEqual(reporte['totales']['total_ventas'], Decimal('300.60'))
+
+    def test_queries_fijas_con_mas_sucursales(self):
+        Ubicacion.objects.bulk_create([Ubicacion(nombre=f'Extra {i}', tipo='sucursal') for i in range(20)])
+        with self.assertNumQueries(3):
+            reporte = economico.reporte_economico()
+        self.assertEqual(len(reporte['por_sucursal']), 23)
+        self.assertNotIn('comparacion', reporte['totales'])
+        self.assertEqual(reporte['totales']['total_ventas'], Decimal('540.60'))
+
+
+class SincronizacionVentasTests(TestCase):
+    """Un lote de ventas offline se registra una sola vez, con queries fijas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user(username='kiosco', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(3)
+        ]
+        for producto in cls.productos:
+            Stock.objects.create(producto=producto, sub_ubicacion=cls.sub, cantidad=100)
+        resumen.reconstruir()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendedor)
+
+    def _venta(self, clave, cantidad, producto=0):
+        return {
+            'clave': clave,
+            'sucursal': self.sucursal.id,
+            'items': [{'producto': self.productos[producto].id, 'sub_ubicacion_origen': self.sub.id,
+                       'cantidad': cantidad, 'precio_venta_momento': '10.50'}],
+        }
+
+    def _sincronizar(self, ventas):
+        respuesta = self.client.post('/api/sales/ventas/sincronizar/', {'ventas': ventas}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return respuesta.data
+
+    def _stock(self, producto=0):
+        return Stock.objects.get(producto=self.productos[producto]).cantidad
+
+    def test_registra_valida_y_es_idempotente(self):
+        ventas = [
+            self._venta('k-1', 60),
+            self._venta('k-2', 50),  # ya no alcanza después de k-1
+            self._venta('k-3', 40),
+            self._venta('k-1', 1),
+            {'clave': 'k-4', 'sucursal': self.sucursal.id, 'items': []},
+        ]
+        datos = self._sincronizar(ventas)
+        self.assertEqual((datos['registradas'], datos['duplicadas'], datos['fallidas']), (2, 0, 3))
+        self.assertEqual([r['ok'] for r in datos['resultados']], [True, False, True, False, False])
+        self.assertIn('Stock insuficiente', datos['resultados'][1]['error'])
+        self.assertEqual(datos['resultados'][0]['total'], Decimal('630.00'))
+        self.assertEqual(self._stock(), 0)
+        self.assertEqual(VentaDiariaSucursal.objects.get().tickets, 2)
+
+        otra_vez = self._sincronizar(ventas[:3])
+        self.assertEqual((otra_vez['registradas'], otra_vez['duplicadas'], otra_vez['fallidas']), (0, 2, 1))
+        self.assertEqual(otra_vez['resultados'][0]['id'], datos['resultados'][0]['id'])
+        self.assertEqual(self._stock(), 0)
+        self.assertEqual(Venta.objects.count(), 2)
+        self.assertFalse(any(resumen.verificar().values()))
+
+    def test_queries_fijas_por_lote(self):
+        def queries(prefijo, cantidad):
+            ventas = [self._venta(f'{prefijo}-{i}', 1, producto=i % 3) for i in range(cantidad)]
+            with CaptureQueriesContext(connection) as contexto:
+                self._sincronizar(ventas)
+            return len(contexto)
+
+        queries('inicial', 3)  # crea las filas de rollup del día
+        self.assertEqual(queries('chico', 3), queries('grande', 30))
+        self.assertEqual(sum(self._stock(i) for i in range(3)), 300 - 36)
+
+    def test_conserva_la_fecha_del_punto_de_venta(self):
+        ahora = timezone.now()
+        ventas = [
+            dict(self._venta('f-1', 2), fecha=(ahora - timedelta(days=3)).isoformat()),
+            self._venta('f-2', 1),
+            dict(self._venta('f-3', 1), fecha=(ahora + timedelta(hours=1)).isoformat()),
+            dict(self._venta('f-4', 1), fecha=(ahora - timedelta(days=60)).isoformat()),
+        ]
+        datos = self._sincronizar(ventas)
+        self.assertEqual([r['ok'] for r in datos['resultados']], [True, True, False, False])
+        self.assertIn('fecha', datos['resultados'][2]['error'])
+        self.assertIn('fecha', datos['resultados'][3]['error'])
+        self.assertEqual(self._stock(), 97)
+
+        atrasada = Venta.objects.get(clave_idempotencia='f-1')
+        self.assertEqual(atrasada.fecha, ahora - timedelta(days=3))
+        self.assertEqual(
+            sorted(VentaDiariaSucursal.objects.values_list('fecha', 'tickets', 'unidades')),
+            [(timezone.localdate(ahora - timedelta(days=3)), 1, 2), (timezone.localdate(), 1, 1)],
+        )
+
+
+class RegistroVentaTests(TestCase):
+    """La venta se inserta ya validada y con queries fijas sin importar las líneas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user(username='vendedor', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(20)
+        ]
+        # La mitad con un único lote, la otra mitad con dos
+        for i, producto in enumerate(cls.productos):
+            for j in range(1 + i % 2):
+                Stock.objects.create(producto=producto, sub_ubicacion=cls.sub, cantidad=10, lote=f'L{i}-{j}')
+
+    def _items(self, cantidad_lineas, cantidad=1):
+        return [
+            {'producto': producto, 'sub_ubicacion_origen': self.sub, 'cantidad': cantidad,
+             'precio_venta_momento': Decimal('2.50')}
+            for producto in self.productos[:cantidad_lineas]
+        ]
+
+    def _queries(self, items):
+        with CaptureQueriesContext(connection) as contexto:
+            venta = Venta.registrar(items, vendedor=self.vendedor, sucursal=self.sucursal)
+        return venta, contexto.captured_queries
+
+    def test_queries_fijas_y_total_en_el_insert(self):
+        self._queries(self._items(20))  # crea las filas de rollup y de resumen
+        venta, diez = self._queries(self._items(10))
+        _, veinte = self._queries(self._items(20))
+        self.assertEqual(len(diez), len(veinte))
+        self.assertEqual(venta.total, Decimal('25.00'))
+        self.assertEqual(Venta.objects.get(id=venta.id).total, Decimal('25.00'))
+        self.assertFalse([q for q in diez if q['sql'].startswith('UPDATE "sales_venta"')])
+
+    def test_venta_rechazada_no_inserta(self):
+        items = self._items(5)
+        items[-1]['cantidad'] = 1000
+        with CaptureQueriesContext(connection) as contexto:
+            with self.assertRaises(StockInsuficiente):
+                Venta.registrar(items, vendedor=self.vendedor, sucursal=self.sucursal)
+        self.assertFalse([q for q in contexto.captured_queries if q['sql'].startswith('INSERT INTO "sales_venta"')])
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(Stock.objects.get(producto=self.productos[0]).cantidad, 10)
+
+
+class RollupVentasTests(TestCase):
+    """El rollup incremental y el reconstruido desde el historial coinciden."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user(username='cajero', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.sub = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(2)
+        ]
+        for producto in cls.productos:
+            Stock.objects.create(producto=producto, sub_ubicacion=cls.sub, cantidad=50)
+
+    def _filas(self):
+        return (
+            sorted(VentaDiaria.objects.values_list('sucursal_id', 'producto_id', 'fecha', 'unidades', 'total', 'tickets')),
+            sorted(VentaDiariaSucursal.objects.values_list('sucursal_id', 'fecha', 'tickets', 'unidades', 'total')),
+        )
+
+    def test_incremental_igual_a_reconstruido(self):
+        for cantidades in ((1, 2), (3, 0), (0, 4)):
+            items = [
+                {'producto': producto, 'sub_ubicacion_origen': self.sub, 'cantidad': cantidad,
+                 'precio_venta_momento': Decimal('1.25')}
+                for producto, cantidad in zip(self.productos, cantidades) if cantidad
+            ]
+            Venta.registrar(items, vendedor=self.vendedor, sucursal=self.sucursal)
+        # Una venta sin líneas no suma tickets en ninguno de los dos caminos
+        Venta.objects.create(vendedor=self.vendedor, sucursal=self.sucursal, total=0)
+
+        incremental = self._filas()
+        self.assertEqual(incremental[1][0][2], 3)
+        rollup.reconstruir()
+        self.assertEqual(self._filas(), incremental)
+
+
+class MigracionRollupsTests(TransactionTestCase):
+    """El backfill de 0002 deja los mismos rollups que rollup.reconstruir()."""
+
+    antes = [('sales', '0001_initial')]
+    despues = [('sales', '0002_ventadiaria_ventadiariasucursal')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def _migrar(self, destino):
+        return MigrationExecutor(connection).migrate(destino).apps
+
+    def _filas(self, apps):
+        VentaDiaria = apps.get_model('sales', 'VentaDiaria')
+        VentaDiariaSucursal = apps.get_model('sales', 'VentaDiariaSucursal')
+        return (
+            sorted(VentaDiaria.objects.values_list('sucursal_id', 'producto_id', 'fecha', 'unidades', 'total', 'tickets')),
+            sorted(VentaDiariaSucursal.objects.values_list('sucursal_id', 'fecha', 'tickets', 'unidades', 'total')),
+        )
+
+    def test_backfill_igual_a_reconstruido(self):
+        apps = self._migrar(self.antes)
+        Venta = apps.get_model('sales', 'Venta')
+        VentaItem = apps.get_model('sales', 'VentaItem')
+        sucursal = apps.get_model('locations', 'Ubicacion').objects.create(nombre='Sucursal', tipo='sucursal')
+        sub = apps.get_model('locations', 'SubUbicacion').objects.create(
+            ubicacion=sucursal, nombre='Góndola', tipo='ambiente'
+        )
+        categoria = apps.get_model('products', 'Categoria').objects.create(nombre='Almacén')
+        productos = [
+            apps.get_model('products', 'Producto').objects.create(
+                nombre=f'Producto {i}', categoria=categoria, tipo_conservacion='ambiente',
+                precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+            )
+            for i in range(2)
+        ]
+        vendedor = apps.get_model('users', 'User').objects.create(username='cajero', password='x', rol='admin')
+        for cantidades in ((1, 2), (3, 0), (0, 0)):
+            venta = Venta.objects.create(vendedor=vendedor, sucursal=sucursal,
+                                         total=sum(cantidades) * Decimal('1.25'))
+            for producto, cantidad in zip(productos, cantidades):
+                if cantidad:
+                    VentaItem.objects.create(venta=venta, producto=producto, sub_ubicacion_origen=sub,
+                                             cantidad=cantidad, precio_venta_momento=Decimal('1.25'))
+
+        apps = self._migrar(self.despues)
+        migrado = self._filas(apps)
+        # La venta sin líneas no suma un ticket
+        self.assertEqual([fila[2] for fila in migrado[1]], [2])
+
+        self._migrar(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        rollup.reconstruir()
+        self.assertEqual(self._filas(django_apps), migrado)
+
+
+class DashboardEngineTests(TestCase):
+    """El dashboard hace las mismas queries sin importar cuántas sucursales, lotes o ventas haya."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.categoria = Categoria.objects.create(nombre='Lácteos')
+        cls.producto = Producto.objects.create(
+            nombre='Yogur', categoria=cls.categoria, tipo_conservacion='ambiente', dias_caducidad=10,
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+
+    def _sucursal(self, numero):
+        sucursal = Ubicacion.objects.create(nombre=f'Sucursal {numero}', tipo='sucursal')
+        sub = SubUbicacion.objects.create(ubicacion=sucursal, nombre='Heladera', tipo='ambiente')
+        for lote in range(3):
+            Stock.objects.create(producto=self.producto, sub_ubicacion=sub, cantidad=4, lote=f'S{numero}-{lote}',
+                                 fecha_ingreso=date.today())
+        Venta.registrar(
+            [{'producto': self.producto, 'sub_ubicacion_origen': sub, 'cantidad': 1,
+              'precio_venta_momento': Decimal('100')}],
+            vendedor=self.admin, sucursal=sucursal,
+        )
+        Pedido.objects.create(creado_por=self.admin, destino=sucursal, estado='pendiente')
+
+    def _queries(self):
+        with CaptureQueriesContext(connection) as contexto:
+            datos = DashboardEngine(stock_minimo=100).calcular()
+        return len(contexto), datos
+
+    def test_queries_fijas(self):
+        self._sucursal(0)
+        resumen.reconstruir()
+        una, _ = self._queries()
+        for numero in range(1, 5):
+            self._sucursal(numero)
+        resumen.reconstruir()
+        cinco, datos = self._queries()
+        self.assertEqual(una, cinco)
+        self.assertEqual(datos['kpis']['low_stock_count'], 1)
+        self.assertEqual(datos['kpis']['cantidad_ventas'], 5)
+        self.assertEqual(len(datos['comparativa_sucursales']), 5)
+
+    def test_stock_minimo_invalido(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.admin)
+        for valor in ('abc', '-1', '2.5'):
+            respuesta = cliente.get('/api/sales/dashboard/', {'stock_minimo': valor})
+            self.assertEqual(respuesta.status_code, 400, valor)
+            self.assertIn('stock_minimo', respuesta.data)
+
+
+class ReposicionTests(TestCase):
+    """Lo que ya está en camino hacia la sucursal se descuenta de la sugerencia."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin_test', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        sub = SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre='Góndola', tipo='ambiente')
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.producto = Producto.objects.create(
+            nombre='Arroz', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        Stock.objects.create(producto=cls.producto, sub_ubicacion=sub, cantidad=5)
+        cls.hoy = date(2026, 10, 18)
+        # 56 unidades en 28 días: 2 por día
+        VentaDiaria.objects.bulk_create([
+            VentaDiaria(sucursal=cls.sucursal, producto=cls.producto, fecha=date(2026, 10, dia),
+                        unidades=4, total=Decimal('400'), tickets=1)
+            for dia in range(5, 19)
+        ])
+
+    def test_en_camino_evita_una_segunda_sugerencia(self):
+        sugerencias = reposicion.calcular_sugerencias(hoy=self.hoy)
+        self.assertEqual(len(sugerencias), 1)
+        self.assertEqual(
+            (sugerencias[0]['velocidad_diaria'], sugerencias[0]['stock'], sugerencias[0]['en_camino'],
+             sugerencias[0]['sugerido']),
+            (2.0, 5.0, 0, 23),
+        )
+
+        pedidos = reposicion.generar_pedidos(sugerencias, self.admin)
+        self.assertEqual([pedido.estado for pedido in pedidos], ['borrador'])
+        self.assertEqual(list(pedidos[0].items.values_list('cantidad', flat=True)), [23])
+        self.assertEqual(reposicion.calcular_sugerencias(hoy=self.hoy), [])
+
+        # Un pedido recibido ya no está en camino: vuelve a sugerirse
+        Pedido.objects.filter(id=pedidos[0].id).update(estado='recibido')
+        self.assertEqual(len(reposicion.calcular_sugerencias(hoy=self.hoy)), 1)
+
+
+class ResumenStockVentasTests(TestCase):
+    """Las ventas mantienen el resumen por delta y coincide siempre con el recálculo desde Stock."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user(username='vendedor', password='x', rol='admin')
+        cls.sucursal = Ubicacion.objects.create(nombre='Sucursal', tipo='sucursal')
+        cls.subs = [
+            SubUbicacion.objects.create(ubicacion=cls.sucursal, nombre=nombre, tipo='ambiente')
+            for nombre in ('Góndola', 'Heladera')
+        ]
+        categoria = Categoria.objects.create(nombre='Almacén')
+        cls.fideos = Producto.objects.create(
+            nombre='Fideos', categoria=categoria, tipo_conservacion='ambiente',
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        cls.leche = Producto.objects.create(
+            nombre='Leche', categoria=categoria, tipo_conservacion='ambiente', dias_caducidad=10,
+            precio_venta=Decimal('100'), costo_compra=Decimal('60'),
+        )
+        hoy = date.today()
+        Stock.objects.create(producto=cls.fideos, sub_ubicacion=cls.subs[0], cantidad=20)
+        for dias, cantidad in ((4, 3), (2, 5), (0, 8)):
+            Stock.objects.create(producto=cls.leche, sub_ubicacion=cls.subs[1], cantidad=cantidad,
+                                 lote=f'L{dias}', fecha_ingreso=hoy - timedelta(days=dias))
+        resumen.reconstruir()
+
+    def _vender(self, *lineas):
+        return Venta.registrar(
+            [{'producto': producto, 'sub_ubicacion_origen': sub, 'cantidad': cantidad,
+              'precio_venta_momento': Decimal('1.00')} for producto, sub, cantidad in lineas],
+            vendedor=self.vendedor, sucursal=self.sucursal,
+        )
+
+    def test_ventas_intercaladas(self):
+        fideos, leche = (self.fideos, self.subs[0]), (self.leche, self.subs[1])
+        # Lotes parciales, agotados (incluido el de vencimiento más próximo) y pares mezclados
+        pasos = [((*fideos, 2),), ((*leche, 1),), ((*fideos, 3), (*leche, 2)), ((*leche, 4),),
+                 ((*fideos, 1), (*leche, 5)), ((*fideos, 14),), ((*leche, 2),)]
+        for lineas in pasos:
+            self._vender(*lineas)
+            self.assertFalse(any(resumen.verificar().values()), lineas)
+
+        # Un ingreso sobre un par agotado vuelve a sumar lote y vencimiento
+        lote = Stock.objects.create(producto=self.fideos, sub_ubicacion=self.subs[0], cantidad=6, lote='R1',
+                                    fecha_ingreso=date.today())
+        ledger.registrar([ledger.movimiento(lote, 6, 'ajuste')])
+        self.assertFalse(any(resumen.verificar().values()))
+        fila = StockResumen.objects.get(producto=self.leche)
+        self.assertEqual((fila.cantidad, fila.lotes), (Decimal('2.000'), 1))
+
+    def test_venta_no_bloquea_ni_recalcula_el_resumen(self):
+        with CaptureQueriesContext(connection) as contexto:
+            self._vender((self.fideos, self.subs[0], 1), (self.leche, self.subs[1], 1))
+        consultas = [q['sql'] for q in contexto.captured_queries if 'inventory_stockresumen' in q['sql']]
+        self.assertEqual(len(consultas), 1)
+        self.assertTrue(consultas[0].startswith('UPDATE'))
+        self.assertFalse(any(resumen.verificar().values()))
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ReporteEconomicoView, VentaViewSet, DashboardView
+from .views import CacheReportesView, ReporteEconomicoView, ReposicionView, VentaViewSet, DashboardView
 
 router = DefaultRouter()
 router.register(r'ventas', VentaViewSet)
@@ -9,4 +9,6 @@ urlpatterns = [
     path('', include(router.urls)),
     path('reporte-economico/', ReporteEconomicoView.as_view(), name='reporte-economico'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('dashboard/cache/', CacheReportesView.as_view(), name='dashboard-cache'),
+    path('reposicion/', ReposicionView.as_view(), name='reposicion'),
 ]
\ No newline at end of file
@@ -175,4 +175,22 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Procesos del pool que renderiza remitos en el comando exportar_remitos (tope
+# también para --procesos). El endpoint HTTP renderiza en su propio proceso.
+REMITOS_MAX_PROCESOS = int(os.getenv('REMITOS_MAX_PROCESOS', '2'))
+
 AUTH_USER_MODEL = 'users.User'
+
+# Cache (resultados del dashboard y del reporte económico). Por defecto el de
+# Django (LocMem): es por proceso, así que con varios procesos cada uno sólo ve
+# sus propias invalidaciones y puede servir reportes viejos hasta el TTL. En
+# producción con más de un proceso configurar un backend compartido con
+# incr/add atómicos (Redis o Memcached); FileBasedCache y DatabaseCache son
+# compartidos pero no atómicos y pueden perder incrementos de la versión.
+if os.getenv('CACHE_BACKEND'):
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ['CACHE_BACKEND'],
+            'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        }
+    }